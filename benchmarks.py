@@ -0,0 +1,1311 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+benchmarks.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+
+Micro-benchmarks for the corpus reader and topic analyzer. Run one with:
+
+	python benchmarks.py cleaner [saved_page.html ...]
+	python benchmarks.py clean_workers [max_workers]
+	python benchmarks.py fetcher [pages]
+	python benchmarks.py topic_index [tokens]
+	python benchmarks.py count_matrix [tokens]
+	python benchmarks.py top_k [tokens]
+	python benchmarks.py snapshot [tokens]
+	python benchmarks.py count_workers [max_workers]
+	python benchmarks.py token_filter
+	python benchmarks.py fileids [links]
+	python benchmarks.py root_parser [saved_root_page.html ...]
+	python benchmarks.py batch_queries [tokens]
+	python benchmarks.py query_cache [tokens]
+	python benchmarks.py count_storage [tokens] [topics]
+	python benchmarks.py suite [--output results.json] [--compare baseline.json]
+
+The fetcher benchmark also checks the fetch backends against a stand-in
+Wikipedia server on localhost and exits with status 1 if a check fails.
+
+The suite runs offline: it builds a reader from saved pages served by a
+FixtureFetcher (by default pages made from the corpora stored in this folder),
+times the reader and every WikipediaTopicAnalyzer query, and can save the
+results as JSON and compare them with an earlier run's.
+"""
+
+import os
+import re
+import sys
+import glob
+import time
+import random
+import string
+import shutil
+import json
+import zlib
+import argparse
+import platform
+import tempfile
+import socket
+import threading
+import multiprocessing
+import BaseHTTPServer
+import SocketServer
+import nltk
+from collections import defaultdict, OrderedDict
+from operator import itemgetter
+from wikipedia_html_cleaner import clean_article_html, clean_fetched_page, root_page_sections
+from wikipedia_topic_analyzer import WikipediaTopicAnalyzer
+from wikipedia_token_filter import TokenFilter
+from wikipedia_corpus_reader import WikipediaCorpusReader, count_article_text
+from wikipedia_fetcher import FixtureFetcher, HTTPFetcher, ConcurrentFetcher
+from nltk.tokenize import WordPunctTokenizer
+
+CORPUS_DIRECTORIES = ['Google', 'Progressivism', 'Hitachi']
+PROJECT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))	# Before any benchmark changes directory
+
+def printHeader(text):
+	print "#" * 100
+	print text + '   ' + ('#' * (97-len(text)))
+	print "#" * 100 + "\n"
+
+def best_time(function, *args, **kwargs):
+	"""
+	Runs the function several times and returns the fastest wall-clock time.
+
+	:param function: the callable to time
+	:type function: function
+
+	:return: the fastest time in seconds
+	:rtype: float
+	"""
+	repeat = kwargs.pop('repeat', 3)
+	times = []
+	for i in range(repeat):
+		start = time.time()
+		function(*args, **kwargs)
+		times.append(time.time() - start)
+	return min(times)
+
+def stored_articles():
+	"""
+	Returns (topic, text) pairs for every article already saved in the
+	corpus directories that ship with the project.
+
+	:return: list of (topic, text) pairs
+	:rtype: list of tuples (str, str)
+	"""
+	articles = []
+	for directory in CORPUS_DIRECTORIES:
+		for path in sorted(glob.glob(os.path.join(PROJECT_DIRECTORY, directory, '*.txt'))):
+			articles.append((os.path.basename(path)[:-4], open(path).read()))
+	return articles
+
+def synthetic_article_html(title, text, rng):
+	"""
+	Wraps plain text in markup shaped like a saved Wikipedia article: a header,
+	tagline, table of contents, linked words, citations, scripts, comments and
+	the category footer.
+
+	:param title: the article's topic
+	:type title: str
+
+	:param text: the article's plain text
+	:type text: str
+
+	:param rng: random number generator that decides where markup goes
+	:type rng: random.Random
+
+	:return: HTML source for the article
+	:rtype: str
+	"""
+	parts = ['<html><head><title>%s - Wikipedia, the free encyclopedia</title>' % title,
+			 '<script type="text/javascript">var wgPageName = "%s";</script>' % title,
+			 '<style type="text/css">.mw-headline { font-weight: bold; }</style></head><body>',
+			 '<!-- bodyContent -->\n<!-- tagline --><div id="siteSub">From Wikipedia, the free encyclopedia</div><!-- /tagline -->\n',
+			 '<!-- subtitle --><div id="contentSub"></div><!-- /subtitle --><!-- jumpto --><div id="jump-to-nav">Jump to: navigation, search</div><!-- /jumpto -->\n',
+			 '<table id="toc" class="toc"><tr><td><div id="toctitle"><h2>Contents</h2></div></td></tr></table>\n<p>']
+	for index, word in enumerate(text.split()):
+		roll = rng.random()
+		if roll < 0.08:
+			parts.append('<a href="/wiki/%s" title="%s">%s</a> ' % (word, word, word))
+		elif roll < 0.09:
+			parts.append('%s<sup id="cite_ref-%d" class="reference"><a href="#cite_note-%d">[%d]</a></sup> ' % (word, index, index, index % 50))
+		elif roll < 0.095:
+			parts.append('%s&#160;<!-- editor note -->' % word)
+		elif roll < 0.1:
+			parts.append('</p>\n<h2><span class="editsection">[<a href="/w/index.php?action=edit">edit</a>]</span> <span class="mw-headline" id="S%d">%s</span></h2>\n<p>' % (index, word))
+		else:
+			parts.append(word + ' ')
+	parts.append('</p>\n<!-- /bodyContent --><div id="catlinks"><a href="/wiki/Special:Categories" title="Special:Categories">Categories</a>')
+	parts.append(': <a href="/wiki/Category:%s">%s</a></div></body></html>' % (title, title))
+	return ''.join(parts)
+
+def saved_pages(paths):
+	"""
+	Returns the HTML of the saved pages given, or synthetic pages built from
+	the stored corpora when no paths are given.
+
+	:param paths: paths to saved Wikipedia HTML pages
+	:type paths: list of str
+
+	:return: list of HTML sources
+	:rtype: list of str
+	"""
+	if paths:
+		return [open(path).read() for path in paths]
+	rng = random.Random(131)
+	return [synthetic_article_html(title, text, rng) for title, text in stored_articles()]
+
+def legacy_clean_html_and_wikipedia_content(html):
+	"""
+	The original multi-pass cleaner, kept as the baseline for comparison.
+	"""
+	body = re.search(r'<!-- bodyContent -->(.*)<!-- /bodyContent -->', html, re.DOTALL).group(1)
+	body = re.sub(r'<!-- tagline -->.*?<!-- /tagline -->', r'', body, re.DOTALL)
+	body = re.sub(r'<!-- subtitle -->.*?<!-- /jumpto -->', r'', body, re.DOTALL)
+	body = re.sub(r'<h2>Contents</h2>', r'', body, re.DOTALL)
+	cleaned_body = nltk.clean_html(body)
+	cleaned_body = ' '.join(cleaned_body.split()[10:])
+	cleaned_body = re.sub(r'http.*? ', r'', cleaned_body, re.DOTALL)
+	cleaned_body = re.sub(r'&#\d{3};|&\w+?;', r'', cleaned_body)
+	cleaned_body = ''.join([x for x in cleaned_body if ord(x) < 128])
+	cleaned_body = re.sub(r'\[ (\d+|\w+) \]', r'', cleaned_body)
+	cleaned_body = re.sub(r'[\'()^"#:\\;]', r' ', cleaned_body)
+	cleaned_body = re.sub(r' \.| \. ', r' ', cleaned_body)
+	cleaned_body = re.sub(r'.\. ', r' ', cleaned_body)
+	cleaned_body = re.sub(r' ,| , |, ', r' ', cleaned_body)
+	cleaned_body = re.sub(r' /| / |/ ', r' ', cleaned_body)
+	cleaned_body = re.sub(r'\s{2,}', r' ', cleaned_body)
+	cleaned_body = re.sub(r'Wikimedia Commons.*?pages', r'', cleaned_body)
+	return cleaned_body
+
+def bench_cleaner(paths=None):
+	"""
+	Compares the throughput of the single-pass cleaner against the original
+	multi-pass cleaner, in megabytes of HTML per second.
+
+	:param paths: paths to saved Wikipedia HTML pages (synthetic pages if empty)
+	:type paths: list of str
+	"""
+	pages = saved_pages(paths)
+	megabytes = sum(len(page) for page in pages) / (1024.0 * 1024.0)
+	mismatches = sum(1 for page in pages if clean_article_html(page) != legacy_clean_html_and_wikipedia_content(page))
+
+	legacy = best_time(lambda: [legacy_clean_html_and_wikipedia_content(page) for page in pages])
+	single_pass = best_time(lambda: [clean_article_html(page) for page in pages])
+
+	printHeader("HTML cleaner: %d pages, %.2f MB" % (len(pages), megabytes))
+	print "%-30s %10.2f MB/s" % ("multi-pass (original)", megabytes / legacy)
+	print "%-30s %10.2f MB/s" % ("single-pass", megabytes / single_pass)
+	print "%-30s %10.2fx" % ("speedup", legacy / single_pass)
+	print "%-30s %10d" % ("pages with different output", mismatches)
+	print ''
+
+def bench_clean_workers(args=None):
+	"""
+	Measures how cleaning throughput scales with the number of cleaning
+	processes used by WikipediaCorpusReader(clean_workers=n).
+	
+	:param args: optionally, the largest number of workers to try
+	:type args: list of str
+	"""
+	max_workers = int(args[0]) if args else multiprocessing.cpu_count()
+	fetched_pages = [('http://en.wikipedia.org/wiki/Page_%d' % i, page) for i, page in enumerate(saved_pages(None) * 2)]
+	megabytes = sum(len(page) for url, page in fetched_pages) / (1024.0 * 1024.0)
+	
+	printHeader("Cleaning pipeline: %d pages, %.2f MB" % (len(fetched_pages), megabytes))
+	inline = best_time(lambda: [clean_fetched_page(page) for page in fetched_pages])
+	print "%-30s %10.2f MB/s" % ("inline", megabytes / inline)
+	workers = 2
+	while workers <= max_workers:
+		pool = multiprocessing.Pool(workers)
+		elapsed = best_time(lambda: list(pool.imap(clean_fetched_page, fetched_pages)))
+		pool.terminate()
+		pool.join()
+		print "%-30s %10.2f MB/s" % ("%d processes" % workers, megabytes / elapsed)
+		workers *= 2
+	print ''
+
+class _StandInWikipedia(BaseHTTPServer.BaseHTTPRequestHandler):
+	"""
+	Answers requests the way Wikipedia would, from memory: /wiki/Page_<n> after a 
+	short delay that varies from page to page, a 404 page for /wiki/Missing, a 
+	500 for /wiki/Broken, a 500 for only the first request for /wiki/Flaky, a 
+	redirect from /wiki/Moved to /wiki/Page_0, a gzip-encoded /wiki/Compressed 
+	when the client accepts gzip and a /wiki/Unchanged with an ETag, answered with 
+	304 Not Modified when the request carries that ETag.
+	"""
+	ETAG = '"unchanged-v1"'
+
+	protocol_version = 'HTTP/1.1'							# Keeps connections alive
+
+	def do_GET(self):
+		server = self.server
+		with server.lock:
+			server.requests.append((self.path, time.time()))
+			server.in_flight += 1
+			server.most_in_flight = max(server.most_in_flight, server.in_flight)
+			first_request = self.path not in server.seen
+			server.seen.add(self.path)
+		if self.path.startswith('/wiki/Page_'):
+			time.sleep(server.delay * (1 + int(self.path[len('/wiki/Page_'):]) % 4))	# Later pages may finish first
+			response = (200, 'Page ' + self.path[len('/wiki/Page_'):], {})
+		elif self.path == '/wiki/Missing':
+			response = (404, 'Wikipedia does not have an article with this exact name', {})
+		elif self.path == '/wiki/Flaky' and not first_request:
+			response = (200, 'Flaky page', {})
+		elif self.path == '/wiki/Moved':
+			response = (301, '', {'Location': '/wiki/Page_0'})
+		elif self.path == '/wiki/Compressed' and 'gzip' in self.headers.getheader('accept-encoding', ''):
+			compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+			response = (200, compressor.compress('Compressed page') + compressor.flush(), {'Content-Encoding': 'gzip'})
+		elif self.path == '/wiki/Compressed':
+			response = (200, 'Compressed page', {})
+		elif self.path == '/wiki/Unchanged' and self.headers.getheader('if-none-match') == self.ETAG:
+			response = (304, '', {'ETag': self.ETAG})
+		elif self.path == '/wiki/Unchanged':
+			response = (200, 'Unchanged page', {'ETag': self.ETAG, 'Last-Modified': 'Mon, 07 Jan 2013 10:00:00 GMT'})
+		else:
+			response = (500, 'Internal error', {})
+		status, body, headers = response
+		with server.lock:
+			server.in_flight -= 1							# Before answering, or the next request could overlap
+			server.responses.append((self.path, status, headers.get('Content-Encoding')))
+		self.send_response(status)
+		for header, value in headers.iteritems():
+			self.send_header(header, value)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+class _StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	"""
+	A stand-in Wikipedia server on a free port of localhost, answering on its own
+	threads and recording every request it gets, every response it sends and how 
+	many connections it accepted.
+	"""
+	daemon_threads = True
+
+	def __init__(self, delay=0.01):
+		BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), _StandInWikipedia)
+		self.delay = delay
+		self.lock = threading.Lock()
+		self.handler_threads = []
+		self.reset()
+
+	def process_request(self, request, client_address):
+		thread = threading.Thread(target=self.process_request_thread, args=(request, client_address))
+		thread.daemon = True
+		with self.lock:
+			self.connections += 1
+		self.handler_threads.append(thread)
+		thread.start()
+
+	def close(self):
+		"""
+		Stops the server, waiting for connections the clients closed to be let go.
+		"""
+		self.shutdown()
+		self.server_close()
+		for thread in self.handler_threads:
+			thread.join(1.0)
+
+	def reset(self):
+		"""
+		Forgets the requests recorded so far.
+		"""
+		self.requests = []									# (path, time received)
+		self.responses = []									# (path, status, content encoding)
+		self.connections = 0
+		self.seen = set()
+		self.in_flight = 0
+		self.most_in_flight = 0
+
+	def base_url(self):
+		return 'http://127.0.0.1:%d' % self.server_address[1]
+
+def unused_port():
+	"""
+	Returns a port of localhost that nothing is listening on.
+
+	:rtype: int
+	"""
+	probe = socket.socket()
+	probe.bind(('127.0.0.1', 0))
+	port = probe.getsockname()[1]
+	probe.close()
+	return port
+
+def bench_fetcher(args=None):
+	"""
+	Checks HTTPFetcher and ConcurrentFetcher against a stand-in Wikipedia server
+	on localhost, reached through base_url: results come back in the order the
+	URLs were given, no more downloads are in flight than there are workers, 
+	each host gets no more requests per second than the rate limit, missing, 
+	failing, flaky and redirected pages and unreachable servers are handled, gzip 
+	responses are decoded, a page revalidated with its ETag is reused on a 304 and 
+	one thread's requests share one kept-alive connection. Also times downloading 
+	the pages one at a time and concurrently. Exits with status 1 if a check fails.
+
+	:param args: optionally, the number of pages to download (default 40)
+	:type args: list of str
+	"""
+	pages = int(args[0]) if args else 40
+	server = _StandInServer()
+	server_thread = threading.Thread(target=server.serve_forever)
+	server_thread.daemon = True
+	server_thread.start()
+	checks = []
+	def check(name, passed, detail=''):
+		checks.append((name, passed, detail))
+	page_url = lambda title, host='en': 'http://%s.wikipedia.org/wiki/%s' % (host, title)
+	try:
+		fetcher = HTTPFetcher(base_url=server.base_url(), retries=1, backoff=0.01)
+		urls = [page_url('Page_%d' % page) for page in range(pages)]
+		expected = [(url, 'Page %d' % page) for page, url in enumerate(urls)]
+		sequential = best_time(lambda: [fetcher.fetch(url) for url in urls], repeat=1)
+		server.reset()
+		started = time.time()
+		results = list(ConcurrentFetcher(fetcher.fetch, workers=4).fetch_all(urls))
+		concurrent = time.time() - started
+		check('fetch_all: results in the order given', results == expected)
+		check('fetch_all: at most 4 downloads in flight', 1 < server.most_in_flight <= 4,
+			  '%d at once' % server.most_in_flight)
+		server.reset()
+		results = list(ConcurrentFetcher(fetcher.fetch, workers=4).fetch_ahead(iter(urls), read_ahead=2))
+		check('fetch_ahead: results in the order given', results == expected)
+		check('fetch_ahead: at most 2 downloads ahead', server.most_in_flight <= 2, '%d at once' % server.most_in_flight)
+
+		# Two hosts at 20 requests per second each: each host's requests are 50ms apart,
+		# but the two hosts don't wait for each other
+		rate, per_host = 20.0, 10
+		server.reset()
+		limited_urls = [page_url('Page_%d' % (host_number * 100 + page), host) 
+						for page in range(per_host) for host_number, host in enumerate(('en', 'de'))]
+		started = time.time()
+		list(ConcurrentFetcher(fetcher.fetch, workers=8, rate_limit=rate).fetch_all(limited_urls))
+		limited = time.time() - started
+		for host_number, host in enumerate(('en', 'de')):
+			times = [received for path, received in server.requests if (int(path.rsplit('_', 1)[1]) >= 100) == host_number]
+			too_early = [index for index, received in enumerate(times) 
+						 if received - times[0] < index / rate - 0.02]		# Allows for timer resolution
+			check('rate limit: %s.wikipedia.org at most %d requests/s' % (host, rate), len(times) == per_host and not too_early,
+				  'requests %s came early' % too_early)
+		check('rate limit: hosts limited separately', limited < (2 * per_host - 1) / rate, '%.2fs' % limited)
+
+		# Failures
+		server.reset()
+		check('missing page: 404 page returned', fetcher.fetch(page_url('Missing')).startswith('Wikipedia does not have'))
+		check('server error: None after 1 retry', fetcher.fetch(page_url('Broken')) is None and 
+			  [path for path, received in server.requests].count('/wiki/Broken') == 2)
+		check('server error: retry succeeds', fetcher.fetch(page_url('Flaky')) == 'Flaky page')
+		check('redirect: followed', fetcher.fetch(page_url('Moved')) == 'Page 0')
+		unreachable = HTTPFetcher(base_url='http://127.0.0.1:%d' % unused_port(), retries=0, timeout=2)
+		check('unreachable server: None', unreachable.fetch(page_url('Page_1')) is None)
+		mixed = [page_url('Page_1'), page_url('Broken'), page_url('Page_2')]
+		check('fetch_all: failures stay in place', list(ConcurrentFetcher(fetcher.fetch, workers=3).fetch_all(mixed)) ==
+			  [(mixed[0], 'Page 1'), (mixed[1], None), (mixed[2], 'Page 2')])
+		def raising_fetch(url):
+			raise socket.error('connection reset')
+		check('fetch_all: errors raised by fetch become None', 
+			  list(ConcurrentFetcher(raising_fetch, workers=2).fetch_all(mixed)) == [(url, None) for url in mixed])
+
+		# Compression, revalidation and keep-alive, each with a fetcher of its own
+		server.reset()
+		check('gzip: response decoded', HTTPFetcher(base_url=server.base_url()).fetch(page_url('Compressed')) == 'Compressed page' 
+			  and server.responses == [('/wiki/Compressed', 200, 'gzip')], repr(server.responses))
+		server.reset()
+		check('gzip: not asked for when off', HTTPFetcher(base_url=server.base_url(), gzip=False).fetch(page_url('Compressed')) == 
+			  'Compressed page' and server.responses == [('/wiki/Compressed', 200, None)], repr(server.responses))
+		server.reset()
+		revalidating = HTTPFetcher(base_url=server.base_url())
+		bodies = [revalidating.fetch(page_url('Unchanged')) for i in range(2)]
+		check('ETag: 304 answered with the page fetched before', bodies == ['Unchanged page'] * 2 and 
+			  [status for path, status, encoding in server.responses] == [200, 304], repr(server.responses))
+		server.reset()
+		kept_alive = HTTPFetcher(base_url=server.base_url())
+		bodies = [kept_alive.fetch(page_url('Page_%d' % page)) for page in range(5)]
+		check('keep-alive: 5 requests over 1 connection', bodies == ['Page %d' % page for page in range(5)] and
+			  server.connections == 1, '%d connections' % server.connections)
+	finally:
+		fetcher = kept_alive = revalidating = None				# Closes their kept-alive connections
+		server.close()
+
+	printHeader("Fetcher: %d pages from a stand-in server at %s" % (pages, server.base_url()))
+	print "%-50s %10.2f pages/s" % ("one at a time", pages / sequential)
+	print "%-50s %10.2f pages/s" % ("4 workers", pages / concurrent)
+	print "%-50s %10.2f s" % ("2 hosts x %d pages at %d requests/s" % (per_host, rate), limited)
+	print ''
+	for name, passed, detail in checks:
+		print "%-50s %s" % (name, 'ok' if passed else 'FAILED ' + detail)
+	print ''
+	if not all(passed for name, passed, detail in checks):
+		sys.exit(1)
+
+def synthetic_tagged_words(tokens, topics=50, vocabulary=50000, seed=131):
+	"""
+	Returns a synthetic topic-tagged corpus: word frequencies follow a rough
+	Zipf distribution, and a third of each topic's words come from a range of
+	the vocabulary that is mostly its own.
+
+	:param tokens: the number of (word, topic) pairs to generate
+	:type tokens: int
+
+	:param topics: the number of topics
+	:type topics: int
+
+	:param vocabulary: the number of distinct words
+	:type vocabulary: int
+
+	:return: list of (word, topic) pairs
+	:rtype: list of tuples (str, str)
+	"""
+	rng = random.Random(seed)
+	words = [('Term%d' if i % 10 == 0 else 'word%d') % i for i in range(vocabulary)]
+	topic_names = ['Topic_%d' % i for i in range(topics)]
+	topic_range = vocabulary // topics
+	tagged_words = []
+	for i in xrange(tokens):
+		topic = rng.randrange(topics)
+		if rng.random() < 0.33:
+			word = words[topic * topic_range + int(rng.paretovariate(1.2)) % topic_range]
+		else:
+			word = words[int(rng.paretovariate(0.8)) % vocabulary]
+		tagged_words.append((word, topic_names[topic]))
+	return tagged_words
+
+def legacy_word_topic_count(tagged_words):
+	"""
+	Counts word -> topic -> occurrences the way the analyzer originally did,
+	as the input of the legacy queries below.
+	"""
+	word_topic_count = defaultdict(lambda: defaultdict(int))
+	for word, topic in tagged_words:
+		word_topic_count[word][topic] += 1
+	return word_topic_count
+
+def legacy_topics_containing_words(word_topic_count, words):
+	"""
+	The original WikipediaTopicAnalyzer.topics_containing_words, kept as the baseline for comparison.
+	"""
+	topics = []
+	for word in words:
+		if word in word_topic_count:
+			topics.extend(word_topic_count[word].keys())
+	topics = [topic for topic in topics if topics.count(topic) >= len(words)]
+	return sorted(set(topics))
+
+def legacy_common_words_between_topics(word_topic_count, topics):
+	"""
+	The original WikipediaTopicAnalyzer.common_words_between_topics, kept as the baseline for comparison.
+	"""
+	common_words = []
+	for word in word_topic_count:
+		if set(topics).issubset(set(word_topic_count[word])):
+			common_words.append(word)
+	return sorted(common_words)
+
+def legacy_most_frequent(word_topic_count, n=10, topics=None, terms=False):
+	"""
+	The original WikipediaTopicAnalyzer.most_frequent_words (and most_frequent_terms
+	if terms is set), which counts every word and sorts them all, kept as the
+	baseline for comparison.
+	"""
+	counts = []
+	for word in word_topic_count:
+		if terms and word[0] not in string.uppercase:
+			continue
+		occurrences = 0
+		for topic in word_topic_count[word]:
+			if topics is None or topic == topics or (not isinstance(topics, basestring) and topic in topics):
+				occurrences += word_topic_count[word][topic]
+		if not terms or occurrences > 2:
+			counts.append((word, occurrences))
+	return sorted(counts, key=itemgetter(1), reverse=True)[:n]
+
+def bench_topic_index(args=None):
+	"""
+	Compares word and topic intersection queries answered from the analyzer's
+	inverted index against the original scans, on a synthetic corpus.
+
+	:param args: optionally, the number of tokens in the corpus (default 1,000,000)
+	:type args: list of str
+	"""
+	tokens = int(args[0]) if args else 1000000
+	tagged_words = synthetic_tagged_words(tokens)
+	start = time.time()
+	analyzer = WikipediaTopicAnalyzer(tagged_words, query_cache_size=0)		# Time the index, not the cache
+	build = time.time() - start
+	word_topic_count = legacy_word_topic_count(tagged_words)
+
+	rng = random.Random(7)
+	vocabulary = sorted(word_topic_count)
+	common = [word for word in vocabulary if len(word_topic_count[word]) > 1]
+	word_queries = [rng.sample(common, rng.randint(2, 4)) for i in range(200)]
+	topic_queries = [rng.sample(analyzer.topics(), rng.randint(2, 3)) for i in range(20)]
+	mismatches = sum(1 for words in word_queries
+					 if analyzer.topics_containing_words(words) != legacy_topics_containing_words(word_topic_count, words))
+	mismatches += sum(1 for topics in topic_queries
+					  if analyzer.common_words_between_topics(topics) != legacy_common_words_between_topics(word_topic_count, topics))
+
+	legacy_words = best_time(lambda: [legacy_topics_containing_words(word_topic_count, words) for words in word_queries])
+	indexed_words = best_time(lambda: [analyzer.topics_containing_words(words) for words in word_queries])
+	legacy_topics = best_time(lambda: [legacy_common_words_between_topics(word_topic_count, topics) for topics in topic_queries], repeat=1)
+	indexed_topics = best_time(lambda: [analyzer.common_words_between_topics(topics) for topics in topic_queries])
+
+	printHeader("Topic index: %d tokens, %d words, %d topics" % (tokens, len(vocabulary), len(analyzer.topics())))
+	print "%-40s %10.2f s" % ("build analyzer", build)
+	print "%-40s %10.0f queries/s" % ("topics_containing_words (original)", len(word_queries) / legacy_words)
+	print "%-40s %10.0f queries/s" % ("topics_containing_words (indexed)", len(word_queries) / indexed_words)
+	print "%-40s %10.0f queries/s" % ("common_words_between_topics (original)", len(topic_queries) / legacy_topics)
+	print "%-40s %10.0f queries/s" % ("common_words_between_topics (indexed)", len(topic_queries) / indexed_topics)
+	print "%-40s %10d" % ("queries with different results", mismatches)
+	print ''
+
+def bench_count_matrix(args=None):
+	"""
+	Compares most_frequent_words and most_frequent_terms queries between the
+	analyzer's dictionary backend and its NumPy matrix backend, on a synthetic
+	corpus.
+
+	:param args: optionally, the number of tokens in the corpus (default 1,000,000)
+	:type args: list of str
+	"""
+	tokens = int(args[0]) if args else 1000000
+	tagged_words = synthetic_tagged_words(tokens)
+	analyzers = [('dict', WikipediaTopicAnalyzer(tagged_words, query_cache_size=0)),		# Time the backends,
+				 ('matrix', WikipediaTopicAnalyzer(tagged_words, backend='matrix', query_cache_size=0))]	# not the cache
+	topics = analyzers[0][1].topics()
+	queries = [('most_frequent_words, all topics', lambda a: a.most_frequent_words(10)),
+			   ('most_frequent_words, one topic', lambda a: [a.most_frequent_words(10, topics=topic) for topic in topics[:10]]),
+			   ('most_frequent_words, 10 topics', lambda a: a.most_frequent_words(10, topics=topics[:10])),
+			   ('most_frequent_terms, all topics', lambda a: a.most_frequent_terms(10)),
+			   ('most_frequent_terms, 10 topics', lambda a: a.most_frequent_terms(10, topics=topics[:10]))]
+
+	printHeader("Count matrix: %d tokens, %d topics" % (tokens, len(topics)))
+	for name, query in queries:
+		results = [query(analyzer) for backend, analyzer in analyzers]
+		times = ["%s %8.2f ms" % (backend, 1000 * best_time(query, analyzer)) for backend, analyzer in analyzers]
+		print "%-35s %s   %s" % (name, '   '.join(times), 'same' if results[0] == results[1] else 'DIFFERENT')
+	print ''
+
+def bench_top_k(args=None):
+	"""
+	Compares the analyzer's most_frequent_* queries, answered from precomputed
+	totals and per-topic rankings, against the original full scan and sort.
+
+	:param args: optionally, the number of tokens in the corpus (default 1,000,000)
+	:type args: list of str
+	"""
+	tokens = int(args[0]) if args else 1000000
+	tagged_words = synthetic_tagged_words(tokens)
+	analyzer = WikipediaTopicAnalyzer(tagged_words, query_cache_size=0)		# Time the rankings, not the cache
+	word_topic_count = legacy_word_topic_count(tagged_words)
+	topics = analyzer.topics()
+	queries = [('words, all topics',
+				lambda: analyzer.most_frequent_words(10),
+				lambda: legacy_most_frequent(word_topic_count, 10)),
+			   ('words, each topic',
+				lambda: [analyzer.most_frequent_words(10, topics=topic) for topic in topics],
+				lambda: [legacy_most_frequent(word_topic_count, 10, topic) for topic in topics]),
+			   ('words, 10 topics',
+				lambda: analyzer.most_frequent_words(10, topics=topics[:10]),
+				lambda: legacy_most_frequent(word_topic_count, 10, topics[:10])),
+			   ('terms, all topics',
+				lambda: analyzer.most_frequent_terms(10),
+				lambda: legacy_most_frequent(word_topic_count, 10, terms=True)),
+			   ('terms, each topic',
+				lambda: analyzer.most_frequent_terms_by_topic(10),
+				lambda: dict((topic, legacy_most_frequent(word_topic_count, 10, topic, terms=True)) for topic in topics))]
+
+	printHeader("Top-k queries: %d tokens, %d topics" % (tokens, len(topics)))
+	for name, query, legacy_query in queries:
+		same = 'same' if query() == legacy_query() else 'DIFFERENT'
+		legacy = best_time(legacy_query, repeat=1)
+		ranked = best_time(query)
+		print "%-25s original %9.2f ms   ranked %9.2f ms   %s" % (name, 1000 * legacy, 1000 * ranked, same)
+	print ''
+
+def bench_snapshot(args=None):
+	"""
+	Compares building an analyzer from tagged words against loading it from a
+	snapshot, and checks that merging snapshots of separate shards gives the
+	same counts as building one analyzer over all of them.
+
+	:param args: optionally, the number of tokens in the corpus (default 1,000,000)
+	:type args: list of str
+	"""
+	tokens = int(args[0]) if args else 1000000
+	tagged_words = synthetic_tagged_words(tokens)
+	directory = tempfile.mkdtemp()
+	path = os.path.join(directory, 'analyzer.snapshot')
+	shard_paths = [os.path.join(directory, 'shard%d.snapshot' % i) for i in range(4)]
+	try:
+		build = best_time(WikipediaTopicAnalyzer, tagged_words, repeat=1)
+		analyzer = WikipediaTopicAnalyzer(tagged_words)
+		save = best_time(analyzer.save, path)
+		load = best_time(WikipediaTopicAnalyzer.load, path)
+		shard_size = (tokens + len(shard_paths) - 1) // len(shard_paths)
+		for i, shard_path in enumerate(shard_paths):
+			WikipediaTopicAnalyzer(tagged_words[i * shard_size:(i + 1) * shard_size]).save(shard_path)
+		merge = lambda: reduce(WikipediaTopicAnalyzer.merge, [WikipediaTopicAnalyzer.load(shard_path) for shard_path in shard_paths])
+		merged = merge()
+		same = merged.most_frequent_words(100) == analyzer.most_frequent_words(100) and \
+			   merged.most_frequent_terms_by_topic(10) == analyzer.most_frequent_terms_by_topic(10)
+
+		printHeader("Analyzer snapshots: %d tokens, %d KB snapshot" % (tokens, os.path.getsize(path) // 1024))
+		print "%-35s %10.2f s" % ("build from tagged words", build)
+		print "%-35s %10.2f s" % ("save snapshot", save)
+		print "%-35s %10.2f s" % ("load snapshot", load)
+		print "%-35s %10.2f s   %s" % ("load and merge %d shards" % len(shard_paths), best_time(merge), 'same' if same else 'DIFFERENT')
+		print ''
+	finally:
+		for snapshot_path in [path] + shard_paths:
+			if os.path.exists(snapshot_path):
+				os.remove(snapshot_path)
+		os.rmdir(directory)
+
+def bench_count_workers(args=None):
+	"""
+	Measures how building an analyzer scales when articles are tokenized and
+	counted by worker processes, as in WikipediaTopicAnalyzer.from_corpus(reader, 
+	workers=n), compared with feeding it one (word, topic) pair at a time.
+
+	:param args: optionally, the largest number of workers to try
+	:type args: list of str
+	"""
+	max_workers = int(args[0]) if args else multiprocessing.cpu_count()
+	tokenizer = WordPunctTokenizer()
+	token_filter = TokenFilter()
+	articles = [('%s_%d' % (title, copy), text, tokenizer, token_filter)
+				for copy in range(4) for title, text in stored_articles()]
+	megabytes = sum(len(text) for title, text, tokenizer, word_filter in articles) / (1024.0 * 1024.0)
+	tagged_words = lambda: ((word, topic) for topic, text, tokenizer, word_filter in articles for word in tokenizer.tokenize(text))
+	reference = WikipediaTopicAnalyzer(tagged_words()).most_frequent_terms_by_topic(10)
+
+	printHeader("Counting articles: %d articles, %.2f MB" % (len(articles), megabytes))
+	elapsed = best_time(lambda: WikipediaTopicAnalyzer(tagged_words()), repeat=1)
+	print "%-30s %10.2f MB/s" % ("tagged words", megabytes / elapsed)
+	analyzer = WikipediaTopicAnalyzer()
+	elapsed = best_time(lambda: analyzer.add_topic_counts(count_article_text(article) for article in articles), repeat=1)
+	print "%-30s %10.2f MB/s" % ("counted per article", megabytes / elapsed)
+	workers = 2
+	while workers <= max_workers:
+		pool = multiprocessing.Pool(workers)
+		analyzer = WikipediaTopicAnalyzer()
+		elapsed = best_time(lambda: analyzer.add_topic_counts(pool.imap(count_article_text, articles)), repeat=1)
+		pool.terminate()
+		pool.join()
+		same = analyzer.most_frequent_terms_by_topic(10) == reference
+		print "%-30s %10.2f MB/s   %s" % ("%d processes" % workers, megabytes / elapsed, 'same' if same else 'DIFFERENT')
+		workers *= 2
+	print ''
+
+def legacy_filter_words(words):
+	"""
+	The original stopword and single character filter of WikipediaTopicAnalyzer.__init__,
+	kept as the baseline for comparison.
+	"""
+	excluded = set(nltk.corpus.stopwords.words('english')).union(set([",",".","/","-","?","=","[","]","+","/?","%","isbn"]))
+	return [word for word in words if word.lower() not in excluded and \
+			not re.match(r'^\d$', word) and not re.match(r'^\w$', word)]
+
+def bench_token_filter(args=None):
+	"""
+	Compares the throughput of TokenFilter, in tokens per second, against the
+	analyzer's original filter, on the tokens of the stored corpora.
+	"""
+	tokenizer = WordPunctTokenizer()
+	tokens = [token for title, text in stored_articles() for token in tokenizer.tokenize(text)]
+	shared_filter = TokenFilter()
+	same = shared_filter.filter(tokens) == legacy_filter_words(tokens)
+
+	printHeader("Token filter: %d tokens" % len(tokens))
+	rates = [("original", best_time(legacy_filter_words, tokens)),
+			 ("TokenFilter, new filter", best_time(lambda: TokenFilter().filter(tokens))),
+			 ("TokenFilter, shared filter", best_time(shared_filter.filter, tokens)),
+			 ("TokenFilter, one token at a time", best_time(lambda: [token for token in tokens if shared_filter(token)]))]
+	for name, elapsed in rates:
+		print "%-35s %12.0f tokens/s" % (name, len(tokens) / elapsed)
+	print "%-35s %12s" % ("same tokens kept", 'yes' if same else 'NO')
+	print ''
+
+def synthetic_root_html(titles, links_per_section=500):
+	"""
+	Builds a root page shaped like the ones WikipediaCorpusReader parses, with an
+	introduction and as many sections as it takes to hold a link to every title.
+
+	:param titles: the titles of the linked articles
+	:type titles: list of str
+
+	:param links_per_section: the number of links in each section
+	:type links_per_section: int
+
+	:return: HTML source for the page
+	:rtype: str
+	"""
+	parts = ['<html><!-- bodycontent --><!-- bodyContent --><p>Introduction</p><h2>Contents</h2>']
+	for start in range(0, len(titles), links_per_section):
+		parts.append('<h2><span class="mw-headline" id="S%d">Section %d</span></h2><p>' % (start, start // links_per_section))
+		parts.extend('<a href="/wiki/%s">%s</a> ' % (title, title.replace('_', ' ')) for title in titles[start:start + links_per_section])
+		parts.append('</p>')
+	parts.append('<h2></h2><!-- /bodyContent --><a href="/wiki/Special:Categories">Categories</a></html>')
+	return ''.join(parts)
+
+def synthetic_titles(count):
+	"""
+	Returns made-up article titles, Article_0, Article_1, etc.
+
+	:rtype: list of str
+	"""
+	return ['Article_%d' % i for i in range(count)]
+
+class SyntheticRootFetcher(object):
+	"""
+	Fetch backend that serves one root page and fails every other download.
+	"""
+	def __init__(self, html):
+		self._html = html
+
+	def fetch(self, url):
+		return self._html if url.endswith('/Synthetic_Root') else None
+
+def legacy_fileids(reader, invalid_fileids, sections=None):
+	"""
+	The original WikipediaCorpusReader.fileids(), which checked every fileid 
+	against a list of invalid fileids and sorted on every call, kept as the 
+	baseline for comparison.
+	"""
+	if sections is None:
+		return sorted([fileid for fileid in reader._fileids if fileid not in invalid_fileids])
+	elif isinstance(sections, basestring):
+		return sorted([fileid for fileid in reader._fileids_by_section[sections] if fileid not in invalid_fileids])
+	all_fileids_for_sections = []
+	for section in sections:
+		all_fileids_for_sections.extend([fileid for fileid in reader._fileids_by_section[section] if fileid not in invalid_fileids])
+	return sorted(all_fileids_for_sections)
+
+def bench_fileids(args=None):
+	"""
+	Compares the reader's fileid bookkeeping against the original list-based
+	version on a synthetic root page, with one in ten links invalid: listing 
+	fileids, checking links against the invalid fileids, and mapping requested 
+	fileids to URLs.
+
+	:param args: optionally, the number of links on the root page (default 50,000)
+	:type args: list of str
+	"""
+	links = int(args[0]) if args else 50000
+	directory = tempfile.mkdtemp()
+	working_directory = os.getcwd()
+	os.chdir(directory)												# The reader keeps its corpus in the current directory
+	try:
+		reader = WikipediaCorpusReader('synthetic root', fetch_backend=SyntheticRootFetcher(synthetic_root_html(synthetic_titles(links))),
+									   token_cache=False, article_cache=None)
+		all_fileids = sorted(reader._fileid_to_url)
+		invalid_list = all_fileids[::10]
+		for fileid in invalid_list:
+			reader._mark_invalid(fileid)
+		sections = sorted(reader.sections())
+		requested = all_fileids[::links // 1000 or 1]
+		same = reader.fileids() == legacy_fileids(reader, invalid_list) and \
+			   reader.fileids(sections) == legacy_fileids(reader, invalid_list, sections)
+
+		printHeader("Fileid bookkeeping: %d links in %d sections, %d invalid" % (len(all_fileids), len(sections), len(invalid_list)))
+		print "%-40s %12s %12s" % ("", "original", "sets")
+		rows = [("fileids()", 
+				 lambda: legacy_fileids(reader, invalid_list), 
+				 lambda: reader.fileids()),
+				("fileids(section), every section", 
+				 lambda: [legacy_fileids(reader, invalid_list, section) for section in sections],
+				 lambda: [reader.fileids(section) for section in sections]),
+				("fileids(all sections)", 
+				 lambda: legacy_fileids(reader, invalid_list, sections), 
+				 lambda: reader.fileids(sections)),
+				("invalid check on every link", 
+				 lambda: [fileid for fileid in all_fileids if fileid in invalid_list],
+				 lambda: [fileid for fileid in all_fileids if fileid in reader._invalid_fileids]),
+				("URLs of %d requested fileids" % len(requested), 
+				 lambda: [url for id, url in reader._fileid_to_url.iteritems() if id in requested],
+				 lambda: [reader._fileid_to_url[fileid] for fileid in requested if fileid in reader._fileid_to_url])]
+		for name, original, current in rows:
+			print "%-40s %10.4f s %10.4f s" % (name, best_time(original, repeat=1), best_time(current))
+		reader._mark_invalid(all_fileids[1])
+		print "%-40s %10s   %10.4f s" % ("fileids() after a link turns invalid", "", best_time(reader.fileids, repeat=1))
+		print "%-40s %12s" % ("same fileids", 'yes' if same else 'NO')
+		print ''
+	finally:
+		os.chdir(working_directory)
+		shutil.rmtree(directory)
+
+def legacy_subtopic_urls(html):
+	"""
+	The original WikipediaCorpusReader._subtopic_urls, kept as the baseline for comparison.
+	"""
+	links = re.findall(r'href="(/wiki/[^\'" >]+)"', html)
+	wiki_links = set(["http://en.wikipedia.org"+link for link in links])
+	wiki_page_keywords = re.compile(r'.*/wiki/(Wikipedia|File|Special|Help|Category|Talk|Portal|Main_Page|Template|Template_talk)')
+	return [link for link in wiki_links if not wiki_page_keywords.match(link)]
+
+def legacy_root_sections(html):
+	"""
+	The original section parsing of WikipediaCorpusReader._download_root_sections 
+	(without cleaning the section titles), kept as the baseline for comparison.
+	"""
+	urls_by_section = {}
+	html_introduction = re.search(r'<!-- bodycontent -->(.*?)<h2>Contents</h2>', html, re.DOTALL).group(1)
+	urls_by_section["Introduction"] = legacy_subtopic_urls(html_introduction)
+	for html_section in re.findall(r'<span class="mw-headline"(.*?)<h\d>', html, re.DOTALL):
+		section_title = re.search(r' id="(?:.*?)">(.*?)</span></h\d>', html_section, re.DOTALL).group(1)
+		urls_by_section[section_title] = legacy_subtopic_urls(html_section)
+	return urls_by_section
+
+def bench_root_parser(paths=None):
+	"""
+	Compares the single-pass root page parser against the original parser, on 
+	saved root pages or, without any, synthetic list-style root pages.
+
+	:param paths: paths to saved Wikipedia root pages (synthetic pages if empty)
+	:type paths: list of str
+	"""
+	if paths:
+		pages = [(os.path.basename(path), open(path).read()) for path in paths]
+	else:
+		pages = [('%d links' % links, synthetic_root_html(synthetic_titles(links))) for links in (1000, 10000, 50000)]
+
+	printHeader("Root page parser: %d pages" % len(pages))
+	print "%-25s %10s %12s %12s %8s" % ("", "KB", "original", "single-pass", "same")
+	for name, html in pages:
+		legacy = legacy_root_sections(html)
+		sections = root_page_sections(html)
+		same = sorted(legacy) == sorted(sections) and \
+			   all(sorted(legacy[title]) == sorted(sections[title]) for title in legacy)
+		print "%-25s %10d %10.4f s %10.4f s %8s" % (name[:25], len(html) // 1024, best_time(legacy_root_sections, html),
+												   best_time(root_page_sections, html), 'yes' if same else 'NO')
+	print ''
+
+def dashboard_queries(topics, groups=20, seed=131):
+	"""
+	Returns the queries a report over several groups of topics would make: the
+	top words, top terms and common words of each group, and the top words of
+	every topic.
+
+	:param topics: the analyzer's topics
+	:type topics: list of str
+
+	:param groups: how many groups of topics to query
+	:type groups: int
+
+	:rtype: list of tuples (str, list of str, int)
+	"""
+	rng = random.Random(seed)
+	queries = [('most_frequent_words_by_topic', None, 10)]
+	for group in range(groups):
+		group_topics = rng.sample(topics, rng.randint(2, max(2, len(topics) // 4)))
+		queries.extend([('most_frequent_words', group_topics, 20), ('most_frequent_terms', group_topics, 10),
+						('common_words_between_topics', group_topics)])
+	return queries
+
+def bench_batch_queries(args=None):
+	"""
+	Compares answering a report's queries one method call at a time against
+	answering them with one query_batch call.
+
+	:param args: optionally, the number of tokens in the corpus (default 1,000,000)
+	:type args: list of str
+	"""
+	tokens = int(args[0]) if args else 1000000
+	analyzer = WikipediaTopicAnalyzer(synthetic_tagged_words(tokens), query_cache_size=0)
+	one_at_a_time = lambda: [getattr(analyzer, query[0])(*query[1:]) if query[0] == 'common_words_between_topics'
+							 else getattr(analyzer, query[0])(query[2], query[1]) for query in queries]
+
+	printHeader("Batch queries: %d tokens, %d topics" % (tokens, len(analyzer.topics())))
+	for groups in (1, 5, 20):
+		queries = dashboard_queries(analyzer.topics(), groups)
+		same = 'same' if one_at_a_time() == analyzer.query_batch(queries) else 'DIFFERENT'
+		print "%3d groups, %3d queries   one at a time %9.2f ms   batch %9.2f ms   %s" % \
+			  (groups, len(queries), 1000 * best_time(one_at_a_time), 1000 * best_time(analyzer.query_batch, queries), same)
+	print ''
+
+def bench_query_cache(args=None):
+	"""
+	Times a report's queries made over and over, as a dashboard refreshing
+	would, with and without the analyzer's query cache, then after new counts
+	are added (which empties the cache).
+
+	:param args: optionally, the number of tokens in the corpus (default 1,000,000)
+	:type args: list of str
+	"""
+	tokens = int(args[0]) if args else 1000000
+	tagged_words = synthetic_tagged_words(tokens)
+	uncached = WikipediaTopicAnalyzer(tagged_words, query_cache_size=0)
+	cached = WikipediaTopicAnalyzer(tagged_words)
+	queries = dashboard_queries(cached.topics(), groups=10)
+	# Each refresh asks for the top 10 of groups whose top 20 an earlier refresh already asked for
+	refresh = lambda analyzer: [analyzer.query_batch([query]) + analyzer.query_batch([query[:2] + (10,)]) 
+								for query in queries]
+
+	printHeader("Query cache: %d tokens, %d topics, %d queries per refresh" % (tokens, len(cached.topics()), 2 * len(queries)))
+	same = 'same' if refresh(cached) == refresh(uncached) else 'DIFFERENT'
+	print "%-30s %9.2f ms" % ("uncached", 1000 * best_time(refresh, uncached))
+	print "%-30s %9.2f ms   %s" % ("cached", 1000 * best_time(refresh, cached), same)
+	cached.add([('Refresh', cached.topics()[0])])
+	print "%-30s %9.2f ms" % ("cached, right after add()", 1000 * best_time(refresh, cached, repeat=1))
+	print "%-30s %s" % ("cache", cached.query_cache_stats())
+	print ''
+
+def resident_megabytes():
+	"""
+	Returns the memory the process holds (its resident set size) in MB, or
+	None where /proc isn't available.
+
+	:rtype: float
+	"""
+	try:
+		status_file = open('/proc/self/status')
+	except IOError:
+		return None
+	try:
+		for line in status_file:
+			if line.startswith('VmRSS:'):
+				return int(line.split()[1]) / 1024.0
+	finally:
+		status_file.close()
+	return None
+
+def storage_footprint(arguments):
+	"""
+	Builds and ranks an analyzer with the given count storage, in a process of
+	its own so earlier builds don't hide how much memory it takes.
+
+	:param arguments: the number of tokens, the number of topics and the storage
+	:type arguments: tuple (int, int, str)
+
+	:return: MB taken, build seconds, query seconds and the query results
+	:rtype: tuple
+	"""
+	tokens, topics, storage = arguments
+	tagged_words = list(synthetic_tagged_words(tokens, topics=topics))
+	before = resident_megabytes()
+	started = time.time()
+	analyzer = WikipediaTopicAnalyzer(tagged_words, storage=storage, query_cache_size=0)
+	top_words = analyzer.most_frequent_words_by_topic(10)			# Ranks every topic
+	build_seconds = time.time() - started
+	megabytes = resident_megabytes() - before if before is not None else None
+	group = analyzer.topics()[::3]
+	query_seconds = best_time(analyzer.most_frequent_words, 20, group)
+	results = (top_words, analyzer.most_frequent_words(20, group), analyzer.most_frequent_terms(20),
+			   analyzer.topics_containing_words(['word1', 'word2']), analyzer.common_words_between_topics(group[:2]))
+	return megabytes, build_seconds, query_seconds, results
+
+def bench_count_storage(args=None):
+	"""
+	Compares the memory taken by an analyzer's counts and rankings, and how
+	long building it and querying a group of topics take, with the default
+	dictionaries and with WikipediaTopicAnalyzer(storage='compact').
+
+	:param args: optionally, the number of tokens and of topics (default 1,000,000 and 300)
+	:type args: list of str
+	"""
+	tokens = int(args[0]) if args else 1000000
+	topics = int(args[1]) if args and len(args) > 1 else 300
+	pool = multiprocessing.Pool(1, maxtasksperchild=1)
+	footprints = pool.map(storage_footprint, [(tokens, topics, storage) for storage in WikipediaTopicAnalyzer.STORAGES],
+						  chunksize=1)
+	pool.close()
+
+	printHeader("Count storage: %d tokens, %d topics" % (tokens, topics))
+	print "%-10s %12s %12s %12s" % ("storage", "memory", "build", "query")
+	reference = footprints[0][3]
+	for storage, (megabytes, build_seconds, query_seconds, results) in zip(WikipediaTopicAnalyzer.STORAGES, footprints):
+		memory = "%9.1f MB" % megabytes if megabytes is not None else "n/a"
+		print "%-10s %12s %10.2f s %9.2f ms   %s" % (storage, memory, build_seconds, 1000 * query_seconds,
+													 'same' if results == reference else 'DIFFERENT')
+	print ''
+
+SUITE_TOPIC = 'Benchmark_Topic'
+SUITE_RESULTS_VERSION = 2
+SUITE_COMPARED_PARAMETERS = ('topic', 'pages', 'bytes', 'tokens')	# Runs that differ in these can't be compared
+
+def write_fixtures(directory, topic=SUITE_TOPIC, links_per_section=20, seed=131):
+	"""
+	Saves fixture pages for an offline reader: a root page for the topic that
+	links to every article stored in the project's corpora, and a synthetic 
+	article page for each of them.
+
+	:param directory: the directory to save the pages in
+	:type directory: str
+
+	:param topic: the root topic, as it appears in a Wikipedia URL
+	:type topic: str
+
+	:param links_per_section: how many articles each section of the root page links to
+	:type links_per_section: int
+
+	:return: a fetch backend serving the pages
+	:rtype: FixtureFetcher
+	"""
+	fetcher = FixtureFetcher(directory)
+	rng = random.Random(seed)
+	articles = OrderedDict(stored_articles())
+	fetcher.save('http://en.wikipedia.org/wiki/' + topic, synthetic_root_html(list(articles), links_per_section))
+	for title, text in articles.iteritems():
+		fetcher.save('http://en.wikipedia.org/wiki/' + title, synthetic_article_html(title, text, rng))
+	return fetcher
+
+def cold_time(function, reset, repeat=3):
+	"""
+	Like best_time, but calls reset before every run (without timing it), e.g. 
+	to delete what the previous run stored.
+
+	:rtype: float
+	"""
+	times = []
+	for i in range(repeat):
+		reset()
+		start = time.time()
+		function()
+		times.append(time.time() - start)
+	return min(times)
+
+def per_call_time(function, repeat=3, min_round=0.02):
+	"""
+	Returns the fastest average time of one call, over several rounds of many
+	calls. The number of calls in a round doubles until a round takes at least 
+	min_round seconds, so quick calls aren't lost in the timer's resolution.
+
+	:rtype: float
+	"""
+	calls = 1
+	while best_time(lambda: [function() for i in xrange(calls)], repeat=1) < min_round and calls < 1000000:
+		calls *= 2
+	return best_time(lambda: [function() for i in xrange(calls)], repeat=repeat) / calls
+
+class _Quiet(object):
+	"""
+	Swallows anything printed while it is in effect, so the timings aren't drowned out.
+	"""
+	def write(self, text):
+		pass
+
+	def __enter__(self):
+		self._stdout, sys.stdout = sys.stdout, self
+		return self
+
+	def __exit__(self, *exc_info):
+		sys.stdout = self._stdout
+
+def parameter_differences(results, baseline):
+	"""
+	Returns what keeps two runs of the suite from being compared: a different
+	results version, or different fixture pages or corpus sizes.
+
+	:param results: this run's results, as written by bench_suite
+	:type results: dict
+
+	:param baseline: an earlier run's results
+	:type baseline: dict
+
+	:return: a description of each difference, empty if the runs can be compared
+	:rtype: list of str
+	"""
+	if baseline.get('version') != results['version']:
+		return ['results version %s, not %s' % (baseline.get('version'), results['version'])]
+	differences = []
+	for name in SUITE_COMPARED_PARAMETERS:
+		before, now = baseline.get('parameters', {}).get(name), results['parameters'][name]
+		if before != now:
+			differences.append('%s %s, not %s' % (name, before, now))
+	return differences
+
+def compare_results(results, baseline, threshold):
+	"""
+	Prints each timing next to the baseline's and flags those that got slower
+	by more than the threshold.
+
+	:param results: this run's results, as written by bench_suite
+	:type results: dict
+
+	:param baseline: an earlier run's results
+	:type baseline: dict
+
+	:param threshold: the fraction a timing may grow by before it counts as a regression
+	:type threshold: float
+
+	:return: the names of the timings that regressed
+	:rtype: list of str
+	
+	:raise ValueError: If the runs had different parameters (see parameter_differences)
+	"""
+	differences = parameter_differences(results, baseline)
+	if differences:
+		raise ValueError('The baseline was run with ' + '; '.join(differences))
+	regressions = []
+	printHeader("Compared with %s" % baseline.get('environment', {}).get('date', 'baseline'))
+	print "%-50s %12s %12s %8s" % ("", "baseline", "now", "ratio")
+	for name, result in results['results'].iteritems():
+		before = baseline['results'].get(name)
+		if before is None or not before['seconds']:
+			print "%-50s %12s %10.6f s %8s" % (name, "-", result['seconds'], "new")
+			continue
+		ratio = result['seconds'] / before['seconds']
+		flag = ''
+		if ratio > 1 + threshold:
+			regressions.append(name)
+			flag = 'REGRESSION'
+		print "%-50s %10.6f s %10.6f s %7.2fx %s" % (name, before['seconds'], result['seconds'], ratio, flag)
+	print ''
+	return regressions
+
+def bench_suite(args=None):
+	"""
+	Times the whole reader and analyzer offline: building a reader from fixture
+	pages (the first time and from its manifest), cleaning article HTML, words()
+	and topic_tagged_words() before and after the articles are stored, building
+	analyzers, and every WikipediaTopicAnalyzer query on a large synthetic corpus.
+	Exits with status 1 if --compare finds a regression, and with status 2 if
+	the baseline was run on different fixture pages or corpus sizes.
+
+	:param args: command line options, see --help
+	:type args: list of str
+	"""
+	parser = argparse.ArgumentParser(prog='benchmarks.py suite', description=bench_suite.__doc__.split(':param')[0].strip())
+	parser.add_argument('--fixtures', help='directory of saved pages to build the reader from '
+										   '(default: pages made from the stored corpora)')
+	parser.add_argument('--topic', default=SUITE_TOPIC, help='root topic of the fixture pages')
+	parser.add_argument('--tokens', type=int, default=1000000, help='tokens in the synthetic corpus for analyzer queries')
+	parser.add_argument('--repeat', type=int, default=3, help='runs of each timing; the fastest is kept')
+	parser.add_argument('--output', help='save the results to this JSON file')
+	parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+	parser.add_argument('--threshold', type=float, default=0.2, help='slowdown reported as a regression (0.2 = 20%%)')
+	options = parser.parse_args(args or [])
+
+	results = OrderedDict()
+	def record(name, seconds, **details):
+		results[name] = OrderedDict([('seconds', seconds)] + sorted(details.items()))
+		print "%-50s %10.6f s   %s" % (name, seconds, ' '.join('%s=%s' % item for item in sorted(details.items())))
+
+	working_directory = os.getcwd()
+	directory = tempfile.mkdtemp()
+	fixtures = os.path.abspath(options.fixtures) if options.fixtures else os.path.join(directory, 'fixtures')
+	os.chdir(directory)												# The reader keeps its corpus in the current directory
+	try:
+		fetcher = FixtureFetcher(fixtures) if options.fixtures else write_fixtures(fixtures, options.topic)
+		make_reader = lambda: WikipediaCorpusReader(options.topic, fetch_backend=fetcher, article_cache=None)
+		corpus = os.path.join(directory, make_reader()._root)
+		pages = [fetcher.fetch(url) for url in make_reader()._fileid_to_url.values()]
+		pages = [page for page in pages if page]
+		megabytes = sum(len(page) for page in pages) / (1024.0 * 1024.0)
+		state = {}
+		def delete_corpus():
+			shutil.rmtree(corpus, ignore_errors=True)
+		def new_corpus():
+			delete_corpus()
+			state['reader'] = make_reader()
+
+		printHeader("Benchmark suite: %d fixture pages, %.2f MB; %d synthetic tokens" % (len(pages), megabytes, options.tokens))
+		record('reader.construct.cold', cold_time(make_reader, delete_corpus, options.repeat))
+		record('reader.construct.warm', best_time(make_reader, repeat=options.repeat))
+		cleaner = state['reader'] = make_reader()
+		elapsed = best_time(lambda: [cleaner._clean_html_and_wikipedia_content(page) for page in pages], repeat=options.repeat)
+		record('reader.clean_html', elapsed, pages=len(pages), mb_per_second=round(megabytes / elapsed, 2))
+		with _Quiet():
+			words = cold_time(lambda: len(state['reader'].words()), new_corpus, options.repeat)
+		record('reader.words.cold', words, words=len(state['reader'].words()))
+		reader = make_reader()
+		record('reader.words.warm', best_time(lambda: len(reader.words()), repeat=options.repeat))
+		record('reader.topic_tagged_words.warm', best_time(lambda: sum(1 for tagged_word in reader.topic_tagged_words()), 
+														   repeat=options.repeat))
+		record('analyzer.build.corpus', best_time(lambda: WikipediaTopicAnalyzer(reader.topic_tagged_words()), 
+												  repeat=options.repeat))
+		
+		tagged_words = synthetic_tagged_words(options.tokens)
+		record('analyzer.build.synthetic', best_time(WikipediaTopicAnalyzer, tagged_words, repeat=1), tokens=options.tokens)
+		analyzer = WikipediaTopicAnalyzer(tagged_words, query_cache_size=0)	# Time the queries, not the cache
+		record('analyzer.first_query', best_time(lambda: analyzer.most_frequent_words(10), repeat=1))
+		topics = sorted(analyzer.topics())
+		some_topics = topics[::5]
+		some_words = [word for word, count in analyzer.most_frequent_words(40)][::2]
+		dashboard = dashboard_queries(topics, groups=5)
+		queries = [('topics', lambda: analyzer.topics()),
+				   ('most_frequent_words', lambda: analyzer.most_frequent_words(10)),
+				   ('most_frequent_words.topic', lambda: analyzer.most_frequent_words(10, topics=topics[0])),
+				   ('most_frequent_words.topics', lambda: analyzer.most_frequent_words(10, topics=some_topics)),
+				   ('most_frequent_words_by_topic', lambda: analyzer.most_frequent_words_by_topic(10)),
+				   ('most_frequent_terms', lambda: analyzer.most_frequent_terms(10)),
+				   ('most_frequent_terms.topic', lambda: analyzer.most_frequent_terms(10, topics=topics[0])),
+				   ('most_frequent_terms.topics', lambda: analyzer.most_frequent_terms(10, topics=some_topics)),
+				   ('most_frequent_terms_by_topic', lambda: analyzer.most_frequent_terms_by_topic(10)),
+				   ('topics_containing_words', lambda: analyzer.topics_containing_words(some_words)),
+				   ('common_words_between_topics', lambda: analyzer.common_words_between_topics(some_topics)),
+				   ('common_words_between_topics.all', lambda: analyzer.common_words_between_topics()),
+				   ('query_batch', lambda: analyzer.query_batch(dashboard))]
+		for name, query in queries:
+			with _Quiet():
+				elapsed = per_call_time(query, repeat=options.repeat)
+			record('analyzer.query.' + name, elapsed)
+		cached = WikipediaTopicAnalyzer(tagged_words)
+		record('analyzer.query_cache.hit', per_call_time(lambda: cached.most_frequent_terms(10, topics=some_topics), 
+														 repeat=options.repeat))
+		print ''
+	finally:
+		os.chdir(working_directory)
+		shutil.rmtree(directory)
+
+	output = OrderedDict([('version', SUITE_RESULTS_VERSION),
+						  ('environment', OrderedDict([('date', time.strftime('%Y-%m-%d %H:%M:%S')),
+													   ('python', platform.python_version()),
+													   ('platform', platform.platform()),
+													   ('cpus', multiprocessing.cpu_count())])),
+						  ('parameters', OrderedDict([('fixtures', options.fixtures), ('topic', options.topic),
+													  ('pages', len(pages)), ('bytes', sum(len(page) for page in pages)),
+													  ('tokens', options.tokens),
+													  ('repeat', options.repeat)])),
+						  ('results', results)])
+	if options.output:
+		output_file = open(options.output, 'w')
+		try:
+			json.dump(output, output_file, indent=2)
+		finally:
+			output_file.close()
+	if options.compare:
+		baseline_file = open(options.compare)
+		try:
+			baseline = json.load(baseline_file)
+		finally:
+			baseline_file.close()
+		try:
+			regressions = compare_results(output, baseline, options.threshold)
+		except ValueError, e:
+			print "Not compared: %s" % e
+			sys.exit(2)
+		if regressions:
+			sys.exit(1)
+
+BENCHMARKS = {
+	'cleaner': bench_cleaner,
+	'clean_workers': bench_clean_workers,
+	'fetcher': bench_fetcher,
+	'topic_index': bench_topic_index,
+	'count_matrix': bench_count_matrix,
+	'top_k': bench_top_k,
+	'snapshot': bench_snapshot,
+	'count_workers': bench_count_workers,
+	'token_filter': bench_token_filter,
+	'fileids': bench_fileids,
+	'root_parser': bench_root_parser,
+	'batch_queries': bench_batch_queries,
+	'query_cache': bench_query_cache,
+	'count_storage': bench_count_storage,
+	'suite': bench_suite,
+}
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+		print "Usage: python benchmarks.py <%s> [arguments]" % '|'.join(sorted(BENCHMARKS))
+		sys.exit(1)
+	BENCHMARKS[sys.argv[1]](sys.argv[2:])
@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+wikipedia_article_cache.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+"""
+
+import os
+import json
+import atexit
+import tempfile
+from collections import OrderedDict
+from wikipedia_corpus_manifest import content_hash, _utf8
+
+try:
+	import fcntl
+except ImportError:									# No file locks on Windows
+	fcntl = None
+
+DEFAULT_DIRECTORY = '.article_cache'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+def canonical_title(fileid):
+	"""
+	Returns the Wikipedia title an article's fileid stands for. Wikipedia ignores
+	the case of a title's first letter and treats spaces as underscores, so
+	"california.txt" and "California.txt" are the same article.
+
+	:param fileid: an article's fileid, e.g. "San_Francisco.txt"
+	:type fileid: str
+
+	:rtype: str
+	"""
+	title = fileid[:-4] if fileid.endswith('.txt') else fileid
+	title = title.replace(' ', '_')
+	return title[:1].upper() + title[1:]
+
+class ArticleCache(object):
+	"""
+	Cleaned article text shared by every corpus, so an article linked from
+	several topics (e.g. California.txt) is downloaded and cleaned once. Each
+	distinct text is saved once under its content hash and looked up by the
+	article's canonical title; corpus directories hard-link to the cached file
+	rather than keeping a copy of their own.
+
+	The cache is bounded: once its files take more than max_bytes, the least
+	recently used articles are dropped from it. Corpora that link to a dropped
+	article keep their copy. Lookups only reorder the articles in memory; the 
+	order is written with the index when articles are added or dropped, or by 
+	close(). Several caches, in one process or several, can share a directory: 
+	each writes the index while holding a lock on it, after reading back the 
+	articles the others added. Example usage:
+
+		>>> cache = ArticleCache(max_bytes=100 * 1024 * 1024)
+		>>> google = WikipediaCorpusReader("Google", article_cache=cache)
+		>>> yahoo = WikipediaCorpusReader("Yahoo", article_cache=cache)
+		>>> cache.stats()
+		{'hits': 37, 'misses': 112, 'articles': 149, 'bytes': 6201344, 'evictions': 0}
+	"""
+	INDEX_FILENAME = 'index.json'
+	LOCK_FILENAME = 'index.lock'
+	VERSION = 1
+
+	def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+		"""
+		:param directory: where the cached articles and their index are kept; hard links need
+						  it on the same file system as the corpus directories
+		:type directory: str
+
+		:param max_bytes: the most bytes of article text to keep
+		:type max_bytes: int
+		"""
+		self._directory = directory
+		self._index_path = os.path.join(directory, self.INDEX_FILENAME)
+		self._max_bytes = max_bytes
+		self._titles = OrderedDict()				# title -> (hash, size), least recently used first
+		self._references = {}						# hash -> number of titles with that text
+		self._bytes = 0
+		self._dirty = False							# Whether articles were added or dropped since the index was written
+		self._reordered = False						# Whether lookups changed the order of use since then
+		self._touched = set()						# Titles added or looked up since then
+		self._removed = {}							# title -> hash of the text dropped since then
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._load_index()
+
+	def _read_index(self):
+		"""
+		Returns the articles in the saved index, least recently used first, or None
+		if there is no readable index.
+
+		:rtype: list of tuples (str, str, int)
+		"""
+		if not os.path.isfile(self._index_path):
+			return None
+		index_file = open(self._index_path)
+		try:
+			data = json.load(index_file)
+		except ValueError:
+			return None								# Unreadable index
+		finally:
+			index_file.close()
+		if data.get('version') != self.VERSION:
+			return None
+		return [(_utf8(title), _utf8(article_hash), size) for title, article_hash, size in data['titles']]
+
+	def _load_index(self):
+		"""
+		Reads the index saved by an earlier cache, skipping articles whose file is gone.
+		"""
+		for title, article_hash, size in self._read_index() or ():
+			if os.path.isfile(self.path(article_hash)):
+				self._add_title(title, article_hash, size)
+
+	def _merge_index(self, entries):
+		"""
+		Combines the articles in the saved index, which other caches may have written
+		since this one read it, with this cache's. Articles this cache added or looked
+		up since then are the most recently used; articles it dropped stay dropped, and 
+		so do articles the others dropped.
+
+		:param entries: the articles in the saved index, least recently used first
+		:type entries: list of tuples (str, str, int)
+		"""
+		titles = self._titles
+		merged = []
+		for title, article_hash, size in entries:
+			if title in self._touched or self._removed.get(title) == article_hash:
+				continue
+			if titles.get(title) == (article_hash, size) or os.path.isfile(self.path(article_hash)):
+				merged.append((title, article_hash, size))
+		merged.extend((title,) + titles[title] for title in titles if title in self._touched)
+		self._titles = OrderedDict()
+		self._references = {}
+		self._bytes = 0
+		for title, article_hash, size in merged:
+			self._add_title(title, article_hash, size)
+
+	def save(self):
+		"""
+		Writes the index if articles were added or dropped. The index is replaced 
+		in one rename, so a crash never leaves it half written.
+		"""
+		if self._dirty:
+			self._write_index()
+
+	def close(self):
+		"""
+		Writes the index if anything changed, including the order articles were 
+		last used in. Shared caches are closed when the process exits.
+		"""
+		if self._dirty or self._reordered:
+			self._write_index()
+
+	def _write_index(self):
+		"""
+		Replaces the index with the cache's current articles, least recently used first.
+		While holding the lock, the saved index is merged in first and the merged cache 
+		is bounded to max_bytes again, so no other cache's articles go uncounted.
+		"""
+		if not os.path.exists(self._directory):
+			os.makedirs(self._directory)
+		lock_file = open(os.path.join(self._directory, self.LOCK_FILENAME), 'a')
+		try:
+			if fcntl is not None:
+				fcntl.flock(lock_file, fcntl.LOCK_EX)			# Released when the file is closed
+			entries = self._read_index()
+			if entries is not None:
+				self._merge_index(entries)
+				self._evict()
+			data = {'version': self.VERSION,
+					'titles': [[title, article_hash, size] for title, (article_hash, size) in self._titles.iteritems()]}
+			handle, temporary_path = tempfile.mkstemp(dir=self._directory)
+			with os.fdopen(handle, 'w') as index_file:
+				json.dump(data, index_file)
+			os.rename(temporary_path, self._index_path)
+		finally:
+			lock_file.close()
+		self._dirty = False
+		self._reordered = False
+		self._touched.clear()
+		self._removed.clear()
+
+	def path(self, article_hash):
+		"""
+		Returns the path of the cached text with a given content hash.
+
+		:rtype: str
+		"""
+		return os.path.join(self._directory, article_hash + '.txt')
+
+	def _add_title(self, title, article_hash, size):
+		"""
+		Makes a title the most recently used, pointing at the given text.
+		"""
+		references = self._references.get(article_hash, 0)
+		if references == 0:
+			self._bytes += size
+		self._references[article_hash] = references + 1			# Counted first so the text isn't
+		if title in self._titles:								# deleted if the title already had it
+			self._remove_title(title)
+		self._titles[title] = (article_hash, size)
+
+	def _remove_title(self, title):
+		"""
+		Forgets a title, deleting its text once no other title has the same text.
+		"""
+		article_hash, size = self._titles.pop(title)
+		self._removed[title] = article_hash
+		self._references[article_hash] -= 1
+		if self._references[article_hash] == 0:
+			del self._references[article_hash]
+			self._bytes -= size
+			try:
+				os.remove(self.path(article_hash))		# Corpora linking to it keep their copy
+			except OSError:
+				pass
+
+	def _evict(self):
+		"""
+		Drops the least recently used articles until the cache fits in max_bytes,
+		always keeping the most recent one.
+		"""
+		while self._bytes > self._max_bytes and len(self._titles) > 1:
+			self._remove_title(next(iter(self._titles)))
+			self.evictions += 1
+
+	def has(self, fileid):
+		"""
+		Checks whether an article is cached, without counting a hit or miss.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:rtype: bool
+		"""
+		return canonical_title(fileid) in self._titles
+
+	def get(self, fileid):
+		"""
+		Looks an article up, counting a hit or a miss.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:return: the cached file's path, the text's content hash and its size, or None if
+				 the article isn't cached
+		:rtype: tuple (str, str, int)
+		"""
+		title = canonical_title(fileid)
+		entry = self._titles.get(title)
+		if entry is not None and not os.path.isfile(self.path(entry[0])):	# Deleted from outside
+			self._remove_title(title)
+			self._dirty = True
+			entry = None
+		if entry is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		self._titles[title] = self._titles.pop(title)				# Now the most recently used
+		self._touched.add(title)
+		self._reordered = True
+		return self.path(entry[0]), entry[0], entry[1]
+
+	def put(self, fileid, text):
+		"""
+		Caches an article's text. Texts already cached under another title are
+		not saved twice.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:param text: the article's cleaned text
+		:type text: str
+
+		:return: the cached file's path
+		:rtype: str
+		"""
+		article_hash = content_hash(text)
+		path = self.path(article_hash)
+		if not os.path.isfile(path):
+			if not os.path.exists(self._directory):
+				os.makedirs(self._directory)
+			handle, temporary_path = tempfile.mkstemp(dir=self._directory)
+			with os.fdopen(handle, 'w') as textfile:
+				textfile.write(text)
+			os.chmod(temporary_path, 0644)						# mkstemp makes files only the owner can read
+			os.rename(temporary_path, path)
+		title = canonical_title(fileid)
+		self._add_title(title, article_hash, len(text))
+		self._touched.add(title)
+		self._dirty = True
+		self._evict()
+		return path
+
+	def stats(self):
+		"""
+		Returns the cache's hit and miss counts and how much it holds.
+
+		:rtype: dict of str -> int
+		"""
+		return {'hits': self.hits, 'misses': self.misses, 'articles': len(self._titles),
+				'bytes': self._bytes, 'evictions': self.evictions}
+
+	def __len__(self):
+		return len(self._titles)
+
+	def __repr__(self):
+		return '<ArticleCache %s: %d articles, %d bytes>' % (self._directory, len(self._titles), self._bytes)
+
+_shared_caches = {}
+
+def shared_article_cache(directory=DEFAULT_DIRECTORY):
+	"""
+	Returns the cache every reader in this process uses for a directory, creating
+	it the first time it is asked for.
+
+	:param directory: the cache directory
+	:type directory: str
+
+	:rtype: ArticleCache
+	"""
+	cache = _shared_caches.get(directory)
+	if cache is None:
+		cache = _shared_caches[directory] = ArticleCache(directory)
+		atexit.register(cache.close)
+	return cache
+
+if __name__ == '__main__':
+	print "Try running main.py instead"
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+wikipedia_compact_counts.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+"""
+
+from array import array
+from itertools import izip, imap, groupby
+from operator import itemgetter
+
+class CompactRanking(object):
+	"""
+	A topic's words ranked by their count in the topic, highest first, kept as
+	two arrays of word ids and counts. Reads like the list of (word, count)
+	pairs it replaces: it has a length, can be iterated, indexed, sliced and
+	added to a list.
+	"""
+	__slots__ = ('word_ids', 'counts', '_words')
+
+	def __init__(self, words, word_ids, counts):
+		"""
+		:param words: word id -> word
+		:type words: list of str
+
+		:param word_ids: the ranked words' ids
+		:type word_ids: array of int
+
+		:param counts: the ranked words' counts, in the same order
+		:type counts: array of int
+		"""
+		self._words = words
+		self.word_ids = word_ids
+		self.counts = counts
+
+	def __len__(self):
+		return len(self.counts)
+
+	def __iter__(self):
+		return izip(imap(self._words.__getitem__, self.word_ids), self.counts)
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return zip(map(self._words.__getitem__, self.word_ids[index]), self.counts[index])
+		return self._words[self.word_ids[index]], self.counts[index]
+
+	def __add__(self, other):
+		return list(self) + list(other)
+
+class CompactWordTopicCounts(object):
+	"""
+	The word counts of WikipediaTopicAnalyzer(storage='compact'). Words and
+	topics are numbered by the analyzer; each word's counts are kept as an
+	array of the ids of the topics it appears in and an array of its count in
+	each, and each topic's words as an array of word ids, instead of a
+	dictionary per word keyed by topic titles.
+
+	Counts being added are collected in a dictionary and merged into the arrays
+	in bulk, the next time the counts are read or once STAGE_LIMIT different
+	(word, topic) pairs are waiting. For everything else it reads like the
+	dictionary of word -> dictionary of topic -> count it replaces, building
+	each word's dictionary when it is asked for. Words come in the order of the
+	analyzer's word -> word id dictionary, which is the order that dictionary
+	would have had. Example usage:
+
+		>>> counts = CompactWordTopicCounts(words, word_ids, topic_names)
+		>>> counts.add(word_ids['Gmail'], topic_ids['Google'], 3)
+		>>> counts['Gmail']
+		{'Google': 3}
+	"""
+	STAGE_LIMIT = 20000
+
+	def __init__(self, words, word_ids, topic_names):
+		"""
+		:param words: word id -> word, kept up to date by the analyzer
+		:type words: list of str
+
+		:param word_ids: word -> word id, kept up to date by the analyzer
+		:type word_ids: dict of str -> int
+
+		:param topic_names: topic id -> topic (None for removed topics), kept up to date by the analyzer
+		:type topic_names: list of str
+		"""
+		self._words = words
+		self._word_ids = word_ids
+		self._topic_names = topic_names
+		self._word_topic_ids = []					# word id -> array of the ids of the word's topics
+		self._word_counts = []						# word id -> array of the word's counts, in the same order
+		self._topic_word_ids = []					# topic id -> array of the ids of the topic's words
+		self._staged = {}							# (word id, topic id) -> count not merged yet
+		self._counted_words = 0						# Words with at least one count
+
+	def add(self, word_id, topic_id, count):
+		"""
+		Adds to the count of a word in a topic.
+
+		:param word_id: the word's id
+		:type word_id: int
+
+		:param topic_id: the topic's id
+		:type topic_id: int
+
+		:param count: the number of occurrences to add
+		:type count: int
+		"""
+		key = (word_id, topic_id)
+		self._staged[key] = self._staged.get(key, 0) + count
+		if len(self._staged) >= self.STAGE_LIMIT:
+			self._merge()
+
+	def add_counts(self, counts):
+		"""
+		Adds to the counts of many words in many topics at once.
+
+		:param counts: (word id, topic id) -> the number of occurrences to add; the dictionary is taken over, not copied
+		:type counts: dict of tuple (int, int) -> int
+		"""
+		if self._staged:
+			self._merge()
+		self._staged = counts
+		self._merge()
+
+	def _merge(self):
+		"""
+		Merges the staged counts into the arrays, one word at a time.
+		"""
+		while len(self._word_topic_ids) < len(self._words):
+			self._word_topic_ids.append(array('I'))
+			self._word_counts.append(array('I'))
+		while len(self._topic_word_ids) < len(self._topic_names):
+			self._topic_word_ids.append(array('I'))
+		if not self._staged:
+			return
+		staged = sorted(self._staged.iteritems())
+		self._staged = {}
+
+		for word_id, entries in groupby(staged, key=lambda entry: entry[0][0]):
+			topic_ids = self._word_topic_ids[word_id]
+			counts = self._word_counts[word_id]
+			if not topic_ids:
+				self._counted_words += 1
+			positions = dict(izip(topic_ids, xrange(len(topic_ids))))
+			for (entry_word_id, topic_id), count in entries:
+				position = positions.get(topic_id)
+				if position is None:						# First time the word is seen in this topic
+					positions[topic_id] = len(topic_ids)
+					topic_ids.append(topic_id)
+					counts.append(count)
+					self._topic_word_ids[topic_id].append(word_id)
+				else:
+					counts[position] += count
+
+	def remove_topic(self, topic_id):
+		"""
+		Forgets every count in a topic.
+
+		:param topic_id: the topic's id
+		:type topic_id: int
+
+		:return: the ids of the words that were in the topic
+		:rtype: array of int
+		"""
+		self._merge()
+		if topic_id >= len(self._topic_word_ids):
+			return array('I')
+		word_ids = self._topic_word_ids[topic_id]
+		for word_id in word_ids:
+			topic_ids = self._word_topic_ids[word_id]
+			position = topic_ids.index(topic_id)
+			del topic_ids[position]
+			del self._word_counts[word_id][position]
+			if not topic_ids:
+				self._counted_words -= 1
+		self._topic_word_ids[topic_id] = array('I')
+		return word_ids
+
+	def topic_word_ids(self, topic_id):
+		"""
+		Returns the ids of the words found in a topic.
+
+		:rtype: array of int
+		"""
+		self._merge()
+		if topic_id >= len(self._topic_word_ids):
+			return array('I')
+		return self._topic_word_ids[topic_id]
+
+	def word_items(self):
+		"""
+		Returns every counted word with its id, in iteration order.
+
+		:rtype: list of tuples (str, int)
+		"""
+		self._merge()
+		word_topic_ids = self._word_topic_ids
+		return [(word, word_id) for word, word_id in self._word_ids.iteritems() if word_topic_ids[word_id]]
+
+	def rank(self):
+		"""
+		Returns every word's total count, in iteration order, and each topic's
+		words ranked by their count in the topic. Words with equal counts keep
+		their iteration order.
+
+		:return: (word, total count) pairs, and a dictionary of topic -> ranking
+		:rtype: tuple (list of (str, int), dict of str -> CompactRanking)
+		"""
+		ranked_word_ids = [array('I') for topic in self._topic_names]
+		ranked_counts = [array('I') for topic in self._topic_names]
+		totals = []
+		for word, word_id in self.word_items():
+			counts = self._word_counts[word_id]
+			totals.append((word, sum(counts)))
+			for topic_id, count in izip(self._word_topic_ids[word_id], counts):
+				ranked_word_ids[topic_id].append(word_id)
+				ranked_counts[topic_id].append(count)
+
+		rankings = {}
+		for topic_id, word_ids, counts in izip(xrange(len(self._topic_names)), ranked_word_ids, ranked_counts):
+			if not word_ids:
+				continue
+			order = sorted(xrange(len(counts)), key=counts.__getitem__, reverse=True)	# Stable, so ties keep their order
+			rankings[self._topic_names[topic_id]] = CompactRanking(self._words, array('I', imap(word_ids.__getitem__, order)),
+																   array('I', imap(counts.__getitem__, order)))
+		return totals, rankings
+
+	def get(self, word, default=None):
+		"""
+		Returns a word's count in each topic it is in.
+
+		:rtype: dict of str -> int
+		"""
+		word_id = self._word_ids.get(word)
+		if word_id is None:
+			return default
+		self._merge()
+		if word_id >= len(self._word_topic_ids) or not self._word_topic_ids[word_id]:
+			return default
+		return dict(izip(imap(self._topic_names.__getitem__, self._word_topic_ids[word_id]), self._word_counts[word_id]))
+
+	def __getitem__(self, word):
+		topic_counts = self.get(word)
+		if topic_counts is None:
+			raise KeyError(word)
+		return topic_counts
+
+	def __contains__(self, word):
+		return self.get(word) is not None
+
+	def __iter__(self):
+		return imap(itemgetter(0), self.word_items())
+
+	def iteritems(self):
+		for word, word_id in self.word_items():
+			yield word, dict(izip(imap(self._topic_names.__getitem__, self._word_topic_ids[word_id]),
+								  self._word_counts[word_id]))
+
+	def __len__(self):
+		self._merge()
+		return self._counted_words
+
+if __name__ == '__main__':
+	print "Try running main.py instead"
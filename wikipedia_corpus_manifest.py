@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+wikipedia_corpus_manifest.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+"""
+
+import os
+import json
+import time
+import hashlib
+
+def content_hash(text):
+	"""
+	Returns the hash used to identify the contents of an article.
+
+	:param text: an article's cleaned text
+	:type text: str
+
+	:return: hex digest of the text
+	:rtype: str
+	"""
+	return hashlib.sha1(text).hexdigest()
+
+def _utf8(value):
+	"""
+	JSON hands back unicode strings; the reader works with UTF-8 encoded str.
+	"""
+	if isinstance(value, unicode):
+		return value.encode('utf-8')
+	return value
+
+class CorpusManifest(object):
+	"""
+	Everything a WikipediaCorpusReader learns about its corpus that isn't the
+	article text itself: the root page's sections and their links, the
+	fileid -> URL map, links known not to lead to a valid article, and when
+	each article was fetched along with a hash of its contents. Saved as a
+	small JSON file in the corpus directory so a new reader for the same topic
+	can start without downloading the root page again. Example usage:
+
+		>>> manifest = CorpusManifest("Google")
+		>>> if manifest.load() and manifest.is_fresh(ttl=7 * 24 * 60 * 60):
+		... 	sections = manifest.urls_by_section()
+	"""
+	FILENAME = '.manifest.json'
+	VERSION = 1
+
+	def __init__(self, root):
+		"""
+		:param root: the corpus directory the manifest belongs to
+		:type root: str
+		"""
+		self._path = os.path.join(root, self.FILENAME)
+		self._data = self._empty()
+		self._dirty = False
+
+	def _empty(self):
+		"""
+		Returns the contents of a manifest that hasn't recorded anything yet.
+		"""
+		return {'version': self.VERSION,
+				'root_url': None,
+				'fetched': None,
+				'sections': [],
+				'fileid_to_url': {},
+				'invalid_fileids': [],
+				'articles': {}}
+
+	def path(self):
+		"""
+		Returns the path of the manifest file.
+
+		:rtype: str
+		"""
+		return self._path
+
+	def load(self):
+		"""
+		Reads the manifest file if there is one. A missing, unreadable or
+		outdated file leaves the manifest empty.
+
+		:return: whether a manifest was loaded
+		:rtype: bool
+		"""
+		try:
+			manifest_file = open(self._path)
+			try:
+				data = json.load(manifest_file)
+			finally:
+				manifest_file.close()
+		except (IOError, ValueError):
+			return False
+		if not isinstance(data, dict) or data.get('version') != self.VERSION:
+			return False
+		self._data = data
+		self._dirty = False
+		return True
+
+	def save(self):
+		"""
+		Writes the manifest file if anything changed since it was loaded or last
+		saved. Writes to a temporary file first so a crash never leaves a
+		half-written manifest behind.
+		"""
+		if not self._dirty:
+			return
+		temporary_path = self._path + '.tmp'
+		manifest_file = open(temporary_path, 'w')
+		try:
+			json.dump(self._data, manifest_file, separators=(',', ':'))
+		finally:
+			manifest_file.close()
+		os.rename(temporary_path, self._path)
+		self._dirty = False
+
+	def is_dirty(self):
+		"""
+		Returns whether anything changed since the manifest was loaded or last saved.
+
+		:rtype: bool
+		"""
+		return self._dirty
+
+	def is_fresh(self, ttl=None):
+		"""
+		Checks whether the sections were fetched recently enough to be reused.
+
+		:param ttl: maximum age of the sections in seconds, or None if they never expire
+		:type ttl: float
+
+		:return: Boolean indicating whether the sections can be used without re-downloading the root page
+		:rtype: bool
+		"""
+		if self._data['fetched'] is None:
+			return False
+		return ttl is None or time.time() - self._data['fetched'] < ttl
+
+	def urls_by_section(self):
+		"""
+		Returns the links found in each section of the root page.
+
+		:return: dictionary of section title -> list of URLs
+		:rtype: dict of str -> list of str
+		"""
+		return dict((_utf8(section), [_utf8(url) for url in urls]) for section, urls in self._data['sections'])
+
+	def fileid_to_url(self):
+		"""
+		Returns the URL each fileid was downloaded from.
+
+		:rtype: dict of str -> str
+		"""
+		return dict((_utf8(fileid), _utf8(url)) for fileid, url in self._data['fileid_to_url'].iteritems())
+
+	def set_sections(self, root_url, urls_by_section, fileid_to_url, fetched=None):
+		"""
+		Records the sections parsed from a freshly downloaded root page.
+
+		:param root_url: URL of the root topic's page
+		:type root_url: str
+
+		:param urls_by_section: the links found in each section
+		:type urls_by_section: dict of str -> list of str
+
+		:param fileid_to_url: the URL for each fileid
+		:type fileid_to_url: dict of str -> str
+
+		:param fetched: when the root page was downloaded (defaults to now)
+		:type fetched: float
+		"""
+		self._data['root_url'] = root_url
+		self._data['fetched'] = fetched if fetched is not None else time.time()
+		self._data['sections'] = [[section, list(urls)] for section, urls in urls_by_section.iteritems()]
+		self._data['fileid_to_url'] = dict(fileid_to_url)
+		self._dirty = True
+
+	def add_section(self, section, urls, fileid_to_url):
+		"""
+		Records a section found after the root page was parsed, e.g. the pages 
+		reached by a crawl, keeping when the root page was fetched.
+		
+		:param section: the section's title
+		:type section: str
+		
+		:param urls: the section's links
+		:type urls: list of str
+		
+		:param fileid_to_url: the URL for each fileid in the section
+		:type fileid_to_url: dict of str -> str
+		"""
+		self._data['sections'] = [[title, section_urls] for title, section_urls in self._data['sections'] if title != section]
+		self._data['sections'].append([section, list(urls)])
+		self._data['fileid_to_url'].update(fileid_to_url)
+		self._dirty = True
+	
+	def invalid_fileids(self):
+		"""
+		Returns the fileids whose links were found not to lead to a valid article.
+
+		:rtype: list of str
+		"""
+		return [_utf8(fileid) for fileid in self._data['invalid_fileids']]
+
+	def set_invalid_fileids(self, fileids):
+		"""
+		Records the fileids whose links don't lead to a valid article.
+
+		:param fileids: the invalid fileids
+		:type fileids: collection of str
+		"""
+		fileids = sorted(set(fileids))
+		if fileids != self._data['invalid_fileids']:
+			self._data['invalid_fileids'] = fileids
+			self._dirty = True
+
+	def record_article(self, fileid, text, fetched=None):
+		"""
+		Records that an article was fetched and stored.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:param text: the article's cleaned text
+		:type text: str
+
+		:param fetched: when the article was downloaded (defaults to now)
+		:type fetched: float
+		"""
+		self._data['articles'][fileid] = {'fetched': fetched if fetched is not None else time.time(),
+										  'hash': content_hash(text),
+										  'size': len(text)}
+		self._dirty = True
+
+	def set_article_hash(self, fileid, article_hash, size):
+		"""
+		Records the content hash of an article that was stored before the manifest
+		existed, or was changed outside the reader, without claiming to know when
+		it was fetched.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:param article_hash: hash of the article's text, from content_hash()
+		:type article_hash: str
+
+		:param size: size of the article's text in bytes
+		:type size: int
+		"""
+		article = self._data['articles'].setdefault(fileid, {'fetched': None})
+		article['hash'] = article_hash
+		article['size'] = size
+		self._dirty = True
+
+	def article_hash(self, fileid):
+		"""
+		Returns the content hash recorded for an article, or None if it wasn't recorded.
+
+		:rtype: str
+		"""
+		article = self._data['articles'].get(fileid)
+		return _utf8(article.get('hash')) if article is not None else None
+
+	def article_size(self, fileid):
+		"""
+		Returns the size recorded for an article, or None if it wasn't recorded.
+
+		:rtype: int
+		"""
+		article = self._data['articles'].get(fileid)
+		return article.get('size') if article is not None else None
+
+	def record_links(self, fileid, urls):
+		"""
+		Records the links to other Wikipedia pages found in an article, so a crawl 
+		can follow them without downloading the article again.
+		
+		:param fileid: the article's fileid
+		:type fileid: str
+		
+		:param urls: the links found in the article
+		:type urls: list of str
+		"""
+		article = self._data['articles'].setdefault(fileid, {'fetched': None})
+		article['links'] = list(urls)
+		self._dirty = True
+	
+	def article_links(self, fileid):
+		"""
+		Returns the links recorded for an article, or None if they weren't recorded.
+		
+		:rtype: list of str
+		"""
+		article = self._data['articles'].get(fileid)
+		if article is None or article.get('links') is None:
+			return None
+		return [_utf8(url) for url in article['links']]
+	
+	def article_fetched(self, fileid):
+		"""
+		Returns when an article was fetched, or None if it wasn't recorded.
+
+		:rtype: float
+		"""
+		article = self._data['articles'].get(fileid)
+		return article['fetched'] if article is not None else None
+
+if __name__ == '__main__':
+	print "Try running main.py instead"
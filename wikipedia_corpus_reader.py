@@ -9,16 +9,70 @@ Email address: <ari.ehrmann@gmail.com>
 
 import re
 import nltk
-import subprocess 
 import os
 import shutil
-from collections import defaultdict
+import time
+import multiprocessing
+from collections import defaultdict, OrderedDict
+from itertools import chain
 from nltk.corpus import PlaintextCorpusReader
+from nltk.util import LazyConcatenation
+from wikipedia_fetcher import ConcurrentFetcher, HTTPFetcher
+from wikipedia_html_cleaner import clean_article_html, clean_fetched_page, is_valid_article, article_links, body_links, root_page_sections
+from wikipedia_corpus_manifest import CorpusManifest, content_hash
+from wikipedia_corpus_store import STORES
+from wikipedia_corpus_views import LazyCorpusArticles, MappedCorpusText
+from wikipedia_token_cache import TOKEN_CACHES
+from wikipedia_article_cache import shared_article_cache
+from wikipedia_crawler import WikipediaCrawler
+from wikipedia_instrumentation import Hooks
 
 class SectionNotFoundError(Exception): pass
 class ArticleNotFoundError(Exception): pass
 class MultipleTopicError(Exception): pass
 
+def count_words(topic, words, word_filter=None):
+	"""
+	Counts the words of one article.
+	
+	:param topic: the article's topic
+	:type topic: str
+	
+	:param words: the article's word tokens
+	:type words: iterable of str
+	
+	:param word_filter: called with each distinct word, returns whether it should be counted
+	:type word_filter: function
+	
+	:return: the topic paired with (word, count) for each counted word, in order of first appearance
+	:rtype: tuple (str, list of (str, int))
+	"""
+	counts = {}
+	first_seen = []
+	for word in words:
+		if word in counts:
+			counts[word] += 1
+		else:
+			counts[word] = 1
+			first_seen.append(word)
+	if word_filter is not None:
+		first_seen = [word for word in first_seen if word_filter(word)]	# Filtered once per distinct word
+	return topic, [(word, counts[word]) for word in first_seen]
+
+def count_article_text(article):
+	"""
+	Tokenizes and counts the words of one article. Takes a single tuple so it can
+	be handed to multiprocessing.Pool.imap by WikipediaCorpusReader.topic_word_counts().
+	
+	:param article: the article's topic, text, word tokenizer and word filter (or None)
+	:type article: tuple (str, str, nltk.tokenize.TokenizerI, function)
+	
+	:return: the topic paired with (word, count) for each counted word, in order of first appearance
+	:rtype: tuple (str, list of (str, int))
+	"""
+	topic, text, word_tokenizer, word_filter = article
+	return count_words(topic, word_tokenizer.tokenize(text), word_filter)
+
 class WikipediaCorpusReader(PlaintextCorpusReader):
 	"""
 	Reader specifically for use with Wikipedia articles. The reader accepts 
@@ -29,10 +83,11 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 	Wikipedia pages and scans the content of those pages, using rudimentary
 	Regular Expressions
 	"""
-	BASE_WGET_COMMAND = r'wget --random-wait -qO- '
 	BASE_WIKIPEDIA_URL = r'en.wikipedia.org/wiki/'
 	
-	def __init__(self, topic):
+	def __init__(self, topic, fetch_workers=4, rate_limit=None, fetch_backend=None, clean_workers=None,
+				 manifest_ttl=None, refresh=False, storage='directory', token_cache=True, article_cache=True,
+				 read_ahead=None, hooks=None):
 		"""
 		Construct a new WikipediaCorpusReader for a topic and a set of 
 		subtopics. Example usage:
@@ -42,45 +97,102 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 		:param topic: The text for the topic of this WikipediaCorpusReader
 		:type topic: str
 		
+		:param fetch_workers: maximum number of articles downloaded at once
+		:type fetch_workers: int
+		
+		:param rate_limit: maximum requests per second sent to a single host, or None for no limit
+		:type rate_limit: float
+		
+		:param fetch_backend: object whose fetch(url) method downloads a page, e.g. an HTTPFetcher
+							  pointed at a mock server or a WgetFetcher (defaults to a new HTTPFetcher)
+		:type fetch_backend: HTTPFetcher or WgetFetcher
+		
+		:param clean_workers: number of processes that clean downloaded articles in parallel, 
+							  or None to clean them on the main thread as they arrive
+		:type clean_workers: int
+		
+		:param manifest_ttl: seconds before the sections saved in the corpus manifest expire and the
+							 root page is downloaded again, or None if they never expire
+		:type manifest_ttl: float
+		
+		:param refresh: whether to download the root page even if the manifest is still fresh
+		:type refresh: bool
+		
+		:param storage: how articles are stored: 'directory' (one text file per article) or 
+						'archive' (one compressed archive per corpus, see wikipedia_corpus_store.py)
+		:type storage: str
+		
+		:param token_cache: whether to save each article's tokens the first time it is tokenized,
+							so later calls to words() and topic_tagged_words() read them back
+		:type token_cache: bool
+		
+		:param article_cache: the cache of article text shared with other topics' corpora, True for
+							  the cache every reader in this process shares (in .article_cache), or 
+							  None or False to download every article this corpus doesn't have. 
+							  True means no cache with storage='archive', which can't hard-link to 
+							  the cached files and would keep every text twice
+		:type article_cache: ArticleCache or bool
+		
+		:param read_ahead: how many articles words(), topic_tagged_words() and raw(mapped=True) 
+						   download ahead of the article being read (defaults to fetch_workers)
+		:type read_ahead: int
+		
+		:param hooks: callbacks told how long each download, cleaning, write and tokenization 
+					  takes and about every cache hit and miss, e.g. an InstrumentationSummary
+					  (see wikipedia_instrumentation.py); more can be attached with add_hook()
+		:type hooks: list of callables
+		
 		:raise MultipleTopicError: If the topic string does not correspond to a single Wikipedia topic
 		"""
 		# Generate a well-formed topic name and use it as the root 
 		# directory's name
 		self._root_topic = self._wikipedia_topic(topic)
 		self._root = self._root_topic
+		self._hooks = Hooks(hooks or ())
 		
-		# Save the root topic's URL and write it's text to the appropriate file
-		self._root_topic_url = self._url_for_topic(self._root_topic)
-		
-		root_html = self._html_for_url(self._root_topic_url) # Download the root topic's HTML
-		if root_html is None:
-			raise ArticleNotFoundError('Proper article for %s could not be found' % self._root_topic_url)
-		if not self._is_valid_article(root_html):
-			raise MultipleTopicError('%s returns more than one topic on Wikipedia' % self._root_topic_url)
-		self._root_fileid = self._fileid_for_url(self._root_topic_url)
+		# Articles are kept in the corpus directory, either as separate files or in one archive.
+		# Articles already saved as separate files are moved into a new archive.
+		if storage not in STORES:
+			raise ValueError('Unknown storage %r, expected one of %s' % (storage, ', '.join(sorted(STORES))))
+		self._storage = storage
+		self._store = STORES[storage](self._root)
+		if storage == 'archive':
+			self._store.import_directory(remove=True)
+		self._token_cache = TOKEN_CACHES[storage](os.path.join(self._root, '.tokens')) if token_cache else None
 		
+		# Articles another topic already downloaded are linked to from the shared article cache
+		if article_cache is True:
+			article_cache = shared_article_cache() if storage == 'directory' else None
+		self._article_cache = article_cache if article_cache is not False else None
 		
-		# Create the root directory if it doesn't already exist
-		if not os.path.exists(self._root):
-			os.mkdir(self._root)
-		self._generate_file_for_url(self._root_topic_url, root_html)
-		
-		self._urls_by_section = {}
-		# We need to do initial searching for the Introduction section since it's not
-		# formatted in the same way as the sections
-		html_introduction = re.search(r'<!-- bodycontent -->(.*?)<h2>Contents</h2>', root_html, re.DOTALL).group(1)
-		urls_introduction_subtopics = self._subtopic_urls(html_introduction)
-		self._urls_by_section["Introduction"] = urls_introduction_subtopics
+		# Articles linked from the root page are downloaded concurrently
+		self._fetch_workers = fetch_workers
+		self._rate_limit = rate_limit
+		self._fetch_backend = fetch_backend if fetch_backend is not None else HTTPFetcher()
+		self._clean_workers = clean_workers
+		self._fetcher = ConcurrentFetcher(self._html_for_url, workers=fetch_workers, rate_limit=rate_limit)
+		self._read_ahead = read_ahead if read_ahead is not None else fetch_workers
 		
-		# Parse through the HTML for the source for each section
-		html_all_sections = re.findall(r'<span class="mw-headline"(.*?)<h\d>', root_html, re.DOTALL)
+		self._root_topic_url = self._url_for_topic(self._root_topic)
+		self._root_fileid = self._fileid_for_url(self._root_topic_url)
+		self._manifest_ttl = manifest_ttl
+		self._refresh = refresh
 		
-		# Parse the HTML for the section title and collect any links to other Wikipedia pages
-		for html_section in html_all_sections:
-			section_title = re.search(r' id="(?:.*?)">(.*?)</span></h\d>', html_section, re.DOTALL).group(1)
-			section_title = self._cleaned_section_title(section_title)
-			urls_section_subtopics = self._subtopic_urls(html_section)
-			self._urls_by_section[section_title] = urls_section_subtopics
+		# Reuse the sections saved by an earlier reader for this topic, and the links it found
+		# to be invalid, while they are fresh; otherwise download and parse the root page again
+		# and check every link again. Downloads that failed are only remembered by this reader.
+		self._manifest = CorpusManifest(self._root)
+		manifest_loaded = self._manifest.load()
+		self._failed_fileids = set()								# fileids whose download failed, tried again when read
+		self._sorted_fileids = {}									# section (None for all) -> sorted valid fileids
+		if manifest_loaded and self._manifest.is_fresh(manifest_ttl) and not refresh:
+			self._invalid_fileids = set(self._manifest.invalid_fileids())
+			self._urls_by_section = self._manifest.urls_by_section()
+			root_downloaded = False
+		else:
+			self._invalid_fileids = set()
+			self._urls_by_section = self._download_root_sections()
+			root_downloaded = True
 		
 		self._fileids_by_section = defaultdict(list)
 		fileids_list = []
@@ -91,15 +203,56 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 				self._fileids_by_section[section].append(fileid)
 				fileids_list.append(fileid)
 				self._fileid_to_url[fileid] = url
-				
-		self._invalid_fileids = []
+		
+		if root_downloaded:
+			self._manifest.set_sections(self._root_topic_url, self._urls_by_section, self._fileid_to_url)
+			self._save_manifest()
 		
 		nltk.corpus.PlaintextCorpusReader.__init__(self, self._root, fileids_list)
 	
 ##############################################################################################
 # 									Private methods											#
 #############################################################################################
-				
+	
+	def _download_root_sections(self):
+		"""
+		Downloads the root topic's page, writes its text to the appropriate file and
+		collects the links to other Wikipedia pages found in each of its sections.
+		
+		:return: dictionary of section title -> list of URLs in that section
+		:rtype: dict of str -> list of str
+		
+		:raise ArticleNotFoundError: If the root topic's page could not be downloaded
+		:raise MultipleTopicError: If the topic string does not correspond to a single Wikipedia topic
+		"""
+		root_html = self._html_for_url(self._root_topic_url) # Download the root topic's HTML
+		if root_html is None:
+			raise ArticleNotFoundError('Proper article for %s could not be found' % self._root_topic_url)
+		if not self._is_valid_article(root_html):
+			raise MultipleTopicError('%s returns more than one topic on Wikipedia' % self._root_topic_url)
+		
+		self._generate_file_for_url(self._root_topic_url, root_html)
+		
+		# Collect the links to other Wikipedia pages in the Introduction and every section
+		# in one pass over the HTML, then clean up the section titles
+		started = time.time() if self._hooks else None
+		urls_by_section = OrderedDict()
+		for section_title, urls in root_page_sections(root_html).iteritems():
+			urls_by_section[self._cleaned_section_title(section_title)] = urls
+		if started is not None:
+			self._hooks.emit('parse_root', time.time() - started, len(root_html), self._root_topic_url)
+		return urls_by_section
+	
+	def _save_manifest(self):
+		"""
+		Saves the sections, invalid fileids and article hashes to the corpus manifest.
+		"""
+		self.reload_root()
+		self._manifest.set_invalid_fileids(self._invalid_fileids)
+		self._manifest.save()
+		if self._article_cache is not None:
+			self._article_cache.save()
+	
 	def _wikipedia_topic(self, topic):
 		"""
 		Converts a topic into a well-formed Wikipedia path suffix.
@@ -161,19 +314,21 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 		
 	def _html_for_url(self, url):
 		"""
-		Using wget(a command line tool), downloads and returns the html content from the given url.
+		Downloads and returns the html content from the given url using the fetch backend.
 		
 		:param url: a full URL to a Wikipedia page
 		:type url: str
 		
-		:return: HTML source from the URL
+		:return: HTML source from the URL, or None if it could not be downloaded
 		:rtype: str
 		""" 
-		escaped_url = re.sub(r'([()])', r'\\\1', url)						# Escape all parentheses
-		try:
-			html = subprocess.check_output(self.BASE_WGET_COMMAND + escaped_url, shell=True)
-		except subprocess.CalledProcessError:
-			return None
+		if not self._hooks:
+			return self._fetch_backend.fetch(url)
+		started = time.time()
+		html = self._fetch_backend.fetch(url)
+		self._hooks.emit('fetch', time.time() - started, len(html) if html is not None else 0, url)
+		if html is None:
+			self._hooks.emit('fetch.failed', detail=url)
 		return html
 		
 	
@@ -185,69 +340,401 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 		:param html: HTML source code
 		:type html: str
 		
-		:return: a list of URLs that link to other Wiki articles within the HTML source
+		:return: a list of URLs that link to other Wiki articles within the HTML source, in order
 		:rtype: list of str 
 		"""
-		links = re.findall(r'href="(/wiki/[^\'" >]+)"', html)					# Find all links with "wiki" in them
-		wiki_links = set(["http://en.wikipedia.org"+link for link in links])	# Create absolute URLs for each link
-		wiki_page_keywords = re.compile(r'.*/wiki/(Wikipedia|File|Special|Help|Category|Talk|Portal|Main_Page|Template|Template_talk)')
-		wiki_links = [link for link in wiki_links if not wiki_page_keywords.match(link)]	# Filter out links to standard Wikipedia pages
-		return wiki_links
+		return article_links(html)
 		
 	def _generate_file_for_url(self, url, html):
 		"""
-		Cleans the passed in HTML source and writes it to a file whose name is generated by another function. 
-		Returns the name of the newly created file's name or None if the topic did not have a valid article
-		associated with it on Wikipedia.
+		Cleans the passed in HTML source and saves it in the corpus store under a fileid generated 
+		by another function, recording the links in its body in the manifest. Returns the fileid or 
+		None if the page could not be downloaded or the topic did not have a valid article associated 
+		with it on Wikipedia.
 		
 		:param url: A full URL for a Wikipedia page
 		:type url: str
 		
-		:param html: HTML source from the Wikipedia page
+		:param html: HTML source from the Wikipedia page (None if the download failed)
 		:type html: str
 		
-		:return: file name of the newly created file
+		:return: fileid of the stored article
 		:rtype: str
 		"""
-		# If Wikipedia doesn't have an article for the given topic, return None
+		# If the download failed or Wikipedia doesn't have an article for the given topic, return None
+		if html is None:
+			self._mark_failed(self._fileid_for_url(url))
+			return None
 		if not self._is_valid_article(html):
-			self._invalid_fileids.append(self._fileid_for_url(url))
+			self._mark_invalid(self._fileid_for_url(url))
 			return None
-		self.reload_root()											# Reload the root directory in case it was deleted
-		filename = self._root + "/" + self._fileid_for_url(url)		# Generate the fileid for the URL
-		if not os.path.isfile(filename):							# If the file doesn't already exist
+		fileid = self._fileid_for_url(url)							# Generate the fileid for the URL
+		if not self._store.has(fileid):								# If the article isn't already stored
+			started = time.time() if self._hooks else None
 			text = self._clean_html_and_wikipedia_content(html)		# Clean the text
-			textfile = open(filename, r'w')			
-			textfile.write(text)	
-			textfile.close()
-		return filename
+			if started is not None:
+				self._hooks.emit('clean', time.time() - started, len(html), fileid)
+			self._store_article(fileid, text)
+		self._manifest.record_links(fileid, body_links(html))		# A crawl follows them without downloading it again
+		return fileid
+	
+	def _generate_file_for_text(self, url, text, links):
+		"""
+		Saves text that was already cleaned (by a cleaning process) in the corpus store
+		under the URL's fileid, recording the links found in its body in the manifest. 
+		Returns the fileid or None if the text is None, i.e. the topic did not have a 
+		valid article associated with it on Wikipedia.
+		
+		:param url: A full URL for a Wikipedia page
+		:type url: str
+		
+		:param text: cleaned text from the Wikipedia page, or None
+		:type text: str
+		
+		:param links: the links in the page's body
+		:type links: list of str
+		
+		:return: fileid of the stored article
+		:rtype: str
+		"""
+		if text is None:
+			self._mark_invalid(self._fileid_for_url(url))
+			return None
+		fileid = self._fileid_for_url(url)
+		if not self._store.has(fileid):
+			self._store_article(fileid, text)
+		self._manifest.record_links(fileid, links)
+		return fileid
+	
+	def _store_article(self, fileid, text):
+		"""
+		Saves an article's cleaned text in the corpus store and records it in the manifest.
+		
+		:param fileid: the article's fileid
+		:type fileid: str
+		
+		:param text: cleaned text of the article
+		:type text: str
+		"""
+		started = time.time() if self._hooks else None
+		if self._article_cache is not None:
+			self._store.add_file(fileid, self._article_cache.put(fileid, text))
+		else:
+			self._store.write(fileid, text)
+		self._manifest.record_article(fileid, text)
+		self._failed_fileids.discard(fileid)
+		if started is not None:
+			self._hooks.emit('store', time.time() - started, len(text), fileid)
+	
+	def _mark_invalid(self, fileid):
+		"""
+		Records that a fileid has no valid article on Wikipedia, forgetting the 
+		sorted fileid lists that included it.
+		
+		:param fileid: the fileid of the invalid article
+		:type fileid: str
+		"""
+		if fileid not in self._invalid_fileids:
+			self._invalid_fileids.add(fileid)
+			self._sorted_fileids.clear()
+	
+	def _mark_failed(self, fileid):
+		"""
+		Records that an article could not be downloaded, e.g. after a timeout or a 
+		server error. Unlike an invalid article, it isn't saved in the manifest and 
+		is downloaded again the next time it is read.
+		
+		:param fileid: the fileid of the article
+		:type fileid: str
+		"""
+		self._failed_fileids.add(fileid)
+	
+	def _unavailable(self, fileid):
+		"""
+		Returns whether a fileid has no valid article or its download failed and it
+		wasn't stored since, e.g. by another reader of the topic.
+		
+		:rtype: bool
+		"""
+		return fileid in self._invalid_fileids or \
+			   (fileid in self._failed_fileids and not self._store.has(fileid))
+	
+	def _valid_fileids(self, section=None):
+		"""
+		Returns the sorted fileids of a section, or of the whole corpus, without 
+		the invalid ones. Each list is sorted once and kept until an article turns 
+		out to be invalid or a section is added.
+		
+		:param section: a section title, or None for every section
+		:type section: str
+		
+		:rtype: list of str
+		"""
+		fileids = self._sorted_fileids.get(section)
+		if fileids is None:
+			section_fileids = self._fileids if section is None else self._fileids_by_section.get(section, [])
+			fileids = sorted(fileid for fileid in section_fileids if fileid not in self._invalid_fileids)
+			self._sorted_fileids[section] = fileids
+		return fileids
+	
+	def _stored_from_cache(self, fileid):
+		"""
+		Stores an article from the shared article cache, if another corpus already
+		downloaded it.
+		
+		:param fileid: the article's fileid
+		:type fileid: str
+		
+		:return: whether the article was in the cache
+		:rtype: bool
+		"""
+		if self._article_cache is None:
+			return False
+		cached = self._article_cache.get(fileid)
+		if cached is None:
+			if self._hooks:
+				self._hooks.emit('article_cache.miss', detail=fileid)
+			return False
+		path, article_hash, size = cached
+		if self._hooks:
+			self._hooks.emit('article_cache.hit', size=size, detail=fileid)
+		self._store.add_file(fileid, path)
+		self._manifest.set_article_hash(fileid, article_hash, size)
+		self._failed_fileids.discard(fileid)
+		return True
+	
+	def _generated_files(self, fetched_pages):
+		"""
+		Cleans and saves each downloaded page, yielding the resulting fileids in
+		the order the pages were downloaded. With clean_workers set, pages are cleaned
+		by a pool of processes while later pages are still downloading.
+		
+		:param fetched_pages: (url, html) pairs, html being None if the download failed
+		:type fetched_pages: iterable of tuples (str, str)
+		
+		:return: generator of fileids, None for pages without a valid article
+		:rtype: generator of str
+		"""
+		if not self._clean_workers or self._clean_workers < 2:
+			for url, html in fetched_pages:
+				yield self._generate_file_for_url(url, html)
+			return
+		failed_urls = set()											# Cleaning gives None for these too
+		def pages():
+			for url, html in fetched_pages:
+				if html is None:
+					failed_urls.add(url)
+				yield url, html
+		
+		pool = multiprocessing.Pool(self._clean_workers)
+		try:
+			for url, text, links in pool.imap(clean_fetched_page, pages()):	# imap keeps the results in order
+				if url in failed_urls:
+					yield self._generate_file_for_url(url, None)
+				else:
+					yield self._generate_file_for_text(url, text, links)
+		finally:
+			pool.terminate()
+			pool.join()
 	
 	def _load_all_urls(self, urls):
 		"""
 		Downloads the HTML source of every URL given then cleans and saves the
-		text to a file. Returns the list of filenames. 
+		text in the corpus store. Returns the list of fileids. Downloads run concurrently,
+		so loading a whole section takes roughly as long as its slowest article.
 		
 		:param urls: A collection of URLS
 		:type urls: list of str
 		
-		:return: file paths for all created files
+		:return: fileids of all stored articles
 		:rtype: list of str
 		"""
 		paths = []
+		pending = []
+		pending_fileids = set()
+		cached = False
 		for url in urls:
 			filename = self._fileid_for_url(url)
-			if filename in self._invalid_fileids:
+			if filename in self._invalid_fileids or filename in pending_fileids:
 				continue
-			if not os.path.isfile(self._root + "/" + filename):		# If the file hasn't already been downloaded
-				print "Loading:", filename		
-				html = self._html_for_url(url)						# Grab the HTML
-				result = self._generate_file_for_url(url, html)		# Generate the file with text from the HTML
-				if result is not None:							
-					paths.append(result)
+			if not self._store.has(filename) and self._stored_from_cache(filename):
+				cached = True										# Another corpus already downloaded it
+			if not self._store.has(filename):						# If the article hasn't already been downloaded
+				print "Loading:", filename
+				pending.append(url)									# Queue it up for the fetcher
+				pending_fileids.add(filename)
 			else:
 				paths.append(filename)
+		fetched_pages = self._fetcher.fetch_all(pending)			# Grab the HTML, several pages at a time
+		for result in self._generated_files(fetched_pages):			# Generate the files with text from the HTML
+			if result is not None:
+				paths.append(result)
+		if pending or cached:
+			self._save_manifest()									# Remember new articles and invalid links
 		return paths
 	
+	def _loaded_articles(self, fileids):
+		"""
+		Downloads and stores articles as the caller reaches them, yielding each 
+		fileid once its article is stored, or None if the topic has no valid 
+		article. Up to read_ahead of the following articles are downloaded in the 
+		background meanwhile; articles after those are only downloaded if the 
+		caller keeps going. With clean_workers set, each page is handed to a 
+		cleaning process by the thread that downloaded it.
+		
+		:param fileids: fileids, in the order they are read
+		:type fileids: list of str
+		
+		:return: generator of fileids, None for pages without a valid article
+		:rtype: generator of str
+		"""
+		downloads = {}												# fileid -> whether it must be downloaded
+		stored = []													# Articles downloaded or taken from the cache
+		def must_download(fileid):
+			download = downloads.get(fileid)
+			if download is None:
+				download = (fileid in self._fileid_to_url and not self._store.has(fileid) and 
+							fileid not in self._invalid_fileids)
+				if download and self._stored_from_cache(fileid):
+					stored.append(fileid)
+					download = False
+				downloads[fileid] = download
+			return download
+		
+		clean_in_pool = bool(self._clean_workers) and self._clean_workers >= 2
+		cleaning = {}												# 'pool' -> cleaning processes, started with the first download
+		def urls():
+			for fileid in fileids:
+				if must_download(fileid):
+					if clean_in_pool and 'pool' not in cleaning:
+						cleaning['pool'] = multiprocessing.Pool(self._clean_workers)
+					yield self._fileid_to_url[fileid]
+		
+		def cleaned_page(url, html):
+			if html is None:
+				return None
+			return cleaning['pool'].apply(clean_fetched_page, ((url, html),))
+		
+		process = cleaned_page if clean_in_pool else None
+		fetched_pages = self._fetcher.fetch_ahead(urls(), self._read_ahead, process=process)
+		try:
+			for fileid in fileids:
+				if must_download(fileid):
+					url, page = next(fetched_pages)				# Pages arrive in the same order
+					stored.append(fileid)
+					if process is not None and page is not None:	# Already cleaned: (url, text, links)
+						fileid = self._generate_file_for_text(url, page[1], page[2])
+					else:
+						fileid = self._generate_file_for_url(url, page)
+				elif fileid in self._invalid_fileids or not self._store.has(fileid):
+					fileid = None
+				yield fileid
+		finally:
+			fetched_pages.close()
+			if 'pool' in cleaning:
+				cleaning['pool'].close()						# Lets pages being cleaned finish
+				cleaning['pool'].join()
+			if stored or self._manifest.is_dirty():
+				self._save_manifest()							# Remember new articles, hashes and invalid links
+	
+	def _requested_fileids(self, fileids, sections):
+		"""
+		Returns the fileids in the specified sections or files, without downloading 
+		anything.
+		
+		:param fileids: single fileids or list of fileids
+		:type fileids: list of str
+		
+		:param sections: single sections or list of sections
+		:type sections: list of str
+		
+		:rtype: list of str
+		"""
+		if fileids is not None and sections is not None:
+			raise SectionNotFoundError('Specify fileids or categories, not both')
+		if sections is not None:
+			return self.fileids(sections)
+		elif fileids is not None:
+			return [fileids] if isinstance(fileids, basestring) else list(fileids)
+		return [fileid for fileid in self._fileid_to_url.keys() if fileid not in self._invalid_fileids]
+	
+	def _add_section(self, section, urls):
+		"""
+		Adds a section that isn't on the root page, e.g. the pages a crawl reached, 
+		and records it in the manifest. Links already in the section are kept.
+		
+		:param section: the section's title
+		:type section: str
+		
+		:param urls: the section's links
+		:type urls: list of str
+		"""
+		section_urls = self._urls_by_section.setdefault(section, [])
+		section_fileids = self._fileids_by_section[section]
+		known_fileids = set(self._fileids)
+		for url in urls:
+			if url in section_urls:
+				continue
+			fileid = self._fileid_for_url(url)
+			section_urls.append(url)
+			section_fileids.append(fileid)
+			self._fileid_to_url[fileid] = url
+			if fileid not in known_fileids:
+				self._fileids.append(fileid)
+				known_fileids.add(fileid)
+		self._sorted_fileids.clear()
+		self._manifest.add_section(section, section_urls, 
+								   dict((self._fileid_for_url(url), url) for url in section_urls))
+	
+	def _article_hash(self, fileid):
+		"""
+		Returns the content hash of a stored article. The hash recorded in the 
+		manifest is trusted while the article's size still matches; otherwise (an 
+		article stored before the manifest kept hashes, or edited by hand) the text 
+		is hashed again and the manifest updated.
+		
+		:param fileid: a stored article's fileid
+		:type fileid: str
+		
+		:return: hash of the article's text
+		:rtype: str
+		"""
+		article_hash = self._manifest.article_hash(fileid)
+		size = self._store.size(fileid)
+		if article_hash is None or self._manifest.article_size(fileid) != size:
+			text = self._store.read(fileid)
+			article_hash = content_hash(text)
+			self._manifest.set_article_hash(fileid, article_hash, len(text))
+		return article_hash
+	
+	def _article_words(self, fileid):
+		"""
+		Returns the word tokens of a single stored article. With the token cache on, 
+		the article is tokenized once and its token ids are read back afterwards, 
+		as long as its text hasn't changed.
+		
+		:param fileid: a stored article's fileid
+		:type fileid: str
+		
+		:return: the article's word tokens
+		:rtype: list of str
+		"""
+		if self._token_cache is None:
+			return PlaintextCorpusReader.words(self, fileid)
+		article_hash = self._article_hash(fileid)
+		token_ids = self._token_cache.token_ids(fileid, article_hash)
+		if token_ids is None:
+			started = time.time() if self._hooks else None
+			text = self._store.read(fileid)
+			tokens = self._word_tokenizer.tokenize(text)
+			token_ids = self._token_cache.store(fileid, article_hash, tokens)
+			if started is not None:
+				self._hooks.emit('token_cache.miss', detail=fileid)
+				self._hooks.emit('tokenize', time.time() - started, len(text), fileid)
+		elif self._hooks:
+			self._hooks.emit('token_cache.hit', detail=fileid)
+		return self._token_cache.tokens(token_ids)
+	
 	def _is_valid_article(self, html):
 		"""
 		Checks whether the article contains standard Wikipedia page or invalid text
@@ -258,10 +745,7 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 		:return: Boolean indicating whether the article's page is valid
 		:rtype: Boolean
 		"""
-		if re.search(r'<a href="/wiki/Special:Categories"', html):
-			if not re.search(r'/wiki/Category:Disambiguation_pages', html):
-				return True
-		return False
+		return is_valid_article(html)
 	
 	def _clean_html_and_wikipedia_content(self, html):
 		"""
@@ -273,27 +757,7 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 		:return: Cleaned body content from the given HTML source
 		:rtype: str
 		"""
-		# Extract only the body content from the article
-		body = re.search(r'<!-- bodyContent -->(.*)<!-- /bodyContent -->', html, re.DOTALL).group(1)
-		# Remove boiler plate from HTML
-		body = re.sub(r'<!-- tagline -->.*?<!-- /tagline -->', r'', body, re.DOTALL)
-		body = re.sub(r'<!-- subtitle -->.*?<!-- /jumpto -->', r'', body, re.DOTALL)
-		body = re.sub(r'<h2>Contents</h2>', r'', body, re.DOTALL)				# Remove the word "Contents"
-		cleaned_body = nltk.clean_html(body)									# Clean out the HTML tags
-		cleaned_body = ' '.join(cleaned_body.split()[10:])						# Collapse all whitespace into spaces
-																				# and remove the 1st 9 words
-		cleaned_body = re.sub(r'http.*? ', r'', cleaned_body, re.DOTALL)		# Remove stray URLS
-		cleaned_body = re.sub(r'&#\d{3};|&\w+?;', r'', cleaned_body)			# Remove escape characters
-		cleaned_body = ''.join([x for x in cleaned_body if ord(x) < 128])		# Remove all Unicode characters
-		cleaned_body = re.sub(r'\[ (\d+|\w+) \]', r'', cleaned_body)			# Remove edit button text and citations
-		cleaned_body = re.sub(r'[\'()^"#:\\;]', r' ', cleaned_body)				# Remove extraneous punctuation
-		cleaned_body = re.sub(r' \.| \. ', r' ', cleaned_body)					# Remove stray periods
-		cleaned_body = re.sub(r'.\. ', r' ', cleaned_body)						# Remove sentence-ending periods
-		cleaned_body = re.sub(r' ,| , |, ', r' ', cleaned_body)					# Remove stray commas
-		cleaned_body = re.sub(r' /| / |/ ', r' ', cleaned_body)					# Remove stray slashes
-		cleaned_body = re.sub(r'\s{2,}', r' ', cleaned_body)					# Replace large whitespace left from previous removals	
-		cleaned_body = re.sub(r'Wikimedia Commons.*?pages', r'', cleaned_body) 	# Remove more boilerplate						
-		return cleaned_body
+		return clean_article_html(html)
 	
 	# Override
 	# Taken from CategorizedPlaintextCorpusReader
@@ -321,22 +785,22 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 				for section in sections:
 					urls.extend(self._urls_by_section[section])
 			self._load_all_urls(urls)
-			return [fileid for fileid in self.fileids(sections) if fileid not in self._invalid_fileids]
+			return [fileid for fileid in self.fileids(sections) if not self._unavailable(fileid)]
 		elif fileids is not None:
 			if isinstance(fileids, basestring):
 				urls = self._fileid_to_url[fileids]
 				self._load_all_urls([urls])
-				if fileids not in self._invalid_fileids:
+				if not self._unavailable(fileids):
 					return [fileids] 
 				else: 
 					return None
 			else:
-				urls = [url for id, url in self._fileid_to_url.iteritems() if id in fileids]
+				urls = [self._fileid_to_url[fileid] for fileid in fileids if fileid in self._fileid_to_url]
 				self._load_all_urls(urls)
-			return [fileid for fileid in fileids if fileid not in self._invalid_fileids]
+			return [fileid for fileid in fileids if not self._unavailable(fileid)]
 		else:
 			self._load_all_urls(self._fileid_to_url.values())
-			return [fileid for fileid in self._fileid_to_url.keys() if fileid not in self._invalid_fileids]
+			return [fileid for fileid in self._fileid_to_url.keys() if not self._unavailable(fileid)]
 	
 	
 ##############################################################################################
@@ -351,6 +815,30 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 		"""
 		return self._root_topic
 	
+	def add_hook(self, hook):
+		"""
+		Attaches a callback told about every download, cleaning, write, tokenization
+		and cache lookup from now on (see Hooks in wikipedia_instrumentation.py).
+		Example usage:
+		
+			>>> summary = InstrumentationSummary()
+			>>> reader.add_hook(summary)
+			>>> words = reader.words(sections='History')
+			>>> print summary.report()
+		
+		:param hook: callable taking (stage, seconds, size, detail)
+		:type hook: callable
+		"""
+		self._hooks.add(hook)
+	
+	def remove_hook(self, hook):
+		"""
+		Detaches a callback attached with add_hook() or the hooks parameter.
+		
+		:raise ValueError: If the hook isn't attached
+		"""
+		self._hooks.remove(hook)
+	
 	def sections(self):
 		"""
 		Returns the titles of the sections on the topic's Wikipedia page.
@@ -391,20 +879,55 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 		:rtype: list of str
 		"""
 		if sections is None:
-			return sorted([fileid for fileid in self._fileids if fileid not in self._invalid_fileids])	
+			return list(self._valid_fileids())
 		elif isinstance(sections, basestring):
 			if sections in self._urls_by_section:
-				return sorted([fileid for fileid in self._fileids_by_section[sections] if fileid not in self._invalid_fileids])
+				return list(self._valid_fileids(sections))
 			else:
 				raise SectionNotFoundError('Section %s not found' % sections)
 		else:
-			all_fileids_for_sections = []
-			for section in sections:
-				all_fileids_for_sections.extend([fileid for fileid in self._fileids_by_section[section] if fileid not in self._invalid_fileids])
-			return sorted(all_fileids_for_sections)
+			return sorted(chain.from_iterable(self._valid_fileids(section) for section in sections))
 				
 	
-	def raw(self, fileids=None, sections=None):
+	# Override
+	def open(self, fileid):
+		"""
+		Returns a read-only stream over the stored text of an article.
+		
+		:param fileid: a single fileid
+		:type fileid: str
+		
+		:return: stream over the article's text
+		:rtype: file-like object
+		"""
+		return self._store.path_pointer(fileid).open(self.encoding(fileid))
+	
+	# Override
+	def abspaths(self, fileids=None, include_encoding=False, include_fileid=False):
+		"""
+		Returns path pointers to the stored text of the given articles, so that NLTK's 
+		corpus views read from whichever store the corpus uses.
+		
+		:param fileids: single fileid or list of fileids
+		:type fileids: single str or list of str
+		
+		:return: path pointers, paired with their encoding and/or fileid if requested
+		:rtype: list of nltk.data.PathPointer or list of tuples
+		"""
+		if fileids is None:
+			fileids = self._fileids
+		elif isinstance(fileids, basestring):
+			fileids = [fileids]
+		paths = [self._store.path_pointer(fileid) for fileid in fileids]
+		if include_encoding and include_fileid:
+			return zip(paths, [self.encoding(fileid) for fileid in fileids], fileids)
+		elif include_fileid:
+			return zip(paths, fileids)
+		elif include_encoding:
+			return zip(paths, [self.encoding(fileid) for fileid in fileids])
+		return paths
+	
+	def raw(self, fileids=None, sections=None, mapped=False):
 		"""
 		Returns the raw string data stored in the specified sections/files
 		
@@ -414,16 +937,25 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 		:param sections: single section or list of sections
 		:type sections: single str or list of str
 		
+		:param mapped: whether to return a memory-mapped view that can be sliced and searched
+					   without reading every article into one string, and that downloads 
+					   articles only when it gets to them
+		:type mapped: bool
+		
 		:return: conglomeration of raw text from all fileids and sections
-		:rtype: str
+		:rtype: str or MappedCorpusText
 		"""
+		if mapped:
+			return MappedCorpusText(self._store, self._requested_fileids(fileids, sections), 
+									load=self._loaded_articles)
 		return PlaintextCorpusReader.raw(
 			self, self._resolve(fileids, sections))
 			
 	def words(self, fileids=None, sections=None):
 		"""
 		Returns a tokenized list of strings from the data stored in the 
-		specified sections/files
+		specified sections/files. The list is lazy: each article is downloaded
+		when the list gets to it, with the next few downloading in the background.
 		
 		:param fileids: single fileid or list of fileids
 		:type fileids: single str or list of str
@@ -434,12 +966,15 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 		:return: conglomeration of word token from all fileids and sections
 		:rtype: list of str
 		"""
-		return nltk.corpus.PlaintextCorpusReader.words(
-			self, self._resolve(fileids, sections))
+		articles = LazyCorpusArticles(self._requested_fileids(fileids, sections), 
+									  self._loaded_articles, self._article_words, empty=[])
+		return LazyConcatenation(articles)
 				
 	def reader_with_topic(self, topic):
 		"""
-		Returns a new WikipediaCorpusReader instance with the specified topic
+		Returns a new WikipediaCorpusReader instance with the specified topic and 
+		this reader's settings: its fetch backend, workers, article cache, storage, 
+		manifest expiry, read-ahead and hooks.
 		
 		:param topic: topic on Wikipedia
 		:type topic: str
@@ -448,7 +983,11 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 		the given topic
 		:rtype: WikipediaCorpusReader
 		"""
-		return WikipediaCorpusReader(topic) 
+		return WikipediaCorpusReader(topic, fetch_workers=self._fetch_workers, rate_limit=self._rate_limit,
+									 fetch_backend=self._fetch_backend, clean_workers=self._clean_workers,
+									 manifest_ttl=self._manifest_ttl, refresh=self._refresh, storage=self._storage,
+									 token_cache=self._token_cache is not None, article_cache=self._article_cache,
+									 read_ahead=self._read_ahead, hooks=list(self._hooks))
 	
 	def topic_tagged_words(self, fileids=None, sections=None):
 		"""
@@ -465,11 +1004,78 @@ class WikipediaCorpusReader(PlaintextCorpusReader):
 		:return: generator of words, tagged with topic title
 		:rtype: generator of tuples (str, str)
 		"""
-		fileids = self._resolve(fileids, sections)
-		for fileid in fileids:
-			for word in self.words(fileids=fileid):
-				yield ((word, fileid[:-4]))
+		for fileid in self._loaded_articles(self._requested_fileids(fileids, sections)):
+			if fileid is None:
+				continue
+			topic = fileid[:-4]
+			for word in self._article_words(fileid):
+				yield ((word, topic))
 
+	def crawl(self, depth=2, max_pages=None):
+		"""
+		Follows links beyond the root page: the articles linked from the root page,
+		then the articles they link to, and so on down to the given depth. Pages 
+		reached at depth 2 and below are stored in this corpus and listed in new 
+		sections named Crawl_Depth_2, Crawl_Depth_3, etc. To crawl the neighborhoods 
+		of several topics in one job, use WikipediaCrawler directly. Example usage:
+		
+			>>> reader.crawl(depth=2, max_pages=500)
+			>>> reader.fileids(sections='Crawl_Depth_2')
+		
+		:param depth: how many links away from the root page to go
+		:type depth: int
+		
+		:param max_pages: the most pages to visit, or None for no limit
+		:type max_pages: int
+		
+		:return: fileids of the articles added to the Crawl_Depth_* sections
+		:rtype: list of str
+		"""
+		return WikipediaCrawler([self], max_depth=depth, max_pages=max_pages).crawl()[self._root_topic]
+	
+	def topic_word_counts(self, fileids=None, sections=None, workers=None, word_filter=None):
+		"""
+		Returns each article's topic with the number of times each of its words
+		appears, i.e. topic_tagged_words() counted one article at a time. With 
+		workers set, articles are tokenized and counted in that many processes
+		and only the counts are sent back. Example usage:
+		
+			>>> for topic, word_counts in reader.topic_word_counts(workers=4):
+			... 	print topic, word_counts[:10]
+		
+		:param fileids: single fileid or list of fileids
+		:type fileids: single str or list of str
+		
+		:param sections: single section or list of sections
+		:type sections: single str or list of str
+		
+		:param workers: number of processes counting articles (None or 1 counts them in this process)
+		:type workers: int
+		
+		:param word_filter: called with each distinct word of an article, returns whether it 
+							should be counted; must be picklable when workers are used
+		:type word_filter: function
+		
+		:return: generator of topics paired with (word, count) for each of their counted 
+				 words, in order of first appearance
+		:rtype: generator of tuples (str, list of (str, int))
+		"""
+		fileids = self._resolve(fileids, sections) or []
+		if workers is None or workers < 2:
+			for fileid in fileids:
+				yield count_words(fileid[:-4], self._article_words(fileid), word_filter)
+			self._save_manifest()
+			return
+		
+		articles = ((fileid[:-4], self._store.read(fileid), self._word_tokenizer, word_filter) for fileid in fileids)
+		pool = multiprocessing.Pool(workers)
+		try:
+			for topic_counts in pool.imap(count_article_text, articles):		# imap keeps the results in order
+				yield topic_counts
+		finally:
+			pool.terminate()
+			pool.join()
+	
 	def delete_corpus(self):
 		"""
 		Deletes the directory created by this instance and its contents
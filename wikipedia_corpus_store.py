@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+wikipedia_corpus_store.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+"""
+
+import os
+import glob
+import mmap
+import zlib
+import shutil
+from StringIO import StringIO
+from nltk.data import PathPointer, FileSystemPathPointer, SeekableUnicodeStreamReader
+
+class DirectoryStore(object):
+	"""
+	Stores each article as its own text file in the corpus directory,
+	e.g. Google/Gmail.txt. This is the layout every existing corpus uses.
+	"""
+	def __init__(self, root):
+		"""
+		:param root: the corpus directory
+		:type root: str
+		"""
+		self._root = root
+
+	def path(self, fileid):
+		"""
+		Returns the path of an article's text file.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:rtype: str
+		"""
+		return os.path.join(self._root, fileid)
+
+	def has(self, fileid):
+		"""
+		Checks whether the article has been stored.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:rtype: bool
+		"""
+		return os.path.isfile(self.path(fileid))
+
+	def write(self, fileid, text):
+		"""
+		Stores an article's text, creating the corpus directory if needed.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:param text: the article's cleaned text
+		:type text: str
+		"""
+		if not os.path.exists(self._root):
+			os.mkdir(self._root)
+		if os.path.exists(self.path(fileid)):
+			os.remove(self.path(fileid))				# Never write through a link to a cached article
+		textfile = open(self.path(fileid), r'w')
+		textfile.write(text)
+		textfile.close()
+
+	def add_file(self, fileid, path):
+		"""
+		Stores an article whose text is already saved elsewhere, e.g. in an
+		ArticleCache, by hard-linking to that file. The text is copied instead if
+		the file can't be linked to (e.g. it is on another file system).
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:param path: the file holding the article's cleaned text
+		:type path: str
+		"""
+		if not os.path.exists(self._root):
+			os.mkdir(self._root)
+		if os.path.exists(self.path(fileid)):
+			os.remove(self.path(fileid))
+		try:
+			os.link(path, self.path(fileid))
+		except (OSError, AttributeError):				# AttributeError: no os.link on Windows
+			shutil.copyfile(path, self.path(fileid))
+
+	def read(self, fileid):
+		"""
+		Returns an article's text.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:rtype: str
+		"""
+		textfile = open(self.path(fileid))
+		try:
+			return textfile.read()
+		finally:
+			textfile.close()
+
+	def size(self, fileid):
+		"""
+		Returns the size of an article in bytes.
+
+		:rtype: int
+		"""
+		return os.path.getsize(self.path(fileid))
+
+	def buffer(self, fileid):
+		"""
+		Returns a read-only memory map of an article's file, so its text can be
+		sliced and searched without reading it all into memory.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:rtype: mmap.mmap
+		"""
+		textfile = open(self.path(fileid), 'rb')
+		try:
+			if os.fstat(textfile.fileno()).st_size == 0:		# Empty files can't be mapped
+				return ''
+			return mmap.mmap(textfile.fileno(), 0, access=mmap.ACCESS_READ)
+		finally:
+			textfile.close()								# The map stays valid after the file is closed
+
+	def path_pointer(self, fileid):
+		"""
+		Returns a path pointer that NLTK's corpus views can stream the article from.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:rtype: nltk.data.PathPointer
+		"""
+		return FileSystemPathPointer(self.path(fileid))
+
+	def fileids(self):
+		"""
+		Returns the fileids of every stored article.
+
+		:rtype: list of str
+		"""
+		return sorted(os.path.basename(path) for path in glob.glob(os.path.join(self._root, '*.txt')))
+
+class ArchivePathPointer(PathPointer):
+	"""
+	Path pointer to a single article inside an ArchiveStore. Opening it
+	decompresses only that article.
+	"""
+	def __init__(self, store, fileid):
+		self._store = store
+		self._fileid = fileid
+
+	def open(self, encoding=None):
+		stream = StringIO(self._store.read(self._fileid))
+		if encoding is not None:
+			stream = SeekableUnicodeStreamReader(stream, encoding)
+		return stream
+
+	def file_size(self):
+		return self._store.size(self._fileid)
+
+	def join(self, fileid):
+		raise IOError('Archive entries cannot contain subpaths: %s/%s' % (self._fileid, fileid))
+
+	def __repr__(self):
+		return '<ArchivePathPointer %s:%s>' % (self._store.archive_path(), self._fileid)
+
+class ArchiveStore(object):
+	"""
+	Stores every article of a corpus in one append-only archive file, each
+	article compressed on its own, plus an index of where each one starts.
+	Reading an article seeks straight to it and decompresses only that
+	article. Example usage:
+
+		>>> store = ArchiveStore("Google")
+		>>> store.import_directory(remove=True)		# Move Google/*.txt into the archive
+		>>> text = store.read("Gmail.txt")
+	"""
+	ARCHIVE_FILENAME = 'corpus.archive'
+	INDEX_FILENAME = 'corpus.index'
+
+	def __init__(self, root, compression_level=6):
+		"""
+		:param root: the corpus directory that holds the archive and its index
+		:type root: str
+
+		:param compression_level: zlib compression level, 1 (fastest) to 9 (smallest)
+		:type compression_level: int
+		"""
+		self._root = root
+		self._archive_path = os.path.join(root, self.ARCHIVE_FILENAME)
+		self._index_path = os.path.join(root, self.INDEX_FILENAME)
+		self._compression_level = compression_level
+		self._index = {}							# fileid -> (offset, compressed size, size)
+		self._reader = None
+		self._writer = None
+		self._index_writer = None
+		self._load_index()
+
+	def _load_index(self):
+		"""
+		Reads the index file. Each line records one article; when an article
+		was written more than once, the last line wins.
+		"""
+		if not os.path.isfile(self._index_path):
+			return
+		index_file = open(self._index_path)
+		try:
+			for line in index_file:
+				fields = line.rstrip('\n').split('\t')
+				if len(fields) == 4:				# Skip a line cut short by a crash
+					self._index[fields[0]] = (int(fields[1]), int(fields[2]), int(fields[3]))
+		finally:
+			index_file.close()
+
+	def archive_path(self):
+		"""
+		Returns the path of the archive file.
+
+		:rtype: str
+		"""
+		return self._archive_path
+
+	def has(self, fileid):
+		"""
+		Checks whether the article has been stored.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:rtype: bool
+		"""
+		return fileid in self._index
+
+	def write(self, fileid, text):
+		"""
+		Compresses an article and appends it to the archive. The data is
+		written before its index line, so a crash can never leave the index
+		pointing at missing data.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:param text: the article's cleaned text
+		:type text: str
+		"""
+		if self._writer is None:
+			if not os.path.exists(self._root):
+				os.mkdir(self._root)
+			self._writer = open(self._archive_path, 'ab')
+			self._index_writer = open(self._index_path, 'a')
+		compressed = zlib.compress(text, self._compression_level)
+		self._writer.seek(0, os.SEEK_END)
+		offset = self._writer.tell()
+		self._writer.write(compressed)
+		self._writer.flush()
+		self._index_writer.write('%s\t%d\t%d\t%d\n' % (fileid, offset, len(compressed), len(text)))
+		self._index_writer.flush()
+		self._index[fileid] = (offset, len(compressed), len(text))
+
+	def add_file(self, fileid, path):
+		"""
+		Stores an article whose text is already saved elsewhere, e.g. in an
+		ArticleCache. Archived articles are compressed, so the text is copied in.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:param path: the file holding the article's cleaned text
+		:type path: str
+		"""
+		textfile = open(path)
+		try:
+			self.write(fileid, textfile.read())
+		finally:
+			textfile.close()
+
+	def read(self, fileid):
+		"""
+		Returns an article's text, decompressing only that article.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:rtype: str
+
+		:raise KeyError: If the article is not in the archive
+		"""
+		offset, compressed_size, size = self._index[fileid]
+		if self._reader is None or self._reader.closed:
+			self._reader = open(self._archive_path, 'rb')
+		self._reader.seek(offset)
+		return zlib.decompress(self._reader.read(compressed_size))
+
+	def size(self, fileid):
+		"""
+		Returns the uncompressed size of an article in bytes.
+
+		:rtype: int
+		"""
+		return self._index[fileid][2]
+
+	def buffer(self, fileid):
+		"""
+		Returns an article's text. Compressed articles can't be memory-mapped,
+		so this decompresses the one article asked for.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:rtype: str
+		"""
+		return self.read(fileid)
+
+	def path_pointer(self, fileid):
+		"""
+		Returns a path pointer that NLTK's corpus views can stream the article from.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:rtype: ArchivePathPointer
+		"""
+		if fileid not in self._index:
+			raise IOError('No such article in %s: %s' % (self._archive_path, fileid))
+		return ArchivePathPointer(self, fileid)
+
+	def fileids(self):
+		"""
+		Returns the fileids of every stored article.
+
+		:rtype: list of str
+		"""
+		return sorted(self._index)
+
+	def import_directory(self, directory=None, remove=False):
+		"""
+		Copies every article stored as a separate text file (the DirectoryStore
+		layout) into the archive, skipping articles the archive already has.
+
+		:param directory: the directory to import from (defaults to this corpus directory)
+		:type directory: str
+
+		:param remove: whether to delete each text file once it is in the archive
+		:type remove: bool
+
+		:return: the number of articles imported
+		:rtype: int
+		"""
+		source = DirectoryStore(directory if directory is not None else self._root)
+		imported = 0
+		for fileid in source.fileids():
+			if fileid not in self._index:
+				self.write(fileid, source.read(fileid))
+				imported += 1
+			if remove:
+				os.remove(source.path(fileid))
+		return imported
+
+	def close(self):
+		"""
+		Closes the archive's open file handles.
+		"""
+		for handle in (self._reader, self._writer, self._index_writer):
+			if handle is not None:
+				handle.close()
+		self._reader = self._writer = self._index_writer = None
+
+STORES = {
+	'directory': DirectoryStore,
+	'archive': ArchiveStore,
+}
+
+if __name__ == '__main__':
+	print "Try running main.py instead"
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+wikipedia_corpus_views.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+"""
+
+import re
+from bisect import bisect_right
+from collections import OrderedDict
+from nltk.util import AbstractLazySequence
+
+class LazyCorpusArticles(AbstractLazySequence):
+	"""
+	Sequence of one value per article, e.g. each article's word tokens, in
+	which an article is downloaded and stored only once iteration reaches it.
+	WikipediaCorpusReader.words() concatenates one of these, so the first words
+	arrive as soon as the first article is in, and articles past where the
+	caller stops are never downloaded. Articles without a valid article on
+	Wikipedia contribute an empty value.
+	"""
+	def __init__(self, fileids, load, article, empty=()):
+		"""
+		:param fileids: the articles in the sequence, in order
+		:type fileids: list of str
+
+		:param load: function that downloads and stores articles as they are reached, yielding 
+					 each fileid (None for an invalid article) in order once it is stored
+		:type load: function
+
+		:param article: function that returns the value for a stored article's fileid
+		:type article: function
+
+		:param empty: the value for an invalid article
+		"""
+		self._fileids = list(fileids)
+		self._load = load
+		self._article = article
+		self._empty = empty
+		self._values = {}							# index -> value, for articles already reached
+
+	def __len__(self):
+		return len(self._fileids)
+
+	def iterate_from(self, start):
+		index = start
+		while index < len(self._fileids) and index in self._values:
+			yield self._values[index]
+			index += 1
+		if index >= len(self._fileids):
+			return
+		for fileid in self._load(self._fileids[index:]):
+			if index not in self._values:
+				self._values[index] = self._article(fileid) if fileid is not None else self._empty
+			yield self._values[index]
+			index += 1
+
+class MappedCorpusText(object):
+	"""
+	Read-only view over the concatenated text of several stored articles,
+	returned by WikipediaCorpusReader.raw(mapped=True). Articles stored as
+	files are memory-mapped rather than read, so slicing and searching a
+	corpus never builds one string holding all of its text. Given a load
+	function, articles are downloaded as the view first needs them:
+	searching streams through them in order, while len() and slicing
+	download every article first. Example usage:
+
+		>>> text = reader.raw(mapped=True)
+		>>> len(text)
+		>>> text[1000:1100]
+		>>> for fileid, match in text.finditer(r'search engines?'):
+		... 	print fileid, match.group(0)
+	"""
+	MAX_OPEN_BUFFERS = 16
+
+	def __init__(self, store, fileids, load=None):
+		"""
+		:param store: the corpus store holding the articles
+		:type store: DirectoryStore or ArchiveStore
+
+		:param fileids: the articles in the view, in order
+		:type fileids: list of str
+
+		:param load: function that downloads and stores articles as they are reached, yielding 
+					 each fileid (None for an invalid article) in order once it is stored, or 
+					 None if every article is already stored
+		:type load: function
+		"""
+		self._store = store
+		self._requested = list(fileids)
+		self._load = load
+		self._fileids = None
+		self._buffers = OrderedDict()			# index -> open buffer, least recently used first
+		if load is None:
+			self._set_fileids(self._requested)
+
+	def _set_fileids(self, fileids):
+		"""
+		Measures the stored articles once they are all known.
+		"""
+		self._fileids = list(fileids)
+		self._sizes = [self._store.size(fileid) for fileid in self._fileids]
+		self._starts = []						# Offset of the first character of each article
+		length = 0
+		for size in self._sizes:
+			self._starts.append(length)
+			length += size
+		self._length = length
+
+	def _loaded(self):
+		"""
+		Downloads every article not stored yet, the first time it is needed.
+		"""
+		if self._fileids is None:
+			self._set_fileids(fileid for fileid in self._load(self._requested) if fileid is not None)
+
+	def _buffer(self, index):
+		"""
+		Returns the buffer of the article at the given index, mapping it if
+		needed and letting go of the least recently used buffer if too many are
+		open. Buffers are never closed explicitly: a map is unmapped once nothing
+		(including match objects handed out by finditer) refers to it any more.
+		"""
+		buffer = self._buffers.pop(index, None)
+		if buffer is None:
+			buffer = self._store.buffer(self._fileids[index])
+			if len(self._buffers) >= self.MAX_OPEN_BUFFERS:
+				self._buffers.popitem(last=False)
+		self._buffers[index] = buffer
+		return buffer
+
+	def fileids(self):
+		"""
+		Returns the fileids of the articles in the view.
+
+		:rtype: list of str
+		"""
+		self._loaded()
+		return list(self._fileids)
+
+	def buffers(self):
+		"""
+		Returns each article's fileid with a buffer over its text (a memory map for
+		articles stored as files).
+
+		:return: generator of (fileid, buffer) pairs
+		:rtype: generator of tuples (str, mmap.mmap or str)
+		"""
+		if self._fileids is None:						# Stream through the articles as they are stored
+			fileids = []
+			for fileid in self._load(self._requested):
+				if fileid is not None:
+					fileids.append(fileid)
+					yield fileid, self._store.buffer(fileid)
+			if self._fileids is None:
+				self._set_fileids(fileids)
+			return
+		for index, fileid in enumerate(self._fileids):
+			yield fileid, self._buffer(index)
+
+	def __len__(self):
+		self._loaded()
+		return self._length
+
+	def _slice(self, start, stop):
+		"""
+		Copies the characters between two offsets, reading only the articles
+		they fall in.
+		"""
+		pieces = []
+		index = max(bisect_right(self._starts, start) - 1, 0)
+		while start < stop and index < len(self._fileids):
+			article_start = self._starts[index]
+			article_end = article_start + self._sizes[index]
+			if article_end > start:
+				buffer = self._buffer(index)
+				pieces.append(buffer[start - article_start:min(stop, article_end) - article_start])
+				start = min(stop, article_end)
+			index += 1
+		return ''.join(pieces)
+
+	def __getitem__(self, key):
+		self._loaded()
+		if isinstance(key, slice):
+			start, stop, step = key.indices(self._length)
+			if step == 1:
+				return self._slice(start, stop)
+			if step > 0:
+				return self._slice(start, stop)[::step]
+			return self._slice(stop + 1, start + 1)[::-1][::-step]
+		if key < 0:
+			key += self._length
+		if not 0 <= key < self._length:
+			raise IndexError('MappedCorpusText index out of range')
+		return self._slice(key, key + 1)
+
+	def finditer(self, pattern, flags=0):
+		"""
+		Searches every article for a regular expression, one buffer at a time.
+		Matches do not span the boundary between two articles.
+
+		:param pattern: a regular expression
+		:type pattern: str or compiled pattern
+
+		:return: generator of each matching article's fileid paired with the match
+		:rtype: generator of tuples (str, re.MatchObject)
+		"""
+		if isinstance(pattern, basestring):
+			pattern = re.compile(pattern, flags)
+		for fileid, buffer in self.buffers():
+			for match in pattern.finditer(buffer):
+				yield fileid, match
+
+	def search(self, pattern, flags=0):
+		"""
+		Returns the first match of a regular expression as (fileid, match), or None.
+		"""
+		for result in self.finditer(pattern, flags):
+			return result
+		return None
+
+	def findall(self, pattern, flags=0):
+		"""
+		Returns the text of every match of a regular expression.
+
+		:rtype: list of str
+		"""
+		return [match.group(0) for fileid, match in self.finditer(pattern, flags)]
+
+	def close(self):
+		"""
+		Lets go of every open buffer.
+		"""
+		self._buffers.clear()
+
+	def __str__(self):
+		self._loaded()
+		return self._slice(0, self._length)
+
+	def __repr__(self):
+		if self._fileids is None:
+			return '<MappedCorpusText: %d articles, not all downloaded>' % len(self._requested)
+		return '<MappedCorpusText: %d articles, %d characters>' % (len(self._fileids), self._length)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+if __name__ == '__main__':
+	print "Try running main.py instead"
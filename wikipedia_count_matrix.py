@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+wikipedia_count_matrix.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+"""
+
+import string
+
+# NumPy is only needed by the matrix backend, SciPy only to keep the matrix sparse
+try:
+	import numpy
+except ImportError:
+	numpy = None
+try:
+	from scipy import sparse
+except ImportError:
+	sparse = None
+
+class WordTopicMatrix(object):
+	"""
+	Word x topic count matrix behind WikipediaTopicAnalyzer(backend='matrix').
+	Rows are words, columns are topics. Totals over all topics or a subset of
+	topics are column sums, and the top n words are picked with a partial
+	partition instead of sorting every word. Stored as a SciPy CSC matrix
+	when SciPy is installed and as a dense NumPy array otherwise.
+
+	Rows follow the iteration order of the count dictionary the matrix is built
+	from, so words with equal counts come back in the same order as the
+	dictionary implementation returns them. Example usage:
+
+		>>> matrix = WordTopicMatrix(word_topic_count, topics)
+		>>> matrix.most_frequent(10, topics=['Gmail', 'YouTube'])
+	"""
+	def __init__(self, word_topic_count, topics):
+		"""
+		:param word_topic_count: occurrences of each word in each topic
+		:type word_topic_count: dict of str -> dict of str -> int
+
+		:param topics: the topics, in column order
+		:type topics: list of str
+
+		:raise ImportError: If NumPy is not installed
+		"""
+		if numpy is None:
+			raise ImportError('The matrix backend of WikipediaTopicAnalyzer needs NumPy')
+		self._words = list(word_topic_count)						# row -> word
+		self._topics = list(topics)									# column -> topic
+		self._topic_columns = dict((topic, column) for column, topic in enumerate(self._topics))
+
+		rows, columns, counts = [], [], []
+		for row, word in enumerate(self._words):
+			for topic, count in word_topic_count[word].iteritems():
+				rows.append(row)
+				columns.append(self._topic_columns[topic])
+				counts.append(count)
+		shape = (len(self._words), len(self._topics))
+		if sparse is not None:
+			self._counts = sparse.csc_matrix((numpy.array(counts, dtype=numpy.int64),
+											  (numpy.array(rows, dtype=numpy.int64), numpy.array(columns, dtype=numpy.int64))),
+											 shape=shape)
+		else:
+			self._counts = numpy.zeros(shape, dtype=numpy.int64)
+			self._counts[rows, columns] = counts
+		self._totals = self._column_sum(range(len(self._topics)))
+		self._capitalized = numpy.array([word[0] in string.uppercase for word in self._words], dtype=bool)
+
+	def _column_sum(self, columns):
+		"""
+		Returns each word's total count over the given columns.
+
+		:rtype: numpy.ndarray
+		"""
+		if not columns:
+			return numpy.zeros(len(self._words), dtype=numpy.int64)
+		return numpy.asarray(self._counts[:, columns].sum(axis=1), dtype=numpy.int64).ravel()
+
+	def totals(self, topics=None):
+		"""
+		Returns each word's count over the given topics, in row order.
+
+		:param topics: a topic name, a list of topic names, or None for every topic
+		:type topics: str or list of str
+
+		:rtype: numpy.ndarray
+		"""
+		if topics is None:
+			return self._totals
+		if isinstance(topics, basestring):
+			topics = [topics]
+		return self._column_sum(sorted(set(self._topic_columns[topic] for topic in topics if topic in self._topic_columns)))
+
+	def _top(self, counts, rows, n):
+		"""
+		Returns the rows with the n highest counts, highest first and equal
+		counts in row order, as sorted(...)[:n] would.
+		"""
+		candidates = counts[rows]
+		if 0 < n < len(candidates):
+			threshold = numpy.partition(candidates, len(candidates) - n)[len(candidates) - n]
+			kept = numpy.flatnonzero(candidates >= threshold)		# Every row that can make the top n
+		else:
+			kept = numpy.arange(len(candidates))
+		ranked = kept[numpy.argsort(-candidates[kept], kind='mergesort')]
+		return rows[ranked][:n]
+
+	def most_frequent(self, n=10, topics=None, terms=False):
+		"""
+		Returns the n words with the highest counts over the given topics.
+
+		:param n: the number of words to return
+		:type n: int
+
+		:param topics: a topic name, a list of topic names, or None for every topic
+		:type topics: str or list of str
+
+		:param terms: only consider capitalized words that appear more than twice
+		:type terms: bool
+
+		:return: list of (word, count) pairs, most frequent first
+		:rtype: list of (str, int)
+		"""
+		counts = self.totals(topics)
+		if terms:
+			rows = numpy.flatnonzero(self._capitalized & (counts > 2))
+		else:
+			rows = numpy.arange(len(self._words))
+		return [(self._words[row], int(counts[row])) for row in self._top(counts, rows, n)]
+
+if __name__ == '__main__':
+	print "Try running main.py instead"
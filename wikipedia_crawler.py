@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+wikipedia_crawler.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+"""
+
+import heapq
+from collections import OrderedDict, defaultdict
+from itertools import count
+
+CRAWL_SECTION_PREFIX = 'Crawl_Depth_'
+
+class _FrontierEntry(object):
+	"""
+	A page waiting to be crawled.
+	"""
+	__slots__ = ('fileid', 'url', 'depth', 'links', 'sequence', 'owner')
+
+	def __init__(self, fileid, url, depth, sequence, owner):
+		self.fileid = fileid
+		self.url = url
+		self.depth = depth				# Fewest links between a root page and this page
+		self.links = 0					# Times the page was linked to from pages crawled so far
+		self.sequence = sequence		# Order the page was found in
+		self.owner = owner				# Reader of the topic that found the page first
+
+	def priority(self):
+		return (self.depth, -self.links, self.sequence)
+
+class CrawlFrontier(object):
+	"""
+	Pages waiting to be crawled, shallowest first and, among pages at the same
+	depth, the most linked to first. Every page is identified by its fileid and
+	is handed out at most once, however many pages or topics link to it. Finding
+	another link to a waiting page raises its priority. Example usage:
+
+		>>> frontier = CrawlFrontier()
+		>>> frontier.add('Gmail.txt', 'http://en.wikipedia.org/wiki/Gmail', 1, reader)
+		>>> entry = frontier.pop()
+	"""
+	def __init__(self):
+		self._heap = []								# (priority, fileid), possibly outdated
+		self._waiting = {}							# fileid -> _FrontierEntry
+		self._visited = set()						# fileids already handed out
+		self._sequence = count()
+
+	def add(self, fileid, url, depth, owner):
+		"""
+		Records a link to a page, queueing the page if it hasn't been seen before.
+
+		:param fileid: the page's fileid
+		:type fileid: str
+
+		:param url: the page's URL
+		:type url: str
+
+		:param depth: the number of links between a root page and the page
+		:type depth: int
+
+		:param owner: the reader whose crawl found the link
+		:type owner: WikipediaCorpusReader
+
+		:return: whether the page is waiting to be crawled
+		:rtype: bool
+		"""
+		if fileid in self._visited:
+			return False
+		entry = self._waiting.get(fileid)
+		if entry is None:
+			entry = self._waiting[fileid] = _FrontierEntry(fileid, url, depth, next(self._sequence), owner)
+		entry.depth = min(entry.depth, depth)
+		entry.links += 1
+		heapq.heappush(self._heap, (entry.priority(), fileid))	# Older heap items for the page go stale
+		return True
+
+	def mark_visited(self, fileid):
+		"""
+		Makes sure a page is never handed out, e.g. a root page.
+		"""
+		self._waiting.pop(fileid, None)
+		self._visited.add(fileid)
+
+	def is_visited(self, fileid):
+		return fileid in self._visited
+
+	def pop(self):
+		"""
+		Returns the page with the highest priority, or None if no page is waiting.
+
+		:rtype: _FrontierEntry
+		"""
+		while self._heap:
+			priority, fileid = heapq.heappop(self._heap)
+			entry = self._waiting.get(fileid)
+			if entry is not None and entry.priority() == priority:
+				del self._waiting[fileid]
+				self._visited.add(fileid)
+				return entry
+		return None
+
+	def __len__(self):
+		return len(self._waiting)
+
+class WikipediaCrawler(object):
+	"""
+	Crawls the neighborhoods of one or more WikipediaCorpusReader topics in one
+	job: the articles linked from each root page (depth 1), the articles those
+	link to (depth 2), and so on down to max_depth. All readers share one frontier,
+	so a page linked from several topics is fetched once. Pages are stored in the
+	corpus of the topic that reached them first and copied into the other topics'
+	corpora rather than fetched again. The links found in every crawled page are
+	recorded in the owning corpus's manifest, so stored articles are never
+	downloaded again just to follow their links.
+
+	Pages reached at depth 2 and below are listed in a new section of each
+	reader, Crawl_Depth_2, Crawl_Depth_3, etc. Example usage:
+
+		>>> crawler = WikipediaCrawler([google_reader, yahoo_reader], max_depth=2, max_pages=1000)
+		>>> new_fileids = crawler.crawl()					# root topic -> fileids added
+	"""
+	def __init__(self, readers, max_depth=2, max_pages=None, batch_size=32):
+		"""
+		:param readers: the readers whose topics to crawl
+		:type readers: list of WikipediaCorpusReader
+
+		:param max_depth: how many links away from the root pages to go
+		:type max_depth: int
+
+		:param max_pages: the most pages to visit, fetched or reused, or None for no limit
+		:type max_pages: int
+
+		:param batch_size: how many pages to hand to the readers' fetchers at a time
+		:type batch_size: int
+		"""
+		self._readers = list(readers)
+		self._max_depth = max_depth
+		self._max_pages = max_pages
+		self._batch_size = batch_size
+		self._frontier = CrawlFrontier()
+		self._stored = {}							# fileid -> reader whose store holds the article
+		self._invalid = set()						# fileids of pages without a valid article
+		self._found = defaultdict(lambda: defaultdict(OrderedDict))	# reader -> depth -> fileid -> URL
+		self._neighborhoods = defaultdict(set)		# fileid -> readers whose topics reach the page
+		self._visited_pages = 0
+
+	def _next_batch(self):
+		"""
+		Pops the next pages to crawl, within the page budget.
+		"""
+		batch = []
+		while len(batch) < self._batch_size and \
+			  (self._max_pages is None or self._visited_pages < self._max_pages):
+			entry = self._frontier.pop()
+			if entry is None:
+				break
+			batch.append(entry)
+			self._visited_pages += 1
+		return batch
+
+	def _follow(self, entry, links):
+		"""
+		Queues the links found in a crawled page, unless it is as deep as the crawl goes.
+		"""
+		if links is None or entry.depth >= self._max_depth:
+			return
+		readers = self._neighborhoods[entry.fileid]
+		for url in links:
+			fileid = entry.owner._fileid_for_url(url)
+			self._frontier.add(fileid, url, entry.depth + 1, entry.owner)
+			self._neighborhoods[fileid].update(readers)
+			for reader in readers:									# Every topic that reaches the page gets its links
+				self._found[reader][entry.depth + 1].setdefault(fileid, url)
+
+	def _crawl_batch(self, batch):
+		"""
+		Follows the links of stored articles and fetches, stores and follows the rest.
+		"""
+		to_fetch = defaultdict(list)
+		for entry in batch:
+			reader = entry.owner
+			links = reader._manifest.article_links(entry.fileid)
+			if not reader._store.has(entry.fileid) and entry.fileid not in reader._invalid_fileids:
+				reader._stored_from_cache(entry.fileid)				# Saves cleaning it; its links still need the page
+			if reader._store.has(entry.fileid) and (links is not None or entry.depth >= self._max_depth):
+				self._stored[entry.fileid] = reader				# Reused without downloading it again
+				self._follow(entry, links)
+			elif entry.fileid in reader._invalid_fileids:
+				self._invalid.add(entry.fileid)
+			else:
+				to_fetch[reader].append(entry)
+
+		for reader, entries in to_fetch.iteritems():
+			fetched_pages = reader._fetcher.fetch_all([entry.url for entry in entries])
+			for entry, (url, html) in zip(entries, fetched_pages):
+				if reader._generate_file_for_url(url, html) is None:
+					if entry.fileid in reader._invalid_fileids:		# Not if the download failed
+						self._invalid.add(entry.fileid)
+					continue
+				self._stored[entry.fileid] = reader
+				self._follow(entry, reader._manifest.article_links(entry.fileid))	# Recorded when it was stored
+
+	def _share_articles(self, reader, fileids):
+		"""
+		Copies articles stored in other topics' corpora into a reader's corpus, and
+		tells it about pages other topics found to have no valid article.
+		"""
+		for fileid in fileids:
+			owner = self._stored.get(fileid)
+			if owner is not None and owner is not reader and not reader._store.has(fileid):
+				if not reader._stored_from_cache(fileid):
+					reader._store_article(fileid, owner._store.read(fileid))
+			elif fileid in self._invalid and fileid not in reader._invalid_fileids:
+				reader._mark_invalid(fileid)
+
+	def crawl(self):
+		"""
+		Runs the crawl until every page within max_depth was visited or the page
+		budget is spent.
+
+		:return: dictionary of root topic -> fileids of the articles added to its Crawl_Depth_* sections
+		:rtype: dict of str -> list of str
+		"""
+		for reader in self._readers:
+			self._frontier.mark_visited(reader._root_fileid)
+		for reader in self._readers:
+			for section in reader._urls_by_section:
+				if section.startswith(CRAWL_SECTION_PREFIX):		# Sections of an earlier crawl
+					continue
+				for url in reader._urls_by_section[section]:
+					fileid = reader._fileid_for_url(url)
+					self._frontier.add(fileid, url, 1, reader)
+					self._neighborhoods[fileid].add(reader)
+
+		batch = self._next_batch()
+		while batch:
+			self._crawl_batch(batch)
+			batch = self._next_batch()
+
+		added = {}
+		for reader in self._readers:
+			# Pages of the root page's sections stay where they are; every other page is listed
+			# once, in the section of the shallowest depth it was found at
+			listed = set([reader._root_fileid])
+			for section, urls in reader._urls_by_section.iteritems():
+				if not section.startswith(CRAWL_SECTION_PREFIX):
+					listed.update(reader._fileid_for_url(url) for url in urls)
+			self._share_articles(reader, listed)
+			
+			added_fileids = []
+			for depth in sorted(self._found[reader]):
+				found = [(fileid, url) for fileid, url in self._found[reader][depth].iteritems()
+						 if fileid in self._stored and fileid not in listed]
+				if found:
+					self._share_articles(reader, [fileid for fileid, url in found])
+					reader._add_section(CRAWL_SECTION_PREFIX + str(depth), [url for fileid, url in found])
+					added_fileids.extend(fileid for fileid, url in found)
+					listed.update(fileid for fileid, url in found)
+			reader._save_manifest()
+			added[reader.root_topic()] = added_fileids
+		return added
+
+if __name__ == '__main__':
+	print "Try running main.py instead"
@@ -0,0 +1,540 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+wikipedia_fetcher.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+"""
+
+import os
+import re
+import time
+import urllib
+import zlib
+import socket
+import httplib
+import threading
+import subprocess
+from collections import OrderedDict
+from itertools import islice
+from Queue import Queue, Empty
+
+def host_for_url(url):
+	"""
+	Returns the host portion of a URL, with or without a scheme.
+	E.g. "http://en.wikipedia.org/wiki/Google" becomes "en.wikipedia.org"
+
+	:param url: a full URL
+	:type url: str
+
+	:return: the host name of the URL
+	:rtype: str
+	"""
+	return re.match(r'(?:\w+://)?([^/]*)', url).group(1).lower()
+
+def split_url(url):
+	"""
+	Splits a URL into its scheme, host and path. URLs without a scheme
+	(e.g. "en.wikipedia.org/wiki/Google") are treated as plain HTTP.
+	
+	:param url: a full URL
+	:type url: str
+	
+	:return: the scheme, host (including any port) and path of the URL
+	:rtype: tuple (str, str, str)
+	"""
+	scheme, host, path = re.match(r'(?:(\w+)://)?([^/]*)(.*)', url).groups()
+	return (scheme or 'http').lower(), host.lower(), path or '/'
+
+class WgetFetcher(object):
+	"""
+	Fetch backend that shells out to wget (a command line tool) once per page.
+	Kept as a fallback for environments where the in-process client can't be used.
+	"""
+	BASE_WGET_COMMAND = r'wget --random-wait -qO- '
+	
+	def __init__(self, base_url=None, command=BASE_WGET_COMMAND):
+		"""
+		:param base_url: scheme and host to send every request to instead of the URL's own, e.g. "http://localhost:8000"
+		:type base_url: str
+		
+		:param command: the wget command line that the escaped URL is appended to
+		:type command: str
+		"""
+		self._base_url = base_url.rstrip('/') if base_url else None
+		self._command = command
+	
+	def fetch(self, url):
+		"""
+		Downloads and returns the HTML content from the given URL.
+		
+		:param url: a full URL to a Wikipedia page
+		:type url: str
+		
+		:return: HTML source from the URL, or None if it could not be downloaded
+		:rtype: str
+		"""
+		if self._base_url is not None:
+			url = self._base_url + split_url(url)[2]
+		escaped_url = re.sub(r'([()])', r'\\\1', url)						# Escape all parentheses
+		try:
+			return subprocess.check_output(self._command + escaped_url, shell=True)
+		except subprocess.CalledProcessError:
+			return None
+
+class FixtureFetcher(object):
+	"""
+	Fetch backend that serves pages saved in a directory instead of downloading 
+	them, so a reader can be built offline and the same way every time, e.g. by 
+	benchmarks.py. The page for http://en.wikipedia.org/wiki/Gmail is read from 
+	<directory>/Gmail.html; a URL without a saved page is served as an empty page,
+	which, like Wikipedia's page for a missing article, isn't a valid article.
+	Example usage:
+	
+		>>> fetcher = FixtureFetcher('fixtures')
+		>>> fetcher.save('http://en.wikipedia.org/wiki/Gmail', html)
+		>>> reader = WikipediaCorpusReader('google', fetch_backend=fetcher)
+	"""
+	def __init__(self, directory, latency=0.0):
+		"""
+		:param directory: the directory holding the saved pages
+		:type directory: str
+		
+		:param latency: seconds to wait before serving each page, to stand in for the network
+		:type latency: float
+		"""
+		self._directory = directory
+		self._latency = latency
+		self._lock = threading.Lock()
+		self.requests = 0									# Pages asked for, saved or not
+	
+	def path(self, url):
+		"""
+		Returns the path of the file a URL's page is saved in.
+		
+		:param url: a full URL to a Wikipedia page
+		:type url: str
+		
+		:rtype: str
+		"""
+		title = split_url(url)[2].split('/wiki/', 1)[-1]
+		return os.path.join(self._directory, urllib.quote(title, safe='') + '.html')
+	
+	def save(self, url, html):
+		"""
+		Saves a page to be served for a URL.
+		
+		:param url: a full URL to a Wikipedia page
+		:type url: str
+		
+		:param html: the page's HTML source
+		:type html: str
+		"""
+		if not os.path.exists(self._directory):
+			os.makedirs(self._directory)
+		page_file = open(self.path(url), 'w')
+		try:
+			page_file.write(html)
+		finally:
+			page_file.close()
+	
+	def fetch(self, url):
+		"""
+		Returns the page saved for the given URL.
+		
+		:param url: a full URL to a Wikipedia page
+		:type url: str
+		
+		:return: HTML source saved for the URL, or an empty string if there is none
+		:rtype: str
+		"""
+		with self._lock:
+			self.requests += 1
+		if self._latency:
+			time.sleep(self._latency)
+		try:
+			page_file = open(self.path(url))
+		except IOError:
+			return ''
+		try:
+			return page_file.read()
+		finally:
+			page_file.close()
+
+class HTTPFetcher(object):
+	"""
+	In-process fetch backend that keeps a persistent keep-alive connection
+	open to each host (one per thread, so it can be shared by a 
+	ConcurrentFetcher). Supports gzip transfer encoding, conditional 
+	requests against recently fetched pages, timeouts and retries. Example usage:
+		
+		>>> fetcher = HTTPFetcher(base_url="http://localhost:8000", timeout=5, retries=3)
+		>>> html = fetcher.fetch("http://en.wikipedia.org/wiki/Google")
+	"""
+	USER_AGENT = 'WikipediaCorpusReader/1.0 (+https://github.com/aehrmann/WikiCorpusReader)'
+	MAX_REDIRECTS = 5
+	MISSING_PAGE_STATUSES = (404, 410)				# Answers saying the page isn't there, not failures
+	
+	def __init__(self, base_url=None, timeout=10, retries=2, backoff=0.5, gzip=True, conditional=True, cache_size=256):
+		"""
+		:param base_url: scheme and host to send every request to instead of the URL's own, e.g. "http://localhost:8000"
+		:type base_url: str
+		
+		:param timeout: seconds to wait on a socket before giving up on an attempt
+		:type timeout: float
+		
+		:param retries: how many times to retry a request after a connection error or server error
+		:type retries: int
+		
+		:param backoff: seconds to wait before the first retry, doubled after each retry
+		:type backoff: float
+		
+		:param gzip: whether to ask the server for gzip-compressed responses
+		:type gzip: bool
+		
+		:param conditional: whether to revalidate recently fetched pages with ETag/If-Modified-Since
+		:type conditional: bool
+		
+		:param cache_size: how many recently fetched pages to keep for conditional requests
+		:type cache_size: int
+		"""
+		self._base_url = split_url(base_url)[:2] if base_url else None
+		self._timeout = timeout
+		self._retries = retries
+		self._backoff = backoff
+		self._gzip = gzip
+		self._conditional = conditional and cache_size > 0
+		self._cache_size = cache_size
+		self._validated = OrderedDict()				# url -> (etag, last modified, body), least recently used first
+		self._validated_lock = threading.Lock()
+		self._local = threading.local()				# Each thread keeps its own connections
+	
+	def _connection(self, scheme, host):
+		"""
+		Returns this thread's open connection to the given host, creating it if needed.
+		"""
+		connections = self._local.__dict__.setdefault('connections', {})
+		key = (scheme, host)
+		if key not in connections:
+			if scheme == 'https':
+				connections[key] = httplib.HTTPSConnection(host, timeout=self._timeout)
+			else:
+				connections[key] = httplib.HTTPConnection(host, timeout=self._timeout)
+		return connections[key]
+	
+	def _drop_connection(self, scheme, host):
+		"""
+		Closes and forgets this thread's connection to the given host, e.g. after
+		the server dropped a keep-alive connection.
+		"""
+		connections = self._local.__dict__.setdefault('connections', {})
+		connection = connections.pop((scheme, host), None)
+		if connection is not None:
+			connection.close()
+	
+	def _cached(self, url):
+		"""
+		Returns the (etag, last modified, body) stored for the URL, or None.
+		"""
+		self._validated_lock.acquire()
+		try:
+			entry = self._validated.pop(url, None)
+			if entry is not None:
+				self._validated[url] = entry				# Mark as most recently used
+			return entry
+		finally:
+			self._validated_lock.release()
+	
+	def _remember(self, url, etag, last_modified, body):
+		"""
+		Stores the validators for a fetched page, evicting the least recently used page if full.
+		"""
+		self._validated_lock.acquire()
+		try:
+			self._validated.pop(url, None)
+			self._validated[url] = (etag, last_modified, body)
+			while len(self._validated) > self._cache_size:
+				self._validated.popitem(last=False)
+		finally:
+			self._validated_lock.release()
+	
+	def _request(self, scheme, host, path, headers):
+		"""
+		Sends a single GET over a kept-alive connection, reconnecting and retrying
+		on connection errors and 5xx responses.
+		
+		:return: the response status, headers and decoded body
+		:rtype: tuple (int, httplib.HTTPMessage, str)
+		"""
+		delay = self._backoff
+		for attempt in range(self._retries + 1):
+			try:
+				connection = self._connection(scheme, host)
+				connection.request('GET', path, headers=headers)
+				response = connection.getresponse()
+				body = response.read()					# The body must be read before the connection can be reused
+				if response.status < 500 or attempt == self._retries:
+					if body and response.getheader('content-encoding', '').lower() == 'gzip':
+						body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+					if response.will_close:
+						self._drop_connection(scheme, host)
+					return response.status, response.msg, body
+			except (httplib.HTTPException, socket.error, zlib.error):
+				self._drop_connection(scheme, host)
+				if attempt == self._retries:
+					raise
+			time.sleep(delay)
+			delay *= 2
+	
+	def fetch(self, url):
+		"""
+		Downloads and returns the HTML content from the given URL, following redirects.
+		
+		:param url: a full URL to a Wikipedia page
+		:type url: str
+		
+		:return: HTML source from the URL (for a missing page, the body of the 404 or 410 response, 
+				 which is not a valid article), or None if it could not be downloaded
+		:rtype: str
+		"""
+		scheme, host, path = split_url(url)
+		if self._base_url is not None:
+			scheme, host = self._base_url
+		for redirect in range(self.MAX_REDIRECTS + 1):
+			target = '%s://%s%s' % (scheme, host, path)
+			headers = {'User-Agent': self.USER_AGENT}
+			if self._gzip:
+				headers['Accept-Encoding'] = 'gzip'
+			cached = self._cached(target) if self._conditional else None
+			if cached is not None:
+				etag, last_modified, cached_body = cached
+				if etag:
+					headers['If-None-Match'] = etag
+				if last_modified:
+					headers['If-Modified-Since'] = last_modified
+			try:
+				status, response_headers, body = self._request(scheme, host, path, headers)
+			except (httplib.HTTPException, socket.error, zlib.error):
+				return None
+			
+			if status == 304 and cached is not None:	# Not modified, so reuse the page fetched earlier
+				return cached_body
+			if status in (301, 302, 303, 307, 308):
+				location = response_headers.getheader('location')
+				if not location:
+					return None
+				if location.startswith('/'):
+					path = location
+				else:
+					scheme, host, path = split_url(location)
+				continue
+			if status in self.MISSING_PAGE_STATUSES:
+				return body
+			if status != 200:
+				return None
+			if self._conditional:
+				etag = response_headers.getheader('etag')
+				last_modified = response_headers.getheader('last-modified')
+				if etag or last_modified:
+					self._remember(target, etag, last_modified, body)
+			return body
+		return None
+
+class HostRateLimiter(object):
+	"""
+	Spaces out requests made to the same host so that no more than
+	`rate` requests per second are started against it. Safe to share
+	between threads.
+	"""
+	def __init__(self, rate=None):
+		"""
+		:param rate: maximum number of requests per second per host, or None for no limit
+		:type rate: float
+		"""
+		self._interval = 1.0 / rate if rate else 0.0
+		self._next_slot = {}
+		self._lock = threading.Lock()
+
+	def wait(self, url):
+		"""
+		Blocks until a request to the host of the given URL is allowed.
+
+		:param url: the URL about to be requested
+		:type url: str
+		"""
+		if not self._interval:
+			return
+		host = host_for_url(url)
+		self._lock.acquire()
+		try:
+			now = time.time()
+			slot = max(now, self._next_slot.get(host, now))		# The earliest time this request may start
+			self._next_slot[host] = slot + self._interval			# Reserve the slot after it for the next caller
+		finally:
+			self._lock.release()
+		if slot > now:
+			time.sleep(slot - now)
+
+class ConcurrentFetcher(object):
+	"""
+	Downloads many URLs at once using a bounded pool of worker threads,
+	respecting a per-host rate limit. Example usage:
+
+		>>> fetcher = ConcurrentFetcher(fetch, workers=8, rate_limit=10)
+		>>> for url, html in fetcher.fetch_all(urls):
+		... 	print url, len(html)
+	"""
+	def __init__(self, fetch, workers=4, rate_limit=None):
+		"""
+		:param fetch: callable that returns the HTML for a URL, or None on failure
+		:type fetch: function
+
+		:param workers: maximum number of downloads in flight at once
+		:type workers: int
+
+		:param rate_limit: maximum requests per second per host, or None for no limit
+		:type rate_limit: float
+		"""
+		if workers < 1:
+			raise ValueError('workers must be at least 1')
+		self._fetch = fetch
+		self._workers = workers
+		self._limiter = HostRateLimiter(rate_limit)
+
+	def _fetch_one(self, url):
+		"""
+		Waits for the rate limiter then downloads a single URL. Any error
+		raised by the fetch function is treated as a failed download.
+		"""
+		self._limiter.wait(url)
+		try:
+			return self._fetch(url)
+		except Exception:
+			return None
+
+	def _worker(self, tasks, results, process=None):
+		"""
+		Pulls (index, url) pairs off the task queue until it sees the
+		sentinel and pushes (index, url, html) onto the results queue, html
+		being replaced by what process returns for it if process is given.
+		"""
+		while True:
+			task = tasks.get()
+			if task is None:
+				return
+			index, url = task
+			html = self._fetch_one(url)
+			if process is not None:
+				try:
+					html = process(url, html)
+				except Exception:
+					html = None									# Treated like a failed download
+			results.put((index, url, html))
+
+	def fetch_all(self, urls):
+		"""
+		Downloads every URL given, several at a time, and yields the results
+		in the same order as the URLs were given. Results are yielded as soon
+		as they and all results before them are available.
+
+		:param urls: a collection of URLs
+		:type urls: list of str
+
+		:return: generator of (url, html) pairs, html being None if the download failed
+		:rtype: generator of tuples (str, str)
+		"""
+		urls = list(urls)
+		if not urls:
+			return
+		if self._workers == 1 or len(urls) == 1:
+			for url in urls:
+				yield url, self._fetch_one(url)
+			return
+
+		tasks, results = Queue(), Queue()
+		for index, url in enumerate(urls):
+			tasks.put((index, url))
+		threads = []
+		for i in range(min(self._workers, len(urls))):
+			tasks.put(None)											# One sentinel per worker
+			thread = threading.Thread(target=self._worker, args=(tasks, results))
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+
+		finished = {}
+		next_index = 0
+		while next_index < len(urls):
+			index, url, html = results.get()
+			finished[index] = (url, html)
+			while next_index in finished:							# Release every result that is now in order
+				yield finished.pop(next_index)
+				next_index += 1
+		for thread in threads:
+			thread.join()
+
+	def fetch_ahead(self, urls, read_ahead=None, process=None):
+		"""
+		Downloads URLs in the background no more than read_ahead results ahead of 
+		the caller, and yields the results in the same order as the URLs were given.
+		URLs are taken from the iterable only as they are about to be downloaded,
+		so a caller that stops early never causes the rest to be downloaded.
+
+		:param urls: URLs, possibly produced lazily
+		:type urls: iterable of str
+
+		:param read_ahead: the most downloads started but not yet taken by the caller 
+						   (defaults to the number of workers)
+		:type read_ahead: int
+
+		:param process: called with each URL and its HTML (None if the download failed) on the 
+						thread that downloaded it, e.g. to have the page cleaned; what it returns
+						is yielded in place of the HTML, None if it raises
+		:type process: function
+
+		:return: generator of (url, html) pairs, html being None if the download failed
+		:rtype: generator of tuples (str, str)
+		"""
+		read_ahead = max(read_ahead or self._workers, 1)
+		urls = iter(urls)
+		tasks, results = Queue(), Queue()
+		threads = []
+		queued = 0
+		
+		def queue_next():
+			for url in islice(urls, 1):
+				tasks.put((queued, url))
+				if len(threads) < min(self._workers, read_ahead):		# Threads start with the first URLs
+					thread = threading.Thread(target=self._worker, args=(tasks, results, process))
+					thread.daemon = True
+					thread.start()
+					threads.append(thread)
+				return True
+			return False
+		
+		try:
+			while queued < read_ahead and queue_next():
+				queued += 1
+			finished = {}
+			next_index = 0
+			while next_index < queued:
+				index, url, html = results.get()
+				finished[index] = (url, html)
+				while next_index in finished:
+					result = finished.pop(next_index)
+					next_index += 1
+					if queue_next():								# Keep read_ahead downloads going
+						queued += 1
+					yield result
+		finally:
+			try:
+				while True:
+					tasks.get_nowait()								# Drop downloads that never started
+			except Empty:
+				pass
+			for thread in threads:
+				tasks.put(None)
+
+if __name__ == '__main__':
+	print "Try running main.py instead"
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+wikipedia_html_cleaner.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+"""
+
+import re
+import string
+from collections import OrderedDict
+
+BODY_CONTENT_START = '<!-- bodyContent -->'
+BODY_CONTENT_END = '<!-- /bodyContent -->'
+INTRODUCTION_START = '<!-- bodycontent -->'
+INTRODUCTION_END = '<h2>Contents</h2>'
+SECTION_HEADLINE = '<span class="mw-headline"'
+WIKIPEDIA_URL = 'http://en.wikipedia.org'
+
+# Every piece of markup in the body is matched by this one pattern, so the HTML is only
+# scanned once. Alternatives are tried in order at each '<', which keeps the boilerplate,
+# script and comment rules ahead of the generic tag rule. Script and style are spelled
+# out case-insensitively by hand because re.IGNORECASE stops the regular expression
+# engine from skipping ahead to the next '<'.
+_HTML_MARKUP = re.compile(r"""
+	<(?:
+		(?P<remove>
+			!--\ tagline\ -->[^\n]*?<!--\ /tagline\ -->				# "From Wikipedia, the free encyclopedia"
+		  | !--\ subtitle\ -->[^\n]*?<!--\ /jumpto\ -->				# Redirect notice and jump links
+		  | h2>Contents</h2>										# The word "Contents"
+		  | [Ss][Cc][Rr][Ii][Pp][Tt].*?>.*?</[Ss][Cc][Rr][Ii][Pp][Tt]>	# Inline JavaScript
+		  | [Ss][Tt][Yy][Ll][Ee].*?>.*?</[Ss][Tt][Yy][Ll][Ee]>			# Inline CSS
+		  | !--.*?-->\n?											# HTML comments
+		)
+	  | .*?>														# Any other tag becomes a space
+	)
+	""", re.DOTALL | re.VERBOSE)
+
+_CATEGORIES_LINK = re.compile(r'<a href="/wiki/Special:Categories"')
+_DISAMBIGUATION_CATEGORY = re.compile(r'/wiki/Category:Disambiguation_pages')
+
+_ARTICLE_LINK = re.compile(r'href="(/wiki/[^\'" >]+)"')
+_NON_ARTICLE_PAGE = re.compile(r'/wiki/(?:Wikipedia|File|Special|Help|Category|Talk|Portal|Main_Page|Template|Template_talk)')
+_HEADING_TAG = re.compile(r'<h\d>')
+_SECTION_TITLE = re.compile(r' id="(?:.*?)">(.*?)</span></h\d>', re.DOTALL)
+
+_STRAY_URL = re.compile(r'http.*? ')
+_ESCAPE_CHARACTER = re.compile(r'&#\d{3};|&\w+?;')
+_CITATION = re.compile(r'\[ (\d+|\w+) \]')
+_SENTENCE_PERIOD = re.compile(r'.\. ')
+_STRAY_COMMA = re.compile(r' ,|, ')
+_STRAY_SLASH = re.compile(r' /|/ ')
+_COMMONS_BOILERPLATE = re.compile(r'Wikimedia Commons.*?pages')
+
+_NON_ASCII = ''.join(chr(i) for i in range(128, 256))
+_PUNCTUATION_TO_SPACE = string.maketrans('\'()^"#:\\;', ' ' * 9)
+
+def _markup_replacement(match):
+	"""
+	Boilerplate, scripts and comments disappear entirely; other tags
+	are replaced with a space so the words around them stay apart.
+	"""
+	if match.group('remove') is not None:
+		return ''
+	return ' '
+
+def _collapse_whitespace(text):
+	"""
+	Replaces every run of two or more whitespace characters with a single space.
+	Equivalent to re.sub(r'\s{2,}', ' ', text), but splits in C instead of
+	matching at every space.
+	"""
+	collapsed = ' '.join(text.split())
+	if not collapsed:
+		return ' ' if text else ''
+	if text[0].isspace():
+		collapsed = ' ' + collapsed
+	if text[-1].isspace():
+		collapsed = collapsed + ' '
+	return collapsed
+
+def is_valid_article(html):
+	"""
+	Checks whether the article contains standard Wikipedia page or invalid text
+	
+	:param html: HTML source
+	:type html: str
+	
+	:return: Boolean indicating whether the article's page is valid
+	:rtype: Boolean
+	"""
+	if _CATEGORIES_LINK.search(html):
+		if not _DISAMBIGUATION_CATEGORY.search(html):
+			return True
+	return False
+
+def _article_urls(paths):
+	"""
+	Turns /wiki/ paths into absolute URLs, in order and without duplicates, 
+	leaving out links to Wikipedia's own pages (help, categories, files, etc.)
+	"""
+	urls = []
+	seen = set()
+	for path in paths:
+		if path not in seen:
+			seen.add(path)
+			if not _NON_ARTICLE_PAGE.search(path):
+				urls.append(WIKIPEDIA_URL + path)
+	return urls
+
+def article_links(html):
+	"""
+	Returns the links to other Wikipedia articles within the HTML source, in
+	the order they first appear.
+	
+	:param html: HTML source
+	:type html: str
+	
+	:return: absolute URLs of the linked articles
+	:rtype: list of str
+	"""
+	return _article_urls(_ARTICLE_LINK.findall(html))
+
+def root_page_sections(html):
+	"""
+	Collects the article links in each section of a root page in a single pass 
+	over its HTML, jumping from one headline or heading tag to the next with 
+	string and literal-prefix searches rather than matching at every character. 
+	The introduction is everything between the bodycontent marker and the table 
+	of contents; every other section runs from its headline to the next heading 
+	tag. When two sections have the same title, the links of the last one are kept.
+	
+	:param html: HTML source of a Wikipedia article
+	:type html: str
+	
+	:return: section titles (as they appear on the page, 'Introduction' first) -> 
+			 absolute URLs of the articles linked from that section, in order
+	:rtype: OrderedDict of str -> list of str
+	"""
+	sections = OrderedDict()
+	start = html.find(INTRODUCTION_START)
+	end = html.find(INTRODUCTION_END, start) if start != -1 else -1
+	if end != -1:
+		sections['Introduction'] = _article_urls(_ARTICLE_LINK.findall(html, start + len(INTRODUCTION_START), end))
+	else:
+		sections['Introduction'] = []
+	
+	headline = html.find(SECTION_HEADLINE)
+	while headline != -1:
+		start = headline + len(SECTION_HEADLINE)
+		heading = _HEADING_TAG.search(html, start)						# The section ends at the next heading
+		if heading is None:
+			break
+		title = _SECTION_TITLE.search(html, start, heading.start())
+		if title is not None:
+			sections[title.group(1)] = _article_urls(_ARTICLE_LINK.findall(html, start, heading.start()))
+		headline = html.find(SECTION_HEADLINE, heading.end())
+	return sections
+
+def body_content(html):
+	"""
+	Extracts the article's body HTML, i.e. everything between the first
+	bodyContent marker and the last closing marker.
+
+	:param html: HTML source from a Wikipedia article
+	:type html: str
+
+	:return: the HTML of the article's body
+	:rtype: str
+
+	:raise ValueError: If the HTML has no body content markers
+	"""
+	start = html.find(BODY_CONTENT_START)
+	end = html.rfind(BODY_CONTENT_END)
+	if start == -1 or end < start + len(BODY_CONTENT_START):
+		raise ValueError('HTML has no body content')
+	return html[start + len(BODY_CONTENT_START):end]
+
+def body_links(html):
+	"""
+	Returns the links to other Wikipedia articles within the article's body, or
+	within the whole HTML source if it has no body content markers.
+	
+	:param html: HTML source from a Wikipedia article
+	:type html: str
+	
+	:return: absolute URLs of the linked articles, in order
+	:rtype: list of str
+	"""
+	try:
+		return article_links(body_content(html))
+	except ValueError:
+		return article_links(html)
+
+def clean_article_html(html):
+	"""
+	Extracts the article's body HTML and throroughly sanitizes it. Produces the
+	same text as the original sequence of regular expressions, but tokenizes the
+	markup in a single pass and handles character-level rules with translation
+	tables, so the remaining passes only run over the (much shorter) plain text.
+
+	:param html: HTML source from a Wikipedia article
+	:type html: str
+
+	:return: Cleaned body content from the given HTML source
+	:rtype: str
+	"""
+	body = _HTML_MARKUP.sub(_markup_replacement, body_content(html))	# Strip boilerplate, tags and comments
+	body = body.replace('&nbsp;', ' ')
+	text = ' '.join(body.split()[10:])										# Collapse all whitespace into spaces
+																			# and remove the 1st 9 words
+	text = _STRAY_URL.sub('', text, 16)										# Remove stray URLS (the first 16, as existing corpora were built)
+	text = _ESCAPE_CHARACTER.sub('', text)									# Remove escape characters
+	if isinstance(text, unicode):											# Remove all Unicode characters
+		text = text.encode('ascii', 'ignore')
+	else:
+		text = text.translate(None, _NON_ASCII)
+	text = _CITATION.sub('', text)											# Remove edit button text and citations
+	text = text.translate(_PUNCTUATION_TO_SPACE)							# Remove extraneous punctuation
+	text = text.replace(' .', ' ')											# Remove stray periods
+	text = _SENTENCE_PERIOD.sub(' ', text)									# Remove sentence-ending periods
+	text = _STRAY_COMMA.sub(' ', text)										# Remove stray commas
+	text = _STRAY_SLASH.sub(' ', text)										# Remove stray slashes
+	text = _collapse_whitespace(text)										# Replace large whitespace left from previous removals
+	text = _COMMONS_BOILERPLATE.sub('', text)								# Remove more boilerplate
+	return text
+
+def clean_fetched_page(fetched_page):
+	"""
+	Checks and cleans one downloaded page and collects the links in its body. Takes
+	and returns a single tuple so it can be handed to multiprocessing.Pool.imap as 
+	the work for a cleaning process.
+	
+	:param fetched_page: a URL and its HTML source (None if the download failed)
+	:type fetched_page: tuple (str, str)
+	
+	:return: the URL, its cleaned text and its body's links, or None in place of the 
+			 text and links if the page is not a valid article
+	:rtype: tuple (str, str, list of str)
+	"""
+	url, html = fetched_page
+	if html is None or not is_valid_article(html):
+		return url, None, None
+	return url, clean_article_html(html), body_links(html)
+
+if __name__ == '__main__':
+	print "Try running main.py instead"
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+wikipedia_instrumentation.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+"""
+
+import time
+import threading
+from bisect import bisect_right
+from functools import wraps
+
+# Upper bounds, in seconds, of the latency histogram's buckets; the last bucket has no bound
+HISTOGRAM_BOUNDS = (0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+HISTOGRAM_LABELS = ('<100us', '<1ms', '<10ms', '<100ms', '<1s', '<10s', '>=10s')
+
+class Hooks(object):
+	"""
+	The callbacks a WikipediaCorpusReader or WikipediaTopicAnalyzer reports its
+	work to. A hook is any callable taking four arguments:
+
+		hook(stage, seconds, size, detail)
+
+	stage names what happened: 'fetch', 'clean', 'store', 'tokenize' and 'parse_root'
+	for the reader, 'analyze.add', 'analyze.rank' and 'query.<method name>' for the
+	analyzer, and '<cache>.hit' / '<cache>.miss' for the reader's article and token
+	caches and the analyzer's query cache ('article_cache', 'token_cache', 'query_cache').
+	seconds is how long it took, or None for events that are only counted. size is
+	the bytes downloaded, cleaned, written or tokenized (0 if it doesn't apply), and
+	detail the URL, fileid, query name or None.
+
+	Hooks are called on the thread doing the work; downloads run on several
+	threads at once. With no hook attached, the hot paths skip timing altogether.
+	"""
+	def __init__(self, hooks=()):
+		"""
+		:param hooks: the hooks to attach
+		:type hooks: iterable of callables
+		"""
+		self._hooks = tuple(hooks)					# Replaced, never changed, so emit() needs no lock
+
+	def add(self, hook):
+		"""
+		Attaches a hook.
+		"""
+		self._hooks = self._hooks + (hook,)
+
+	def remove(self, hook):
+		"""
+		Detaches a hook.
+
+		:raise ValueError: If the hook isn't attached
+		"""
+		if hook not in self._hooks:
+			raise ValueError('Hook is not attached: %r' % (hook,))
+		hooks = list(self._hooks)
+		hooks.remove(hook)
+		self._hooks = tuple(hooks)
+
+	def emit(self, stage, seconds=None, size=0, detail=None):
+		"""
+		Reports an event to every attached hook.
+		"""
+		for hook in self._hooks:
+			hook(stage, seconds, size, detail)
+
+	def __nonzero__(self):
+		return bool(self._hooks)
+
+	def __len__(self):
+		return len(self._hooks)
+
+	def __iter__(self):
+		return iter(self._hooks)
+
+def timed(stage):
+	"""
+	Decorates a method of an object with a Hooks instance in self._hooks,
+	reporting how long each call takes as the given stage. Calls made with no
+	hook attached are not timed.
+
+	:param stage: the stage reported
+	:type stage: str
+	"""
+	def decorate(method):
+		@wraps(method)
+		def timed_method(self, *args, **kwargs):
+			if not self._hooks._hooks:			# Checked directly, calling __nonzero__ costs more
+				return method(self, *args, **kwargs)
+			started = time.time()
+			try:
+				return method(self, *args, **kwargs)
+			finally:
+				self._hooks.emit(stage, time.time() - started)
+		return timed_method
+	return decorate
+
+class _StageStats(object):
+	"""
+	What an InstrumentationSummary has recorded for one stage.
+	"""
+	__slots__ = ('count', 'seconds', 'max_seconds', 'size', 'histogram')
+
+	def __init__(self):
+		self.count = 0
+		self.seconds = 0.0
+		self.max_seconds = 0.0
+		self.size = 0
+		self.histogram = [0] * len(HISTOGRAM_LABELS)
+
+class InstrumentationSummary(object):
+	"""
+	A hook that keeps, for every stage, the number of events, their total and
+	longest duration, a latency histogram and the bytes involved, and works out
+	the caches' hit rates. Example usage:
+
+		>>> summary = InstrumentationSummary()
+		>>> reader = WikipediaCorpusReader("Google", hooks=[summary])
+		>>> analyzer = WikipediaTopicAnalyzer(reader.topic_tagged_words(), hooks=[summary])
+		>>> print summary.report()
+	"""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._stages = {}							# stage -> _StageStats
+
+	def __call__(self, stage, seconds, size, detail):
+		with self._lock:
+			stats = self._stages.get(stage)
+			if stats is None:
+				stats = self._stages[stage] = _StageStats()
+			stats.count += 1
+			stats.size += size
+			if seconds is not None:
+				stats.seconds += seconds
+				if seconds > stats.max_seconds:
+					stats.max_seconds = seconds
+				stats.histogram[bisect_right(HISTOGRAM_BOUNDS, seconds)] += 1
+
+	def reset(self):
+		"""
+		Forgets every event recorded so far.
+		"""
+		with self._lock:
+			self._stages = {}
+
+	def stages(self):
+		"""
+		Returns what was recorded for each stage: the number of events ('count'),
+		their total and longest duration in seconds ('seconds', 'max_seconds'),
+		the bytes involved ('bytes') and the number of events in each bucket of
+		the latency histogram ('histogram', labelled as in HISTOGRAM_LABELS).
+
+		:rtype: dict of str -> dict
+		"""
+		with self._lock:
+			return dict((stage, {'count': stats.count, 'seconds': stats.seconds,
+								 'max_seconds': stats.max_seconds, 'bytes': stats.size,
+								 'histogram': list(stats.histogram)})
+						for stage, stats in self._stages.iteritems())
+
+	def hit_rates(self):
+		"""
+		Returns the share of lookups that were hits for every cache that reported
+		a '<cache>.hit' or '<cache>.miss' event.
+
+		:rtype: dict of str -> float
+		"""
+		stages = self.stages()
+		caches = set(stage.rsplit('.', 1)[0] for stage in stages if stage.endswith(('.hit', '.miss')))
+		rates = {}
+		for cache in caches:
+			hits = stages.get(cache + '.hit', {}).get('count', 0)
+			misses = stages.get(cache + '.miss', {}).get('count', 0)
+			rates[cache] = float(hits) / (hits + misses)
+		return rates
+
+	def report(self):
+		"""
+		Returns a table of every stage and the caches' hit rates, for printing.
+
+		:rtype: str
+		"""
+		stages = self.stages()
+		lines = ['%-36s %8s %10s %10s %10s %12s' % ('stage', 'count', 'total', 'mean', 'max', 'bytes')]
+		for stage in sorted(stages):
+			stats = stages[stage]
+			timed_events = sum(stats['histogram'])		# Counted-only events have no duration
+			if timed_events:
+				timings = '%9.3fs %8.2fms %8.2fms' % (stats['seconds'], 1000 * stats['seconds'] / timed_events,
+													 1000 * stats['max_seconds'])
+			else:
+				timings = '%10s %10s %10s' % ('-', '-', '-')
+			lines.append('%-36s %8d %s %12d' % (stage, stats['count'], timings, stats['bytes']))
+			if timed_events:
+				lines.append('%-36s %s' % ('', '  '.join('%s:%d' % (label, events) for label, events
+														  in zip(HISTOGRAM_LABELS, stats['histogram']) if events)))
+		for cache, rate in sorted(self.hit_rates().iteritems()):
+			lines.append('%s hit rate: %.1f%%' % (cache, 100 * rate))
+		return '\n'.join(lines)
+
+	def __repr__(self):
+		return '<InstrumentationSummary: %d stages>' % len(self._stages)
+
+if __name__ == '__main__':
+	print "Try running main.py instead"
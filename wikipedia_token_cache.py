@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+wikipedia_token_cache.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+"""
+
+import os
+import zlib
+from array import array
+from nltk.util import LazyMap
+
+try:
+	import fcntl
+except ImportError:									# No file locks on Windows
+	fcntl = None
+
+class TokenCache(object):
+	"""
+	On-disk cache of tokenized articles. Every distinct token is interned
+	once in a shared vocabulary file (one token per line, the line number
+	being the token's id) and each article is saved as an array of token
+	ids, tagged with the hash of the text it was tokenized from and the
+	length and checksum of the vocabulary its ids refer to. Reading an
+	article's tokens back is then a single sequential read of integers
+	rather than a regular expression pass over its text.
+
+	Several caches, in one process or several, can share a directory: new
+	tokens are numbered while holding a lock on the vocabulary file, after
+	reading the tokens other caches appended since. Example usage:
+
+		>>> cache = TokenCache("Google/.tokens")
+		>>> token_ids = cache.token_ids("Gmail.txt", content_hash)
+		>>> if token_ids is None:
+		... 	token_ids = cache.store("Gmail.txt", content_hash, tokenizer.tokenize(text))
+		>>> words = cache.tokens(token_ids)
+	"""
+	VOCABULARY_FILENAME = 'vocabulary'
+	TOKEN_IDS_SUFFIX = '.ids'
+
+	def __init__(self, directory):
+		"""
+		:param directory: the directory holding the vocabulary and token id files
+		:type directory: str
+		"""
+		self._directory = directory
+		self._vocabulary_path = os.path.join(directory, self.VOCABULARY_FILENAME)
+		self._vocabulary = None					# token id -> token, loaded on first use
+		self._token_ids = None					# token -> token id
+		self._vocabulary_bytes = 0				# Length of the part of the vocabulary file read so far
+		self._checksums = array('L')			# n -> checksum of the first n + 1 tokens, computed on demand
+
+	def _load_vocabulary(self):
+		"""
+		Reads the vocabulary file the first time it is needed.
+		"""
+		if self._vocabulary is not None:
+			return
+		self._vocabulary = []
+		self._token_ids = {}
+		if os.path.isfile(self._vocabulary_path):
+			vocabulary_file = open(self._vocabulary_path, 'rb')
+			try:
+				self._read_new_tokens(vocabulary_file)
+			finally:
+				vocabulary_file.close()
+
+	def _read_new_tokens(self, vocabulary_file):
+		"""
+		Adds the tokens appended to the vocabulary file since it was last read.
+		A line still being written by another cache is left for the next read.
+		"""
+		vocabulary_file.seek(self._vocabulary_bytes)
+		appended = vocabulary_file.read()
+		end = appended.rfind('\n') + 1
+		if not end:
+			return
+		known_ids = self._token_ids
+		for token in appended[:end].split('\n')[:-1]:
+			known_ids.setdefault(token, len(self._vocabulary))
+			self._vocabulary.append(token)
+		self._vocabulary_bytes += end
+
+	def _refresh_vocabulary(self):
+		"""
+		Reads the tokens other caches appended to the vocabulary file since it was loaded.
+		"""
+		self._load_vocabulary()
+		if os.path.isfile(self._vocabulary_path):
+			vocabulary_file = open(self._vocabulary_path, 'rb')
+			try:
+				self._read_new_tokens(vocabulary_file)
+			finally:
+				vocabulary_file.close()
+
+	def _checksum(self, length):
+		"""
+		Returns the checksum of the first length tokens of the vocabulary.
+
+		:rtype: int
+		"""
+		checksums = self._checksums
+		checksum = checksums[-1] if checksums else 0
+		for token in self._vocabulary[len(checksums):length]:
+			checksum = zlib.crc32(token + '\n', checksum) & 0xffffffff
+			checksums.append(checksum)
+		return checksums[length - 1] if length else 0
+
+	def _path(self, fileid):
+		return os.path.join(self._directory, fileid + self.TOKEN_IDS_SUFFIX)
+
+	def _read_record(self, fileid):
+		"""
+		Returns an article's saved header line and token ids, or None if it has none.
+
+		:rtype: str
+		"""
+		try:
+			ids_file = open(self._path(fileid), 'rb')
+		except IOError:
+			return None
+		try:
+			return ids_file.read()
+		finally:
+			ids_file.close()
+
+	def _write_record(self, fileid, record):
+		"""
+		Saves an article's header line and token ids, replacing any saved before.
+		Called while holding the lock on the vocabulary file.
+		"""
+		ids_file = open(self._path(fileid), 'wb')
+		try:
+			ids_file.write(record)
+		finally:
+			ids_file.close()
+
+	def token_ids(self, fileid, content_hash):
+		"""
+		Returns the cached token ids of an article, or None if the article hasn't
+		been cached or was cached from different text.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:param content_hash: hash of the article's current text
+		:type content_hash: str
+
+		:return: the article's token ids
+		:rtype: array('I')
+		"""
+		record = self._read_record(fileid)
+		if record is None:
+			return None
+		header_end = record.find('\n') + 1
+		header = record[:header_end].split()
+		if len(header) != 3 or header[0] != content_hash:
+			return None
+		length, checksum = int(header[1]), int(header[2], 16)
+		self._load_vocabulary()
+		if length > len(self._vocabulary):				# Tokens appended by another cache since loading,
+			self._refresh_vocabulary()					# or a vocabulary that was lost or cut short
+		if length > len(self._vocabulary) or self._checksum(length) != checksum:
+			return None
+		token_ids = array('I')
+		token_ids.fromstring(record[header_end:])
+		return token_ids
+
+	def store(self, fileid, content_hash, tokens):
+		"""
+		Interns an article's tokens and saves them as token ids.
+
+		:param fileid: the article's fileid
+		:type fileid: str
+
+		:param content_hash: hash of the text the tokens came from
+		:type content_hash: str
+
+		:param tokens: the article's tokens
+		:type tokens: list of str
+
+		:return: the article's token ids
+		:rtype: array('I')
+		"""
+		self._load_vocabulary()
+		if not os.path.exists(self._directory):
+			os.makedirs(self._directory)
+		vocabulary_file = open(self._vocabulary_path, 'a+b')
+		try:
+			if fcntl is not None:
+				fcntl.flock(vocabulary_file, fcntl.LOCK_EX)		# Released when the file is closed
+			self._read_new_tokens(vocabulary_file)			# So new ids don't collide with other caches'
+			vocabulary, known_ids = self._vocabulary, self._token_ids
+			new_tokens = []
+			token_ids = array('I')
+			for token in tokens:
+				token_id = known_ids.get(token)
+				if token_id is None:
+					token_id = known_ids[token] = len(vocabulary)
+					vocabulary.append(token)
+					new_tokens.append(token)
+				token_ids.append(token_id)
+
+			if new_tokens:								# The vocabulary is only ever appended to, so
+				appended = '\n'.join(new_tokens) + '\n'		# ids already on disk stay valid
+				vocabulary_file.seek(0, os.SEEK_END)
+				vocabulary_file.write(appended)
+				vocabulary_file.flush()
+				self._vocabulary_bytes += len(appended)
+			length = len(vocabulary)
+			header = '%s %d %08x\n' % (content_hash, length, self._checksum(length))
+			self._write_record(fileid, header + token_ids.tostring())
+		finally:
+			vocabulary_file.close()
+		return token_ids
+
+	def tokens(self, token_ids):
+		"""
+		Returns a lazy sequence of the tokens for the given token ids.
+
+		:param token_ids: token ids returned by token_ids() or store()
+		:type token_ids: array('I')
+
+		:rtype: nltk.util.LazyMap
+		"""
+		self._load_vocabulary()
+		return LazyMap(self._vocabulary.__getitem__, token_ids)
+
+	def vocabulary(self):
+		"""
+		Returns the list of interned tokens, indexed by token id.
+
+		:rtype: list of str
+		"""
+		self._load_vocabulary()
+		return self._vocabulary
+
+class ArchiveTokenCache(TokenCache):
+	"""
+	A TokenCache for corpora kept in an archive (see ArchiveStore), which 
+	appends every article's token ids to one file rather than saving them 
+	in a file per article, plus an index of where each article's ids start. 
+	When an article was saved more than once, the last index line wins.
+	"""
+	ARCHIVE_FILENAME = 'token_ids.archive'
+	INDEX_FILENAME = 'token_ids.index'
+
+	def __init__(self, directory):
+		"""
+		:param directory: the directory holding the vocabulary and token id files
+		:type directory: str
+		"""
+		TokenCache.__init__(self, directory)
+		self._archive_path = os.path.join(directory, self.ARCHIVE_FILENAME)
+		self._index_path = os.path.join(directory, self.INDEX_FILENAME)
+		self._index = {}						# fileid -> (offset, size) of its record
+		self._index_bytes = 0					# Length of the part of the index file read so far
+
+	def _read_new_index_lines(self):
+		"""
+		Adds the index lines appended since the index was last read, by this
+		cache or others. A line still being written is left for the next read.
+		"""
+		if not os.path.isfile(self._index_path):
+			return
+		index_file = open(self._index_path, 'rb')
+		try:
+			index_file.seek(self._index_bytes)
+			appended = index_file.read()
+		finally:
+			index_file.close()
+		end = appended.rfind('\n') + 1
+		for line in appended[:end].split('\n')[:-1]:
+			fields = line.split('\t')
+			if len(fields) == 3:
+				self._index[fields[0]] = (int(fields[1]), int(fields[2]))
+		self._index_bytes += end
+
+	def _read_record(self, fileid):
+		entry = self._index.get(fileid)
+		if entry is None:
+			self._read_new_index_lines()				# Maybe saved by another cache since
+			entry = self._index.get(fileid)
+			if entry is None:
+				return None
+		try:
+			archive = open(self._archive_path, 'rb')
+		except IOError:
+			return None
+		try:
+			archive.seek(entry[0])
+			record = archive.read(entry[1])
+		finally:
+			archive.close()
+		return record if len(record) == entry[1] else None
+
+	def _write_record(self, fileid, record):
+		archive = open(self._archive_path, 'ab')
+		try:
+			archive.seek(0, os.SEEK_END)
+			offset = archive.tell()
+			archive.write(record)
+		finally:
+			archive.close()
+		index_file = open(self._index_path, 'ab')		# Written after the record, so an index line
+		try:											# never points at missing ids
+			index_file.write('%s\t%d\t%d\n' % (fileid, offset, len(record)))
+		finally:
+			index_file.close()
+		self._index[fileid] = (offset, len(record))
+
+TOKEN_CACHES = {
+	'directory': TokenCache,
+	'archive': ArchiveTokenCache,
+}
+
+if __name__ == '__main__':
+	print "Try running main.py instead"
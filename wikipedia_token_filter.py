@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+wikipedia_token_filter.py
+
+Created by Ari Ehrmann.
+Email address: <ari.ehrmann@gmail.com>
+"""
+
+import re
+import string
+from nltk.corpus import stopwords as stopwords_corpus
+
+# Words WikipediaTopicAnalyzer excludes besides stopwords: punctuation and 'ISBN'
+EXTRA_EXCLUDED_WORDS = frozenset([",",".","/","-","?","=","[","]","+","/?","%","isbn"])
+
+# The characters re's \w matches without the UNICODE flag
+_WORD_CHARACTERS = frozenset(string.ascii_letters + string.digits + '_')
+
+_stopword_sets = {}
+
+def stopword_set(language='english'):
+	"""
+	Returns NLTK's stopwords for a language, read from the stopwords corpus
+	only the first time they are asked for.
+
+	:param language: the language of the stopwords
+	:type language: str
+
+	:rtype: frozenset of str
+	"""
+	stopwords = _stopword_sets.get(language)
+	if stopwords is None:
+		stopwords = _stopword_sets[language] = frozenset(stopwords_corpus.words(language))
+	return stopwords
+
+class TokenFilter(object):
+	"""
+	Decides which word tokens are counted, by default the way WikipediaTopicAnalyzer
+	always has: stopwords, punctuation and 'ISBN' (compared in lowercase) are
+	excluded, and so are tokens consisting of a single letter or single number.
+	Optional rules also bound the length of tokens or require them to match a
+	regular expression.
+
+	Decisions are remembered, so a token seen before costs one dictionary lookup
+	however many rules apply. Once max_decisions are remembered they are all
+	forgotten, so a filter shared by every reader in a process doesn't grow with
+	every token it ever sees; frequent tokens are remembered again straight away.
+	A filter can be shared by several analyzers and handed to worker processes
+	(the remembered decisions are not pickled). Example usage:
+
+		>>> token_filter = TokenFilter(min_length=3, pattern=r'[A-Za-z][A-Za-z\-]*')
+		>>> token_filter('Google')
+		True
+		>>> token_filter.filter(['the', 'search', 'engine', ',', '2004'])
+		['search', 'engine']
+	"""
+	DEFAULT_MAX_DECISIONS = 100000
+
+	def __init__(self, stopwords=None, language='english', exclude_single_characters=True,
+				 min_length=None, max_length=None, pattern=None, max_decisions=DEFAULT_MAX_DECISIONS):
+		"""
+		:param stopwords: words to exclude, compared in lowercase (defaults to NLTK's stopwords
+						  for the language plus EXTRA_EXCLUDED_WORDS)
+		:type stopwords: collection of str
+
+		:param language: the language of NLTK's stopwords, if stopwords is not given
+		:type language: str
+
+		:param exclude_single_characters: whether to exclude tokens consisting of a single letter,
+										  digit or underscore
+		:type exclude_single_characters: bool
+
+		:param min_length: the fewest characters a token may have
+		:type min_length: int
+
+		:param max_length: the most characters a token may have
+		:type max_length: int
+
+		:param pattern: a regular expression every token must match in full
+		:type pattern: str
+
+		:param max_decisions: the most decisions remembered at once
+		:type max_decisions: int
+		"""
+		if stopwords is None:
+			stopwords = stopword_set(language) | EXTRA_EXCLUDED_WORDS
+		self._stopwords = frozenset(word.lower() for word in stopwords)
+		self._exclude_single_characters = exclude_single_characters
+		self._min_length = min_length
+		self._max_length = max_length
+		self._pattern = pattern
+		self._full_match = re.compile(r'(?:%s)\Z' % pattern).match if pattern is not None else None
+		self._max_decisions = max_decisions
+		self._decisions = {}							# token -> whether it is kept
+
+	def _keeps(self, token):
+		"""
+		Applies every rule to a token that hasn't been seen before.
+		"""
+		if token.lower() in self._stopwords:
+			return False
+		if self._exclude_single_characters and len(token) == 1 and token in _WORD_CHARACTERS:
+			return False
+		if self._min_length is not None and len(token) < self._min_length:
+			return False
+		if self._max_length is not None and len(token) > self._max_length:
+			return False
+		if self._full_match is not None and not self._full_match(token):
+			return False
+		return True
+
+	def _decide(self, token):
+		"""
+		Applies every rule to a token that hasn't been seen before and remembers the
+		decision, first forgetting every decision if max_decisions are remembered.
+		"""
+		decisions = self._decisions
+		if len(decisions) >= self._max_decisions:
+			decisions.clear()							# Cleared in place: filter() holds a reference
+		keep = decisions[token] = self._keeps(token)
+		return keep
+
+	def __call__(self, token):
+		"""
+		Checks whether a token is kept.
+
+		:param token: a word token
+		:type token: str
+
+		:rtype: bool
+		"""
+		keep = self._decisions.get(token)
+		if keep is None:
+			keep = self._decide(token)
+		return keep
+
+	def filter(self, tokens):
+		"""
+		Returns the tokens that are kept, in order.
+
+		:param tokens: word tokens
+		:type tokens: iterable of str
+
+		:rtype: list of str
+		"""
+		decisions = self._decisions
+		kept = []
+		for token in tokens:
+			keep = decisions.get(token)
+			if keep is None:
+				keep = self._decide(token)
+			if keep:
+				kept.append(token)
+		return kept
+
+	def filter_tagged(self, tagged_words):
+		"""
+		Yields the (word, topic) pairs whose word is kept, in order.
+
+		:param tagged_words: topic-tagged words
+		:type tagged_words: iterable of tuples (str, str)
+
+		:rtype: generator of tuples (str, str)
+		"""
+		decisions = self._decisions
+		for tagged_word in tagged_words:
+			keep = decisions.get(tagged_word[0])
+			if keep is None:
+				keep = self._decide(tagged_word[0])
+			if keep:
+				yield tagged_word
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['_decisions'] = {}						# Rebuilt by whoever unpickles the filter
+		state['_full_match'] = None						# Bound methods of patterns don't pickle
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		if self._pattern is not None:
+			self._full_match = re.compile(r'(?:%s)\Z' % self._pattern).match
+
+	def __repr__(self):
+		return '<TokenFilter: %d stopwords>' % len(self._stopwords)
+
+if __name__ == '__main__':
+	print "Try running main.py instead"
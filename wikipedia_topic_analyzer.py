@@ -7,11 +7,31 @@ Created by Ari Ehrmann.
 Email address: <ari.ehrmann@gmail.com>
 """
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from operator import itemgetter
-from nltk.corpus import stopwords
-import re
+from itertools import izip
+from array import array
+import heapq
+import sys
 import string
+import time
+from wikipedia_count_matrix import WordTopicMatrix
+from wikipedia_compact_counts import CompactWordTopicCounts
+from wikipedia_token_filter import TokenFilter
+from wikipedia_instrumentation import Hooks, timed
+
+_default_token_filter = None
+
+def default_token_filter():
+	"""
+	Returns the token filter shared by every analyzer that isn't given one.
+	
+	:rtype: TokenFilter
+	"""
+	global _default_token_filter
+	if _default_token_filter is None:
+		_default_token_filter = TokenFilter()
+	return _default_token_filter
 
 class WikipediaTopicAnalyzer(object):
 	"""
@@ -19,38 +39,537 @@ class WikipediaTopicAnalyzer(object):
 	analysis with a given set of Wikipedia articles. Made for use 
 	with WikipediaCorpusReader.
 	"""
-	def __init__(self, topic_tagged_words):
+	BACKENDS = ('dict', 'matrix')
+	
+	STORAGES = ('dict', 'compact')
+	
+	BATCH_QUERIES = ('most_frequent_words', 'most_frequent_words_by_topic', 'most_frequent_terms',
+					 'most_frequent_terms_by_topic', 'topics_containing_words', 'common_words_between_topics')
+	
+	SNAPSHOT_MAGIC = 'WikipediaTopicAnalyzer'
+	SNAPSHOT_VERSION = 1
+	
+	DEFAULT_QUERY_CACHE_SIZE = 256
+	
+	def __init__(self, topic_tagged_words=(), backend='dict', token_filter=None, hooks=None, 
+				 query_cache_size=DEFAULT_QUERY_CACHE_SIZE, storage='dict'):
 		"""
 		Constructs a new instance of WikipediaTopicAnalyzer. Filters out stop words.
 		Example usage:
 			
 			>>> analyzer = WikipediaTopicAnalyzer(<list of tagged words>)
+			>>> analyzer = WikipediaTopicAnalyzer(reader.topic_tagged_words())
 			
-		:param topic_tagged_words: 	a list of topic-tagged-words in the format 
-									of (word, topic).
+		:param topic_tagged_words: 	a list or generator of topic-tagged-words in the format 
+									of (word, topic). It is read once and never held in memory.
+		
+		:param backend: how most_frequent_* queries are answered: 'dict' scans the word counts, 
+						'matrix' (requires NumPy, and uses SciPy if installed) keeps a word x topic 
+						count matrix and answers them with vectorized sums (see wikipedia_count_matrix.py)
+		:type backend: str
+		
+		:param token_filter: decides which words are counted (defaults to a filter shared by every 
+							 analyzer, see wikipedia_token_filter.py)
+		:type token_filter: TokenFilter
+		
+		:param hooks: callbacks told how long counting, ranking and each query take, e.g. an 
+					  InstrumentationSummary (see wikipedia_instrumentation.py); more can be 
+					  attached with add_hook()
+		:type hooks: list of callables
+		
+		:param query_cache_size: how many query results to keep, dropping the least recently used
+								 first, or 0 to answer every query from the counts; the results are 
+								 forgotten whenever the counts change
+		:type query_cache_size: int
+		
+		:param storage: how the counts are kept: 'dict' (a dictionary of topic -> count per word) or
+						'compact' (arrays of topic ids and counts per word, several times smaller for 
+						large corpora, see wikipedia_compact_counts.py)
+		:type storage: str
+		
+		:raise ValueError: If the backend is not one of BACKENDS or the storage not one of STORAGES
 		"""
+		if backend not in self.BACKENDS:
+			raise ValueError('Unknown backend %r, expected one of %s' % (backend, ', '.join(self.BACKENDS)))
+		if storage not in self.STORAGES:
+			raise ValueError('Unknown storage %r, expected one of %s' % (storage, ', '.join(self.STORAGES)))
+		self._backend = backend
+		self._storage = storage
+		self._hooks = Hooks(hooks or ())
 		
-		# Filters out the words given by removing stopwords, punctuation, words consisting of a single 
+		# Words are filtered by removing stopwords, punctuation, words consisting of a single 
 		# letter or single number, and the word 'ISBN'
-		excluded = set(stopwords.words('english')).union(set([",",".","/","-","?","=","[","]","+","/?","%","isbn"]))
-		
-		tagged_words = [tag_pair for tag_pair in topic_tagged_words \
-		 							if tag_pair[0].lower() not in excluded and \
-		 							not re.match(r'^\d$', tag_pair[0]) and \
-		 							not re.match(r'^\w$', tag_pair[0])]		
+		self._token_filter = token_filter if token_filter is not None else default_token_filter()
 		
-		self._word_topic_count = defaultdict(dict)
 		self._topics = []
 		
-		# Create dictionary of word -> dictionary of topic -> count for word
-		for word, topic in tagged_words:
-			if not word in self._word_topic_count:
-				self._word_topic_count[word] = defaultdict(int)
-			self._word_topic_count[word][topic] += 1
+		# Inverted index over ids: every word and topic is numbered in order of first appearance.
+		# Each word's topics are kept as a bitset (bit i set if the word appears in topic i) and
+		# each topic's words as a set of word ids, so queries only touch the postings involved
+		self._words = []							# word id -> word
+		self._word_ids = {}							# word -> word id
+		self._topic_names = []						# topic id -> topic (None once the topic is removed)
+		self._topic_ids = {}						# topic -> topic id
+		self._free_topic_ids = []					# ids of removed topics, reused by new topics
+		self._word_topics = []						# word id -> bitset of topic ids
+		self._topic_words = []						# topic id -> set of word ids
+		
+		# Occurrences of each word in each topic. Compact storage keeps them, and each topic's 
+		# words, in arrays indexed by the ids above instead
+		if storage == 'compact':
+			self._word_topic_count = CompactWordTopicCounts(self._words, self._word_ids, self._topic_names)
+			self._topic_words = None
+		else:
+			self._word_topic_count = defaultdict(dict)
+		
+		self._matrix = None
+		self._stale = True							# Whether the counts changed since they were last ranked
+		
+		# Results of recent queries, keyed by the query and its topics or words as a frozenset.
+		# Top-n results are kept with their n and also answer queries for fewer words
+		self._query_cache = OrderedDict() if query_cache_size else None	# key -> (n, result), least recently used first
+		self._query_cache_size = query_cache_size
+		self.query_cache_hits = 0
+		self.query_cache_misses = 0
+		self.add(topic_tagged_words)
+		self._update_rankings()
+	
+	def add(self, topic_tagged_words):
+		"""
+		Counts more topic-tagged words, e.g. from articles a reader fetched after
+		this analyzer was built. Words are filtered the same way as in the 
+		constructor. Example usage:
+		
+			>>> analyzer.add(reader.topic_tagged_words(fileids=new_fileids))
+		
+		:param topic_tagged_words: 	a list or generator of topic-tagged-words in the format 
+									of (word, topic)
+		"""
+		self._add_counts((word, topic, 1) for word, topic in self._token_filter.filter_tagged(topic_tagged_words))
+	
+	def add_topic_counts(self, topic_counts):
+		"""
+		Adds words already counted per article, e.g. by worker processes. Words 
+		are expected to have been filtered by this analyzer's token filter.
+		
+		:param topic_counts: topics paired with the (word, count) pairs of an article, 
+							 as returned by WikipediaCorpusReader.topic_word_counts()
+		:type topic_counts: iterable of tuples (str, list of (str, int))
+		"""
+		self._add_counts((word, topic, count) for topic, word_counts in topic_counts for word, count in word_counts)
+	
+	@classmethod
+	def from_corpus(cls, reader, fileids=None, sections=None, workers=None, backend='dict', token_filter=None, 
+					storage='dict'):
+		"""
+		Builds an analyzer over a corpus reader's articles, tokenizing, filtering and 
+		counting each article in one of several worker processes. Gives the same 
+		analyzer as WikipediaTopicAnalyzer(reader.topic_tagged_words(fileids, sections)).
+		Example usage:
+		
+			>>> analyzer = WikipediaTopicAnalyzer.from_corpus(reader, sections='Philanthropy', workers=4)
+		
+		:param reader: the corpus reader whose articles to count
+		:type reader: WikipediaCorpusReader
+		
+		:param fileids: single fileid or list of fileids
+		:type fileids: single str or list of str
+		
+		:param sections: single section or list of sections
+		:type sections: single str or list of str
+		
+		:param workers: number of processes counting articles (None or 1 counts them in this process)
+		:type workers: int
+		
+		:param backend: the backend of the new analyzer (see __init__)
+		:type backend: str
+		
+		:param token_filter: the token filter of the new analyzer (see __init__), applied by the workers
+		:type token_filter: TokenFilter
+		
+		:param storage: how the new analyzer keeps its counts (see __init__)
+		:type storage: str
+		
+		:rtype: WikipediaTopicAnalyzer
+		"""
+		analyzer = cls(backend=backend, token_filter=token_filter, storage=storage)
+		analyzer.add_topic_counts(reader.topic_word_counts(fileids, sections, workers=workers, 
+														   word_filter=analyzer._token_filter))
+		analyzer._update_rankings()
+		return analyzer
+	
+	@timed('analyze.add')
+	def _add_counts(self, counts):
+		"""
+		Adds counts of words that have already been filtered.
+		
+		:param counts: (word, topic, count) triples
+		:type counts: iterable of tuples (str, str, int)
+		"""
+		if self._storage == 'compact':
+			self._add_compact_counts(counts)
+			self._counts_changed()
+			return
+		word_topic_count = self._word_topic_count
+		word_ids = self._word_ids
+		topic_ids = self._topic_ids
+		
+		# Update dictionary of word -> dictionary of topic -> count for word
+		for word, topic, count in counts:
+			topic_counts = word_topic_count.get(word)
+			if topic_counts is None:
+				topic_counts = word_topic_count[word] = defaultdict(int)
+			word_id = word_ids.get(word)
+			if word_id is None:
+				word_id = word_ids[word] = len(self._words)
+				self._words.append(word)
+				self._word_topics.append(0)
 		
 			# Store a list of topics
-			if topic not in self._topics:
-				self._topics.append(topic)
+			topic_id = topic_ids.get(topic)
+			if topic_id is None:
+				topic_id = self._new_topic(topic)
+			
+			if topic not in topic_counts:						# First time the word is seen in this topic
+				self._word_topics[word_id] |= 1 << topic_id
+				self._topic_words[topic_id].add(word_id)
+			topic_counts[topic] += count
+		self._counts_changed()
+	
+	def _add_compact_counts(self, counts):
+		"""
+		Adds counts of words that have already been filtered to compact storage.
+		
+		:param counts: (word, topic, count) triples
+		:type counts: iterable of tuples (str, str, int)
+		"""
+		word_ids = self._word_ids
+		topic_ids = self._topic_ids
+		stage_limit = self._word_topic_count.STAGE_LIMIT
+		staged = {}										# (word id, topic id) -> count, handed over in bulk
+		for word, topic, count in counts:
+			word_id = word_ids.get(word)
+			if word_id is None:
+				word_id = word_ids[word] = len(self._words)
+				self._words.append(word)
+				self._word_topics.append(0)
+			topic_id = topic_ids.get(topic)
+			if topic_id is None:
+				topic_id = self._new_topic(topic)
+			key = (word_id, topic_id)
+			if key in staged:
+				staged[key] += count
+			else:
+				staged[key] = count
+				if len(staged) >= stage_limit:
+					self._flush_compact_counts(staged)
+					staged = {}
+		self._flush_compact_counts(staged)
+	
+	def _flush_compact_counts(self, staged):
+		"""
+		Hands staged counts to compact storage, marking each word's topics.
+		
+		:param staged: (word id, topic id) -> count
+		:type staged: dict of tuple (int, int) -> int
+		"""
+		word_topics = self._word_topics
+		for word_id, topic_id in staged:					# Once per pair rather than once per token
+			word_topics[word_id] |= 1 << topic_id
+		self._word_topic_count.add_counts(staged)
+	
+	def _counts_changed(self):
+		"""
+		Marks the rankings stale and forgets every cached query result.
+		"""
+		self._stale = True
+		if self._query_cache is not None:
+			self._query_cache.clear()
+	
+	def _new_topic(self, topic):
+		"""
+		Numbers a topic seen for the first time, reusing the id of a removed topic if there is one.
+		
+		:return: the topic's id
+		:rtype: int
+		"""
+		if self._free_topic_ids:
+			topic_id = self._free_topic_ids.pop()
+			self._topic_names[topic_id] = topic
+			if self._topic_words is not None:
+				self._topic_words[topic_id] = set()
+		else:
+			topic_id = len(self._topic_names)
+			self._topic_names.append(topic)
+			if self._topic_words is not None:
+				self._topic_words.append(set())
+		self._topic_ids[topic] = topic_id
+		self._topics.append(topic)
+		return topic_id
+	
+	def remove_topic(self, topic):
+		"""
+		Forgets every word counted for a topic. Words found in no other topic are
+		forgotten altogether.
+		
+		:param topic: the topic's title
+		:type topic: str
+		
+		:raise ValueError: If the topic has no words in this analyzer
+		"""
+		topic_id = self._topic_ids.pop(topic, None)
+		if topic_id is None:
+			raise ValueError('No such topic: %s' % topic)
+		
+		topic_bit = 1 << topic_id
+		if self._storage == 'compact':
+			for word_id in self._word_topic_count.remove_topic(topic_id):
+				self._word_topics[word_id] &= ~topic_bit
+		else:
+			for word_id in self._topic_words[topic_id]:
+				word = self._words[word_id]
+				topic_counts = self._word_topic_count[word]
+				del topic_counts[topic]
+				if not topic_counts:
+					del self._word_topic_count[word]
+				self._word_topics[word_id] &= ~topic_bit
+			self._topic_words[topic_id] = set()
+		
+		self._topic_names[topic_id] = None
+		self._free_topic_ids.append(topic_id)
+		self._topics.remove(topic)
+		self._counts_changed()
+	
+	def _count_entries(self):
+		"""
+		Returns every (word, topic, count) counted, words in the order they were first seen.
+		
+		:rtype: generator of tuples (str, str, int)
+		"""
+		for word in self._words:
+			topic_counts = self._word_topic_count.get(word)
+			if topic_counts is not None:						# None once every topic of the word was removed
+				for topic, count in topic_counts.iteritems():
+					yield word, topic, count
+	
+	def merge(self, other):
+		"""
+		Adds the counts of another analyzer to this one, e.g. to combine analyzers 
+		built separately over different sections of a corpus. Example usage:
+		
+			>>> analyzer = reduce(WikipediaTopicAnalyzer.merge, 
+			... 				  [WikipediaTopicAnalyzer.load(path) for path in snapshot_paths])
+		
+		:param other: the analyzer whose counts to add
+		:type other: WikipediaTopicAnalyzer
+		
+		:return: this analyzer
+		:rtype: WikipediaTopicAnalyzer
+		"""
+		self._add_counts(other._count_entries())
+		return self
+	
+	def save(self, path):
+		"""
+		Writes the analyzer's counts to a snapshot file that load() reads back
+		without the words having to be tokenized and counted again. The file 
+		holds a header, the topics and the vocabulary, one per line, followed by 
+		three arrays of unsigned integers: the number of topics each word appears 
+		in, and the topic index and count of each of those (word, topic) pairs.
+		
+		:param path: path of the snapshot file
+		:type path: str
+		"""
+		topic_indices = dict((topic, index) for index, topic in enumerate(self._topics))
+		words = []
+		topics_per_word, topic_index, counts = array('I'), array('I'), array('I')
+		for word in self._words:
+			topic_counts = self._word_topic_count.get(word)
+			if topic_counts is None:
+				continue
+			words.append(word)
+			topics_per_word.append(len(topic_counts))
+			for topic, count in topic_counts.iteritems():
+				topic_index.append(topic_indices[topic])
+				counts.append(count)
+		
+		snapshot_file = open(path, 'wb')
+		try:
+			snapshot_file.write('%s %d %s\n' % (self.SNAPSHOT_MAGIC, self.SNAPSHOT_VERSION, sys.byteorder))
+			snapshot_file.write('%d %d %d\n' % (len(self._topics), len(words), len(counts)))
+			for line in self._topics + words:
+				snapshot_file.write(line + '\n')
+			for integers in (topics_per_word, topic_index, counts):
+				integers.tofile(snapshot_file)
+		finally:
+			snapshot_file.close()
+	
+	@classmethod
+	def load(cls, path, backend='dict', token_filter=None, storage='dict'):
+		"""
+		Reads an analyzer from a snapshot file written by save().
+		
+		:param path: path of the snapshot file
+		:type path: str
+		
+		:param backend: the backend of the new analyzer (see __init__)
+		:type backend: str
+		
+		:param token_filter: the token filter the new analyzer applies to words added later (see __init__)
+		:type token_filter: TokenFilter
+		
+		:param storage: how the new analyzer keeps its counts (see __init__)
+		:type storage: str
+		
+		:return: an analyzer with the counts in the snapshot
+		:rtype: WikipediaTopicAnalyzer
+		
+		:raise ValueError: If the file is not a snapshot this version can read
+		"""
+		snapshot_file = open(path, 'rb')
+		try:
+			data = snapshot_file.read()
+		finally:
+			snapshot_file.close()
+		
+		header = data.split('\n', 2)
+		magic = header[0].split()
+		if len(header) < 3 or len(magic) != 3 or magic[0] != cls.SNAPSHOT_MAGIC or magic[1] != str(cls.SNAPSHOT_VERSION):
+			raise ValueError('Not a WikipediaTopicAnalyzer snapshot: %s' % path)
+		topic_total, word_total, entry_total = [int(total) for total in header[1].split()]
+		lines = header[2].split('\n', topic_total + word_total)
+		topics, words = lines[:topic_total], lines[topic_total:topic_total + word_total]
+		
+		integers = array('I')
+		if len(lines) != topic_total + word_total + 1 or \
+		   len(lines[-1]) != (word_total + 2 * entry_total) * integers.itemsize:
+			raise ValueError('Truncated WikipediaTopicAnalyzer snapshot: %s' % path)
+		integers.fromstring(lines[-1])
+		if magic[2] != sys.byteorder:							# Written on a machine of the other byte order
+			integers.byteswap()
+		topics_per_word = integers[:word_total]
+		topic_index = integers[word_total:word_total + entry_total]
+		counts = integers[word_total + entry_total:]
+		
+		def entries():
+			start = 0
+			for word, pairs in izip(words, topics_per_word):
+				for entry in xrange(start, start + pairs):
+					yield word, topics[topic_index[entry]], counts[entry]
+				start += pairs
+		
+		analyzer = cls(backend=backend, token_filter=token_filter, storage=storage)
+		analyzer._add_counts(entries())
+		analyzer._update_rankings()
+		return analyzer
+	
+	def _update_rankings(self):
+		"""
+		Re-ranks the counts for most_frequent_* queries if they changed since 
+		they were last ranked.
+		"""
+		if not self._stale:
+			return
+		started = time.time() if self._hooks else None
+		if self._backend == 'matrix':
+			self._matrix = WordTopicMatrix(self._word_topic_count, self._topics)
+		else:
+			self._rank_counts()
+		self._stale = False
+		if started is not None:
+			self._hooks.emit('analyze.rank', time.time() - started)
+	
+	def _topics_key(self, topics, single=False):
+		"""
+		Returns the part of a query cache key that stands for a query's topics (or 
+		words): None, a single topic, or the set of topics, since neither their order 
+		nor repeats change the result. With single set, a single topic is the same 
+		as a list of that topic.
+		"""
+		if topics is None or (isinstance(topics, basestring) and not single):
+			return topics
+		if isinstance(topics, basestring):
+			return frozenset([topics])
+		return frozenset(topics)
+	
+	def _cache_get(self, key, n=None):
+		"""
+		Returns a copy of a cached query result, or None if it isn't cached. A top-n 
+		result answers a query for fewer words, or for more once it holds fewer than 
+		its n, i.e. every word there is.
+		"""
+		entry = self._query_cache.pop(key, None)
+		if entry is not None:
+			self._query_cache[key] = entry							# Now the most recently used
+			cached_n, result = entry
+			if n is None or n <= cached_n or len(result) < cached_n:
+				self.query_cache_hits += 1
+				if self._hooks:
+					self._hooks.emit('query_cache.hit', detail=key[0])
+				return result[:n]
+		self.query_cache_misses += 1
+		if self._hooks:
+			self._hooks.emit('query_cache.miss', detail=key[0])
+		return None
+	
+	def _cache_put(self, key, result, n=None):
+		"""
+		Caches a query result, dropping the least recently used result if the cache
+		is full, and returns a copy of it for the caller.
+		"""
+		self._query_cache[key] = (n, result)
+		if len(self._query_cache) > self._query_cache_size:
+			self._query_cache.popitem(last=False)
+		return result[:n]
+	
+	def _cached_query(self, key, compute, n=None):
+		"""
+		Answers a query from the query cache if it can, otherwise with compute(), 
+		caching the result. Queries for a negative n (every word but the last few)
+		are never cached.
+		
+		:param key: the query's name and _topics_key() of its topics or words
+		:type key: tuple
+		
+		:param compute: answers the query from the counts
+		:type compute: function
+		
+		:param n: the number of words asked for, or None if the query isn't a top-n query
+		:type n: int
+		"""
+		if self._query_cache is None or (n is not None and n < 0):
+			return compute()
+		result = self._cache_get(key, n)
+		if result is None:
+			result = self._cache_put(key, compute(), n)
+		return result
+	
+	def query_cache_stats(self):
+		"""
+		Returns the query cache's hit and miss counts and how many results it holds.
+		
+		:rtype: dict of str -> int
+		"""
+		return {'hits': self.query_cache_hits, 'misses': self.query_cache_misses, 
+				'results': len(self._query_cache) if self._query_cache is not None else 0}
+	
+	def add_hook(self, hook):
+		"""
+		Attaches a callback told how long counting, ranking and each query take
+		from now on (see Hooks in wikipedia_instrumentation.py).
+		
+		:param hook: callable taking (stage, seconds, size, detail)
+		:type hook: callable
+		"""
+		self._hooks.add(hook)
+	
+	def remove_hook(self, hook):
+		"""
+		Detaches a callback attached with add_hook() or the hooks parameter.
+		
+		:raise ValueError: If the hook isn't attached
+		"""
+		self._hooks.remove(hook)
 
 	def topics(self):
 		"""
@@ -61,6 +580,123 @@ class WikipediaTopicAnalyzer(object):
 		"""
 		return self._topics
 	
+	def _rank_counts(self):
+		"""
+		Precomputes, in one pass over the counts, every word's total count, the
+		totals of the capitalized words counted as "terms", and each topic's words
+		ranked by their count in that topic. Lists keep the iteration order of
+		self._word_topic_count so words with equal counts rank in the same order 
+		as a full sort of every word would put them.
+		"""
+		if self._storage == 'compact':
+			self._word_totals, self._topic_rankings = self._word_topic_count.rank()
+			self._term_totals = [(word, total) for word, total in self._word_totals 
+								 if total > 2 and word[0] in string.uppercase]
+			return
+		self._word_totals = []								# (word, total count) for every word
+		self._term_totals = []								# (word, total count) for capitalized words counted more than twice
+		topic_rankings = defaultdict(list)					# topic -> (word, count) for the words in that topic
+		for word, topic_counts in self._word_topic_count.iteritems():
+			total = 0
+			for topic, count in topic_counts.iteritems():
+				total += count
+				topic_rankings[topic].append((word, count))
+			self._word_totals.append((word, total))
+			if total > 2 and word[0] in string.uppercase:
+				self._term_totals.append((word, total))
+		for ranking in topic_rankings.itervalues():
+			ranking.sort(key=itemgetter(1), reverse=True)	# Stable, so ties stay in iteration order
+		self._topic_rankings = dict(topic_rankings)
+	
+	def _top(self, n, counts):
+		"""
+		Returns the n (word, count) pairs with the highest counts, exactly as
+		sorted(counts, key=itemgetter(1), reverse=True)[:n] would, but selecting
+		them with a heap instead of sorting every pair.
+		"""
+		if n < 0:
+			return sorted(counts, key=itemgetter(1), reverse=True)[:n]
+		return heapq.nlargest(n, counts, key=itemgetter(1))
+	
+	def _topic_subset_counts(self, topics, terms=False):
+		"""
+		Returns (word, count) pairs counting only the occurrences in the given
+		topics, for every word (or for the capitalized words counted more than 
+		twice, if terms is set).
+		"""
+		if self._storage == 'compact':
+			counts = self._topic_subsets_counts([frozenset(topics)])[0]
+			if terms:
+				return [(word, count) for word, count in counts if count > 2 and word[0] in string.uppercase]
+			return counts
+		topics = set(topics)
+		counts = []
+		for word, topic_counts in self._word_topic_count.iteritems():
+			if terms and word[0] not in string.uppercase:
+				continue
+			occurrences = 0
+			for topic, count in topic_counts.iteritems():
+				if topic in topics:
+					occurrences += count
+			if not terms or occurrences > 2:
+				counts.append((word, occurrences))
+		return counts
+	
+	def _topic_subsets_counts(self, topic_sets):
+		"""
+		Returns, for each set of topics, the (word, count) pairs that 
+		_topic_subset_counts(topics) would. Every word is numbered once for all of
+		the sets, then each set's counts are summed from its topics' rankings, so 
+		only the words found in those topics are visited rather than every word 
+		once per set. The rankings must be up to date.
+		
+		:param topic_sets: sets of topics
+		:type topic_sets: list of frozenset of str
+		
+		:rtype: list of lists of (str, int)
+		"""
+		if self._storage == 'compact':
+			word_items = self._word_topic_count.word_items()
+			counts = []
+			for topics in topic_sets:
+				totals = [0] * len(self._words)						# Indexed by word id, no numbering needed
+				for topic in topics:
+					ranking = self._topic_rankings.get(topic)
+					if ranking is not None:
+						for word_id, count in izip(ranking.word_ids, ranking.counts):
+							totals[word_id] += count
+				counts.append([(word, totals[word_id]) for word, word_id in word_items])
+			return counts
+		words = list(self._word_topic_count)				# In the order _topic_subset_counts visits them
+		positions = dict(izip(words, xrange(len(words))))
+		counts = []
+		for topics in topic_sets:
+			totals = [0] * len(words)
+			for topic in topics:
+				for word, count in self._topic_rankings.get(topic, ()):
+					totals[positions[word]] += count
+			counts.append(zip(words, totals))
+		return counts
+	
+	def _most_frequent_words(self, n, topics):
+		"""
+		Answers most_frequent_words() without the query cache.
+		"""
+		self._update_rankings()
+		if self._matrix is not None:
+			return self._matrix.most_frequent(n, topics)
+		if topics is None:
+			return self._top(n, self._word_totals)
+		if isinstance(topics, basestring):
+			ranking = self._topic_rankings.get(topics, [])
+			if 0 <= n <= len(ranking):
+				return ranking[:n]
+			# Words that are not in the topic follow with a count of 0
+			return (ranking + [(word, 0) for word, topic_counts in self._word_topic_count.iteritems() 
+							   if topics not in topic_counts])[:n]
+		return self._top(n, self._topic_subset_counts(topics))
+	
+	@timed('query.most_frequent_words')
 	def most_frequent_words(self, n=10, topics=None):
 		"""
 		Returns the n most common words, i.e. those found in the most
@@ -75,34 +711,10 @@ class WikipediaTopicAnalyzer(object):
 		:return: list of the most frequent words in the given topics (or all if unspecified)
 		:rtype: list of (str, int) 
 		"""
-		if topics is None:
-			counts = []
-			for word in self._word_topic_count:									# For each word
-				occurrences = 0													# Set counter to 0
-				for topic in self._word_topic_count[word]:						# For each topic the word appears in
-					occurrences += self._word_topic_count[word][topic]			# Increment the counter by the # of 
-																				# 	times the word appears in the topic
-				counts.append((word,occurrences))								# Append a tuple of (word, count)
-		else:
-			counts = []
-			if isinstance(topics, basestring):
-				for word in self._word_topic_count:								# For each word
-					occurrences = 0												# Set counter to 0
-					for topic in self._word_topic_count[word]:					# For each topic the word appears in
-						if topic == topics:										# If the topic is the one given
-							occurrences += self._word_topic_count[word][topic]	# Increment the counter by the occurrences
-																				# 	of the word in that topic
-					counts.append((word,occurrences))							# Append a tuple of (word, count)
-			else:
-				for word in self._word_topic_count:								# For each word
-					occurrences = 0												# Set counter to 0
-					for topic in self._word_topic_count[word]:					# For each topic the word appears in
-						if topic in topics:										# If the topic is one of the given topics
-							occurrences += self._word_topic_count[word][topic]	# Increment the counter by the occurrences
-																				# 	of the word in that topic
-					counts.append((word,occurrences))							# Append a tuple of (word, count)
-		return sorted(counts, key=itemgetter(1), reverse=True)[:n]
+		topics = self._topics_key(topics)				# The query reads the key, so a generator is read once
+		return self._cached_query(('most_frequent_words', topics), lambda: self._most_frequent_words(n, topics), n)
 	
+	@timed('query.most_frequent_words_by_topic')
 	def most_frequent_words_by_topic(self, n=10, topics=None):
 		"""
 		Returns the n most common words in each topic.
@@ -121,11 +733,29 @@ class WikipediaTopicAnalyzer(object):
 		common_words_by_topic = {}
 		for topic in topics:
 			# Set the value at each topic to be the most frequent word,count pairs for that topic
-			print topic 
 			common_words_by_topic[topic] = self.most_frequent_words(n, topics=topic)
-			print common_words_by_topic[topic]
 		return common_words_by_topic
 	
+	def _most_frequent_terms(self, n, topics):
+		"""
+		Answers most_frequent_terms() without the query cache.
+		"""
+		self._update_rankings()
+		if self._matrix is not None:
+			return self._matrix.most_frequent(n, topics, terms=True)
+		if topics is None:
+			return self._top(n, self._term_totals)
+		if isinstance(topics, basestring):
+			terms = []
+			for word, count in self._topic_rankings.get(topics, []):
+				if count <= 2 or len(terms) == n:				# The ranking is sorted, so no more terms follow
+					break
+				if word[0] in string.uppercase:
+					terms.append((word, count))
+			return terms[:n]
+		return self._top(n, self._topic_subset_counts(topics, terms=True))
+	
+	@timed('query.most_frequent_terms')
 	def most_frequent_terms(self, n=10, topics=None):
 		"""
 		Returns the n most common "terms", i.e. capitalized words found in the most
@@ -140,42 +770,10 @@ class WikipediaTopicAnalyzer(object):
 		:return: a list of the most frequent "terms" from the specified topics (or all if unspecified)
 		:rtype: list of (str, int) 
 		"""
-		# Only look through capitalized words
-		capitalized_words = [word for word in self._word_topic_count if word[0] in string.uppercase]
-		
-		if topics is None:
-			counts = []
-			for word in capitalized_words:										# For each capitalized word
-				occurrences = 0													# Set counter to 0
-				for topic in self._word_topic_count[word]:						# For each topic the word appears in
-					occurrences += self._word_topic_count[word][topic]			# Increment the counter by the # of 
-																				# 	times the word appears in the topic
-				if occurrences > 2:
-					counts.append((word,occurrences))							# Append a tuple of (word, count)
-		else:
-			counts = []
-			if isinstance(topics, basestring):
-				for word in capitalized_words:									# For each capitalized word
-					occurrences = 0												# Set counter to 0
-					for topic in self._word_topic_count[word]:					# For each topic the word appears in
-						if topic == topics:										# If the topic is the one given
-							occurrences += self._word_topic_count[word][topic]	# Increment the counter by the occurrences
-																				# 	of the word in that topic
-					if occurrences > 2:
-						counts.append((word,occurrences))						# Append a tuple of (word, count)
-			
-			else:
-				for word in capitalized_words:									# For each word
-					occurrences = 0												# Set counter to 0
-					for topic in self._word_topic_count[word]:					# For each topic the word appears in
-						if topic in topics:										# If the topic is one of the given topics
-							occurrences += self._word_topic_count[word][topic]	# Increment the counter by the occurrences
-																				# 	of the word in that topic
-					if occurrences > 2:
-						counts.append((word,occurrences))						# Append a tuple of (word, count)
-				
-		return sorted(counts, key=itemgetter(1), reverse=True)[:n]
+		topics = self._topics_key(topics)
+		return self._cached_query(('most_frequent_terms', topics), lambda: self._most_frequent_terms(n, topics), n)
 		
+	@timed('query.most_frequent_terms_by_topic')
 	def most_frequent_terms_by_topic(self, n=10, topics=None):
 		"""
 		Returns the n most common "terms", i.e. capitalized words found in the most
@@ -198,6 +796,38 @@ class WikipediaTopicAnalyzer(object):
 			frequent_terms[topic] = self.most_frequent_terms(n=n,topics=topic)
 		return frequent_terms
 	
+	def _topics_in_bitset(self, bitset):
+		"""
+		Returns the topics whose bits are set in a bitset of topic ids.
+		
+		:rtype: list of str
+		"""
+		topics = []
+		while bitset:
+			lowest_bit = bitset & -bitset
+			topics.append(self._topic_names[lowest_bit.bit_length() - 1])
+			bitset ^= lowest_bit
+		return topics
+	
+	def _topics_containing_words(self, words):
+		"""
+		Answers topics_containing_words() without the query cache.
+		"""
+		if isinstance(words, basestring):
+			words = [words]
+		if not words:
+			return []
+		topics = -1												# Every bit set: no word has narrowed it down yet
+		for word in set(words):
+			word_id = self._word_ids.get(word)
+			if word_id is None:									# A word found nowhere rules out every topic
+				return []
+			topics &= self._word_topics[word_id]
+			if not topics:
+				return []
+		return sorted(self._topics_in_bitset(topics))
+	
+	@timed('query.topics_containing_words')
 	def topics_containing_words(self, words):
 		"""
 		Returns the topics in which every word specified is found
@@ -208,19 +838,33 @@ class WikipediaTopicAnalyzer(object):
 		:return: list of topics in which every word specified appears
 		:rtype: list of str
 		"""
-		topics = []
-		if isinstance(words, basestring):
-			if words in self._word_topic_count:
-				topics.extend(self._word_topic_count[words].keys())
-		else:
-			for word in words:
-				if word in self._word_topic_count:
-					topics.extend(self._word_topic_count[word].keys())
-			topics = [topic for topic in topics if topics.count(topic) >= len(words)]
-			
-		return sorted(set(topics))
-
+		words = self._topics_key(words, single=True)
+		return self._cached_query(('topics_containing_words', words), lambda: self._topics_containing_words(words))
+	
+	def _common_words_between_topics(self, topics):
+		"""
+		Answers common_words_between_topics() without the query cache.
+		"""
+		if topics is None:
+			topics = self._topics
+		elif isinstance(topics, basestring):
+			topics = [topics]
+		
+		postings = []
+		for topic in set(topics):
+			topic_id = self._topic_ids.get(topic)
+			if topic_id is None:								# No word is found in a topic that isn't there
+				return []
+			postings.append(self._topic_words[topic_id] if self._topic_words is not None 
+							else self._word_topic_count.topic_word_ids(topic_id))
+		if not postings:
+			return sorted(self._word_topic_count)
 		
+		postings.sort(key=len)									# Intersect starting from the smallest posting set
+		common_word_ids = set(postings[0]).intersection(*postings[1:])
+		return sorted(self._words[word_id] for word_id in common_word_ids)
+	
+	@timed('query.common_words_between_topics')
 	def common_words_between_topics(self, topics=None):
 		"""
 		Returns words that are found in all given topics
@@ -231,15 +875,70 @@ class WikipediaTopicAnalyzer(object):
 		:return: list of words that are found in every topic (or all if unspecified)
 		:rtype: list of str 
 		"""
-		common_words = []
-		if topics is None:
-			topics = self._topics
+		topics = self._topics_key(topics, single=True)
+		return self._cached_query(('common_words_between_topics', topics), lambda: self._common_words_between_topics(topics))
+	
+	@timed('query.batch')
+	def query_batch(self, queries):
+		"""
+		Answers many queries at once, e.g. everything a report shows for several 
+		groups of topics. The most_frequent_words and most_frequent_terms queries 
+		over lists of topics would each scan every word's counts; here the words are 
+		numbered once and each group of topics only visits the words in its topics, 
+		however many queries are made about it. The other queries are answered from 
+		the rankings and postings as usual. Example usage:
 		
-		for word in self._word_topic_count:
-
-			if set(topics).issubset(set(self._word_topic_count[word])):
-				common_words.append(word)
-		return sorted(common_words)
+			>>> words, terms, common = analyzer.query_batch([('most_frequent_words', ['Gmail', 'YouTube'], 20),
+			... 											 ('most_frequent_terms', ['Gmail', 'YouTube']),
+			... 											 ('common_words_between_topics', ['Gmail', 'YouTube'])])
+		
+		:param queries: (query, topics, n) tuples, query being the name of one of the BATCH_QUERIES
+						methods, topics its topics (the words, for topics_containing_words) and n, 
+						which can be left out and defaults to 10, the number of words or terms
+		:type queries: list of tuples (str, list of str, int)
+		
+		:return: the result of each query, in the order given, as the query's method returns it
+		:rtype: list
+		
+		:raise ValueError: If a query is not one of BATCH_QUERIES
+		"""
+		self._update_rankings()
+		results = [None] * len(queries)
+		subset_queries = defaultdict(list)						# topic set -> (index, n, terms) of its queries
+		for index, query in enumerate(queries):
+			name, argument = query[0], query[1]
+			n = query[2] if len(query) > 2 else 10
+			if name not in self.BATCH_QUERIES:
+				raise ValueError('Unknown query %r, expected one of %s' % (name, ', '.join(self.BATCH_QUERIES)))
+			if name in ('most_frequent_words', 'most_frequent_terms') and self._matrix is None and \
+			   argument is not None and not isinstance(argument, basestring):
+				topics = frozenset(argument)					# Once, as argument may be a generator
+				cacheable = self._query_cache is not None and n >= 0
+				results[index] = self._cache_get((name, topics), n) if cacheable else None
+				if results[index] is None:
+					subset_queries[topics].append((index, n, name == 'most_frequent_terms'))
+			elif name in ('topics_containing_words', 'common_words_between_topics'):
+				results[index] = getattr(self, name)(argument)
+			else:
+				results[index] = getattr(self, name)(n, argument)
+		
+		topic_sets = list(subset_queries)
+		if not topic_sets:										# Every one was answered from the cache
+			return results
+		for topics, counts in izip(topic_sets, self._topic_subsets_counts(topic_sets)):
+			term_counts = None
+			for index, n, terms in subset_queries[topics]:
+				if terms:
+					if term_counts is None:
+						term_counts = [(word, count) for word, count in counts 
+									   if count > 2 and word[0] in string.uppercase]
+					results[index] = self._top(n, term_counts)
+				else:
+					results[index] = self._top(n, counts)
+				if self._query_cache is not None and n >= 0:
+					key = ('most_frequent_terms' if terms else 'most_frequent_words', topics)
+					results[index] = self._cache_put(key, results[index], n)
+		return results
 
 if __name__ == '__main__':
 	print "Try running main.py instead"	
\ No newline at end of file